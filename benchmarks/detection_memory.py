@@ -0,0 +1,92 @@
+"""
+Measures the memory taken by the detection tables with and without the typed schema of the detection files.
+
+Run from the repository root:
+    python -m benchmarks.detection_memory [folder]
+
+Every detection file of the folder (default: the `data` directory of the config) is loaded and kept in memory, as
+`read_csv_files` does, once with the default pandas types (int64 and float64, `Unique Id` as float64) and once with
+DETECTION_DTYPES. Each load runs in its own process, so its peak RSS is measured on its own; the peak of a process
+that only imports the modules is reported as the baseline. The bytes per row of the loaded tables and the time to
+count the unique tracks of every class are reported too.
+"""
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import pandas as pd
+import common
+from utils.analysis import Analysis_class, CSV_ENGINE, DETECTION_EXTENSIONS
+
+# Consts
+MODES = ("baseline", "legacy", "typed")
+TARGET_YOLO_IDS = [0, 1, 2, 3, 5, 7, 9]
+
+
+def load(folder, mode):
+    """
+    Loads every detection file of the folder and returns the tables, keyed by file name.
+    """
+    tables = {}
+    for file in sorted(os.listdir(folder)):
+        path = os.path.join(folder, file)
+        if mode == "typed" and file.endswith(DETECTION_EXTENSIONS):
+            tables[file] = Analysis_class.read_detections(path)
+        elif mode == "legacy" and file.endswith(".csv"):
+            tables[file] = pd.read_csv(path, engine=CSV_ENGINE)
+        elif mode == "legacy" and file.endswith(".parquet"):
+            tables[file] = pd.read_parquet(path).astype({"Unique Id": "float64"})
+    return tables
+
+
+def measure(folder, mode):
+    """
+    Loads the folder in the given mode and prints the measurements as JSON.
+    """
+    analysis = Analysis_class()
+    start = time.perf_counter()
+    tables = load(folder, mode) if mode != "baseline" else {}
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for df in tables.values():
+        analysis.count_objects(df, TARGET_YOLO_IDS)
+    count_time = time.perf_counter() - start
+    print(json.dumps({
+        "rows": sum(len(df) for df in tables.values()),
+        "bytes": int(sum(df.memory_usage(deep=True).sum() for df in tables.values())),
+        "load_time": load_time,
+        "count_time": count_time,
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,  # ru_maxrss is in KB on Linux
+    }))
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--mode":
+        measure(sys.argv[3], sys.argv[2])
+        return
+    folder = sys.argv[1] if len(sys.argv) > 1 else common.get_configs("data")
+    if not os.path.isdir(folder):
+        sys.exit(__doc__)
+
+    results = {}
+    for mode in MODES:
+        output = subprocess.run([sys.executable, "-m", "benchmarks.detection_memory", "--mode", mode, folder],
+                                capture_output=True, text=True, check=True).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    baseline = results["baseline"]["peak_rss"]
+    print(f"{results['typed']['rows']} detections in {folder}")
+    print(f"{'':8} {'bytes/row':>10} {'peak RSS':>12} {'load':>9} {'count':>9}")
+    for mode in ("legacy", "typed"):
+        result = results[mode]
+        print(f"{mode:8} {result['bytes'] / max(result['rows'], 1):10.1f} "
+              f"{(result['peak_rss'] - baseline) / 2 ** 20:9.1f} MB {result['load_time']:8.3f}s "
+              f"{result['count_time']:8.3f}s")
+    print(f"memory:  {results['typed']['bytes'] / max(results['legacy']['bytes'], 1):.1%} of the legacy tables")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Measures the per-frame cost of the rendering work tracking_mode used to do on every frame.
+
+Run from the repository root:
+    python -m benchmarks.headless_tracking <video> [frames]
+
+The same frames are tracked twice. The headless pass only runs inference and tracking. The rendering pass also does
+what every frame used to pay for: plotting the annotated frame, drawing the track lines, JPEG encoding the plot (the
+`image0.jpg` ultralytics wrote with `save=True`) and polling the GUI with `cv2.waitKey`.
+"""
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import sys
+import time
+from collections import defaultdict
+import cv2
+import numpy as np
+import common
+from utils.tracker_session import Tracker_session
+from utils.yolo_detection import YOLO_detection, LINE_TICKNESS
+
+# Consts
+DEFAULT_FRAMES = 100
+
+
+def read_frames(video_path, max_frames):
+    """
+    Decodes up to `max_frames` frames of a video into memory, so decoding is not part of the measurement.
+    """
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < max_frames:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def render(result, track_history):
+    """
+    Repeats the rendering done per frame before the headless mode: plot, track lines, JPEG encoding, GUI polling.
+    """
+    annotated_frame = result.plot()
+    if result.boxes.id is not None:
+        for box, track_id in zip(result.boxes.xywh.cpu(), result.boxes.id.int().cpu().tolist()):
+            x, y, w, h = box
+            track = track_history[track_id]
+            track.append((float(x), float(y)))
+            if len(track) > 30:
+                track.pop(0)
+            points = np.hstack(track).astype(np.int32).reshape((-1, 1, 2))
+            cv2.polylines(annotated_frame, [points], isClosed=False, color=(230, 230, 230),
+                          thickness=LINE_TICKNESS*5)
+    cv2.imencode(".jpg", annotated_frame)
+    cv2.waitKey(1)
+
+
+def run(model, frames, rendering):
+    """
+    Tracks the frames and returns the mean time per frame in milliseconds.
+    """
+    session = Tracker_session()
+    track_history = defaultdict(lambda: [])
+    start = time.perf_counter()
+    for frame in frames:
+        result = session.update(model.predict(frame, conf=common.get_configs("confidence"), verbose=False)[0])
+        if rendering:
+            render(result, track_history)
+    return (time.perf_counter() - start) * 1000 / len(frames)
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    frames = read_frames(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_FRAMES)
+    if not frames:
+        sys.exit(f"Could not read frames from {sys.argv[1]}.")
+    model = YOLO_detection().get_model()
+
+    headless = run(model, frames, rendering=False)
+    rendering = run(model, frames, rendering=True)
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+    print(f"headless:  {headless:8.2f} ms/frame")
+    print(f"rendering: {rendering:8.2f} ms/frame")
+    print(f"saved:     {rendering - headless:8.2f} ms/frame ({(rendering - headless) / rendering:.1%})")
+
+
+if __name__ == "__main__":
+    main()
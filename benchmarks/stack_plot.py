@@ -0,0 +1,137 @@
+"""
+Measures the time to build and export the stacked bar graph of `Plots.stack_plot` for growing numbers of cities.
+
+Run from the repository root:
+    python -m benchmarks.stack_plot [--legacy-all] [cities ...]
+
+For every number of cities (default: 100, 500 and 2000) synthetic counts and mapping rows are generated, and the
+figure is built twice: with one bar trace per class and column (`Plots.stack_figure`) and as it was built before,
+with one subplot row per pair of cities, one trace per city and class and one annotation per city. The number of
+traces, the build time, the size of the figure JSON and the time to write it as HTML are reported, and the time to
+export it as PNG when kaleido is installed. Building the old layout takes time quadratic in the number of cities
+(every trace added is validated against the ones already there), so above LEGACY_LIMIT cities it is only built with
+`--legacy-all`, and never exported to PNG, where kaleido takes minutes or hangs.
+"""
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from utils.figures import Plots, bar_colours
+from utils.mapping_index import MappingIndex
+
+# Consts
+DEFAULT_CITIES = [100, 500, 2000]
+KEYS_OF_INTEREST = ["Persons", "Cars", "Cycles", "Motorbikes", "Buses", "Trucks", "Traffic lights"]
+ISO_CODES = ["NLD", "DEU", "FRA", "IND", "BRA", "NGA", "JPN", "USA", "PER", "GHA"]
+CONTINENTS = ["Africa", "Asia", "Europe", "North America", "South America"]
+LEGACY_LIMIT = 500
+SEED = 0
+
+try:
+    import kaleido  # noqa: F401
+except ImportError:  # without kaleido only the HTML export is measured
+    kaleido = None
+
+
+def synthetic_cities(n_cities):
+    """
+    Returns random counts of every city and a mapping table with their countries and continents.
+    """
+    rng = np.random.default_rng(SEED)
+    cities = [f"City {i:04d}" for i in range(n_cities)]
+    counts = rng.integers(0, 60, size=(n_cities, len(KEYS_OF_INTEREST)))
+    continents = rng.choice(CONTINENTS, size=n_cities)
+    final_dict = {city: {**dict(zip(KEYS_OF_INTEREST, row.tolist())), "continent": continent}
+                  for city, row, continent in zip(cities, counts, continents)}
+    df_mapping = pd.DataFrame({
+        "City": cities,
+        "Country": [f"Country {i % len(ISO_CODES)}" for i in range(n_cities)],
+        "ISO": [ISO_CODES[i % len(ISO_CODES)] for i in range(n_cities)],
+        "Continent": continents,
+    })
+    return final_dict, MappingIndex(df_mapping)
+
+
+def legacy_figure(final_dict, cities_ordered):
+    """
+    Builds the figure as it was built before, with a subplot row per pair of cities and a trace per city and class.
+    The shapes, legend and styling shared with the current figure are left out.
+    """
+    num_cities_per_col = len(cities_ordered) // 2 + len(cities_ordered) % 2
+    fig = make_subplots(rows=num_cities_per_col, cols=2, vertical_spacing=0.0005, horizontal_spacing=0.01,
+                        row_heights=[1.0] * num_cities_per_col)
+    for col, cities in ((1, cities_ordered[:num_cities_per_col]), (2, cities_ordered[num_cities_per_col:])):
+        for i, city in enumerate(cities):
+            total_value = sum(final_dict[city].get(k, 0) for k in KEYS_OF_INTEREST)
+            y_label = f"{city} {int(total_value)}"
+            cumulative = 0
+            for k, key in enumerate(KEYS_OF_INTEREST):
+                value = final_dict[city].get(key, 0)
+                if value > 0:
+                    fig.add_trace(go.Bar(x=[value], y=[y_label], orientation='h', name=key.title(),
+                                         marker=dict(color=bar_colours[k]), text=[f"{int(value)}"],
+                                         textposition='inside', showlegend=(i == 0),
+                                         textfont=dict(size=14, color='white')), row=i + 1, col=col)
+                    cumulative += value
+            fig.add_annotation(x=cumulative + 0.5, y=y_label, text=y_label, showarrow=False,
+                               font=dict(size=14, color="black"), xanchor="left", yanchor="middle", row=i + 1,
+                               col=col)
+    max_value = max(sum(final_dict[city].get(k, 0) for k in KEYS_OF_INTEREST) for city in cities_ordered) + 15
+    for i in range(1, num_cities_per_col * 2 + 1):
+        for col in (1, 2):
+            fig.update_xaxes(range=[0, max_value], row=i, col=col, showticklabels=(i == 1),
+                             side='top' if i % 2 == 1 else 'bottom', showgrid=False)
+    fig.update_layout(barmode='stack', height=num_cities_per_col * 30, width=2480, showlegend=False, bargap=0)
+    return fig
+
+
+def export(fig, folder, name, height, image):
+    """
+    Writes a figure as HTML and, if `image` is set, as PNG. Returns the JSON size and the two times (None if the
+    PNG was not written).
+    """
+    json_size = len(fig.to_json())
+    start = time.perf_counter()
+    fig.write_html(os.path.join(folder, name + ".html"))
+    html_time = time.perf_counter() - start
+    image_time = None
+    if image:
+        start = time.perf_counter()
+        fig.write_image(os.path.join(folder, name + ".png"), width=1800, height=height)
+        image_time = time.perf_counter() - start
+    return json_size, html_time, image_time
+
+
+def main():
+    legacy_all = "--legacy-all" in sys.argv[1:]
+    sizes = [int(arg) for arg in sys.argv[1:] if arg != "--legacy-all"] or DEFAULT_CITIES
+    plots = Plots()
+    print(f"{'cities':>6} {'layout':8} {'traces':>7} {'build':>9} {'json':>9} {'html':>9} {'png':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        for n_cities in sizes:
+            final_dict, mapping_index = synthetic_cities(n_cities)
+            start = time.perf_counter()
+            fig, height = plots.stack_figure(final_dict, mapping_index, "alphabetical", "")
+            build_time = time.perf_counter() - start
+            rows = [("traces", fig, build_time, export(fig, folder, "traces", height, kaleido is not None))]
+
+            if n_cities <= LEGACY_LIMIT or legacy_all:
+                start = time.perf_counter()
+                fig = legacy_figure(final_dict, sorted(final_dict))
+                build_time = time.perf_counter() - start
+                image = kaleido is not None and n_cities <= LEGACY_LIMIT
+                rows.append(("legacy", fig, build_time, export(fig, folder, "legacy", height, image)))
+
+            for layout, fig, build_time, (json_size, html_time, image_time) in rows:
+                image = f"{image_time:8.2f}s" if image_time is not None else f"{'-':>9}"
+                print(f"{n_cities:6d} {layout:8} {len(fig.data):7d} {build_time:8.2f}s {json_size / 2 ** 20:6.1f} MB "
+                      f"{html_time:8.2f}s {image}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,8 @@ import os
 import json
 import pickle
 import sys
-import pycountry
 from custom_logger import CustomLogger
+from utils import countries
 import subprocess
 
 root_dir = os.path.dirname(__file__)
@@ -160,87 +160,22 @@ def correct_country(country):
     """
     Corrects common country name variations for compatibility with pycountry.countries.get(name=...).
     """
-    corrections = {
-        'Russia': 'Russian Federation',
-        'Syria': 'Syrian Arab Republic',
-        'South Korea': 'Korea, Republic of',
-        'North Korea': "Korea, Democratic People's Republic of",
-        'Korea': 'Korea, Republic of',
-        'Iran': 'Iran, Islamic Republic of',
-        'Vietnam': 'Viet Nam',
-        'Venezuela': 'Venezuela, Bolivarian Republic of',
-        'Bolivia': 'Bolivia, Plurinational State of',
-        'Moldova': 'Moldova, Republic of',
-        'Laos': "Lao People's Democratic Republic",
-        'Brunei': 'Brunei Darussalam',
-        'Czech Republic': 'Czechia',
-        'Ivory Coast': "Côte d'Ivoire",
-        'Cape Verde': 'Cabo Verde',
-        'Swaziland': 'Eswatini',
-        'Macau': 'Macao',
-        'Taiwan': 'Taiwan, Province of China',
-        'Tanzania': 'Tanzania, United Republic of',
-        # 'United States': 'United States of America',
-        'UK': 'United Kingdom',
-        'Palestine': 'Palestine, State of',
-        'Micronesia': 'Micronesia, Federated States of',
-        'Bahamas': 'Bahamas, The',
-        # 'Gambia': 'Gambia, The',
-        'São Tomé and Príncipe': 'Sao Tome and Principe',
-        'Turkiye': 'Turkey',
-        'Türkiye': 'Turkey',
-        'Congo (Democratic Republic)': 'Congo, The Democratic Republic of the',
-        'Congo (Congo-Brazzaville)': 'Congo',
-        'Burma': 'Myanmar',
-        'East Timor': 'Timor-Leste',
-        'Saint Kitts': 'Saint Kitts and Nevis',
-        'Saint Vincent': 'Saint Vincent and the Grenadines',
-        'Saint Lucia': 'Saint Lucia',
-        'Antigua': 'Antigua and Barbuda',
-        'Trinidad': 'Trinidad and Tobago',
-        'Slovak Republic': 'Slovakia',
-        'Vatican': 'Holy See',
-    }
-
-    return corrections.get(country, country)
+    return countries.correct_country(country)
 
 
 # Fetch ISO-3 country data
 def get_iso3_country_code(country_name):
-    if country_name == 'Kosovo':
-        return 'XKX'
-    try:
-        country = pycountry.countries.get(name=country_name)
-        print(country_name)
-        if country:
-            return country.alpha_3  # ISO-3 code
-        else:
-            return "Country not found"
-    except KeyError:
-        return "Country not found"
+    return countries.country_to_iso3(country_name) or "Country not found"
 
 
 # Convert ISO-3 to country name
 def iso3_to_country_name(iso3):
-    try:
-        country = pycountry.countries.get(alpha_3=iso3.upper())
-        return country.name if country else None
-    except KeyError:
-        return None
+    return countries.iso3_to_name(iso3)
 
 
 # Fetch ISO-2 country data
 def get_iso2_country_code(country_name):
-    if country_name == 'Kosovo':
-        return 'XK'
-    try:
-        country = pycountry.countries.get(name=country_name)
-        if country:
-            return country.alpha_2  # ISO-2 code
-        else:
-            return "Country not found"
-    except KeyError:
-        return "Country not found"
+    return countries.country_to_iso2(country_name) or "Country not found"
 
 
 # Pull changes from repository
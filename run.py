@@ -1,22 +1,26 @@
 import common
 from custom_logger import CustomLogger
 from logmod import logs
-from utils.yolo_detection import YOLO_detection
+from utils.orchestrator import Video_orchestrator
 from utils.information import Video_info
 from utils.analysis import Analysis_class
 from utils.figures import Plots
 from utils.frames_extractor import VideoFrameExtractor
+from utils.summary_cache import Summary_cache
+from utils.mapping_index import MappingIndex
+from utils.timeseries import Detection_timeseries, TIMESERIES_DIR
+from utils.sound import SOUND_DIR
 import shutil
 import os
 import pandas as pd
 import math
+import numpy as np
 
 # Initialise logging with config-specified level and color output.
 logs(show_level=common.get_configs("logger_level"), show_color=True)
 logger = CustomLogger(__name__)  # Custom logger for standardised log messages
 
 # Instantiate main processing classes for detection, info analysis, and general analysis.
-detection = YOLO_detection()             # For YOLO object detection on videos
 video_info = Video_info()                # For gathering video information/statistics
 analysis = Analysis_class()              # For CSV reading and analytical calculations
 plots = Plots()                          # For plotting
@@ -25,12 +29,20 @@ frame_extractor = VideoFrameExtractor()  # For frame extraction
 # Load file paths and operational flags from the central config.
 video_folder = common.get_configs("videos")             # Directory containing videos to process
 data_path = common.get_configs("data")                  # Directory to store per-video CSV detection results
-delete_runs_files = common.get_configs("delete_runs_files")  # Flag: delete YOLO 'runs' output after processing
 mapping_file = common.get_configs("mapping")            # Path to the main city/country mapping CSV
 
+orchestrator = Video_orchestrator(video_folder, data_path)  # For running YOLO detection over the videos
+
+# Per-file summaries (object counts, track statistics, time series, loudness) are cached in '_cache', so only new
+# or changed files are read again
+summary_cache = Summary_cache() if common.get_configs("summary_cache") else None
+
 # Read the main city/country mapping CSV (could include other columns like continent, region, etc.)
 df_mapping = pd.read_csv(mapping_file)
 
+# Index of the mapping by normalised city name, built once and used for every lookup below
+mapping_index = MappingIndex(df_mapping)
+
 # --- Run YOLO detection on input videos (if always_analyse flag is set) ---
 if common.get_configs("always_analyse"):
     logger.info(f"Running YOLO on the videos present in the {video_folder}")
@@ -42,46 +54,13 @@ if common.get_configs("always_analyse"):
 
     # Only proceed if a videos directory is specified and tracking_mode is enabled in configs
     if video_folder and common.get_configs("tracking_mode"):
-        for filename in os.listdir(video_folder):   # Iterate through all files in the videos directory
-            # Skip hidden files and any files that don't look like common video file types
-            if filename.startswith('.') or not filename.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
-                continue
-
-            full_path = os.path.join(video_folder, filename)  # Get full file path
-
-            # Confirm it's a regular file (not a directory)
-            if os.path.isfile(full_path):
-                filename = os.path.basename(full_path)         # Just the filename part
-                name_without_ext = os.path.splitext(filename)[0]   # Remove file extension
-
-                # If a processed CSV already exists for this video, skip it (no need to re-run)
-                if os.path.exists(os.path.join(data_path, f"{name_without_ext}.csv")):
-                    logger.info(f"Processed video file already present for {name_without_ext}")
-                    continue
-
-                # Set the video title for downstream YOLO functions (used for labeling outputs)
-                detection.set_video_title(name_without_ext)
-                # Run YOLO in tracking mode (processes video, produces a CSV in 'runs/detect/')
-                detection.tracking_mode(full_path, video_fps=25)
-
-                # Move the newly created CSV from YOLO's default output directory to the target data directory
-                new_file_path = os.path.join("runs", "detect", f"{name_without_ext}.csv")
-                os.makedirs(data_path, exist_ok=True)   # Ensure data directory exists
-                shutil.move(new_file_path, data_path)   # Move the CSV file to data_path
-
-                # If enabled, clean up YOLO's output directory after each video is processed
-                if delete_runs_files:
-                    shutil.rmtree(os.path.join("runs", "detect"))
-
-# --- Read all processed CSV files for analysis ---
-
-# Use the analysis helper to read all CSV files from data_path into a dict of DataFrames.
-# Key: video/country/city name; Value: DataFrame with detection results
-dfs = analysis.read_csv_files(data_path)
+        # Process every video without a CSV in data_path, in parallel worker processes if configured.
+        # Each task runs in its own scratch directory under 'runs/detect' and its CSV is moved to data_path.
+        orchestrator.run()
 
 # --- Log various high-level video statistics ---
 # Each of these methods outputs summary stats (could be total videos, city-by-continent stats, etc.)
-sounds = video_info.analyse_video_files(video_folder)  # Summarise input video set
+sounds = video_info.analyse_video_files(video_folder, cache=summary_cache)  # Summarise input video set
 video_info.count_cities_by_continent(df_mapping)  # Count how many cities are per continent
 video_info.video_processing_time_stats(df_mapping)  # Analyse/Log processing times
 
@@ -100,9 +79,57 @@ yolo_id_to_object = {
     9: "Traffic lights"
 }
 
+# --- Count the objects in all processed detection files ---
+
+# Each file is read with only the columns needed and reduced to its summary straight away; unchanged files are
+# served from the summary cache.
+# Key: video/country/city name; Value: dict of unique-track counts keyed by YOLO class ID
+counts = analysis.count_objects_in_folder(data_path, target_yolo_ids, cache=summary_cache)
+
+# --- Compare counts at the configured frame stride against a full-rate run (if a reference is configured) ---
+stride_reference_data = common.get_configs("stride_reference_data")  # Directory with CSVs of a full-rate run
+if stride_reference_data:
+    stride_details, stride_summary = analysis.stride_report(analysis.count_objects_in_folder(stride_reference_data,
+                                                                                             target_yolo_ids,
+                                                                                             cache=summary_cache),
+                                                            counts,
+                                                            {k: v for k, v in yolo_id_to_object.items()
+                                                             if k in target_yolo_ids})
+    os.makedirs(common.output_dir, exist_ok=True)
+    stride_details.to_csv(os.path.join(common.output_dir, "stride_report_videos.csv"), index=False)
+    stride_summary.to_csv(os.path.join(common.output_dir, "stride_report.csv"), index=False)
+    for _, row in stride_summary.iterrows():
+        logger.info(f"{row['Object']}: {row['Strided count']} at stride vs {row['Full count']} at full rate "
+                    f"({row['Videos changed']} videos changed).")
+
+# --- Windowed time series of the detections (active tracks per second, new tracks per minute, peak concurrency) ---
+if common.get_configs("timeseries"):
+    # Frame rate and length of every video, to place the detections in time
+    video_timings = {}
+    if video_folder and os.path.isdir(video_folder):
+        for filename in sorted(os.listdir(video_folder)):
+            name = os.path.splitext(filename)[0]
+            if video_timings.get(name) is None:
+                video_timings[name] = analysis.video_timing(os.path.join(video_folder, filename))
+
+    # Every detection file holds the video of one city, so its series are the series of the city
+    timeseries_summaries = []
+    # Series of unchanged files are served from the summary cache
+    for city_country, series in analysis.timeseries_folder(data_path, target_yolo_ids, video_timings,
+                                                           cache=summary_cache).items():
+        Detection_timeseries.save(series, os.path.join(TIMESERIES_DIR, f"{city_country}.npz"))
+        summary = Detection_timeseries.summarise(series)
+        summary.insert(0, "Object", summary["YOLO_id"].map(yolo_id_to_object))
+        summary.insert(0, "City_Country", city_country)
+        timeseries_summaries.append(summary)
+    if timeseries_summaries:
+        pd.concat(timeseries_summaries, ignore_index=True).to_csv(os.path.join(common.output_dir, "timeseries.csv"),
+                                                                  index=False)
+        logger.info(f"Wrote the time series of {len(timeseries_summaries)} videos to {TIMESERIES_DIR}.")
+
 # For each country (or video/city), count the appearances of each object of interest.
 result = {}   # Will hold final counts for each city/video
-for city_country, df in dfs.items():
+for city_country, video_counts in counts.items():
     parts = city_country.split("_")
     city = "_".join(parts[:-1])
     country = parts[-1]
@@ -111,26 +138,18 @@ for city_country, df in dfs.items():
         # Get the human-readable object name, fallback to just the ID if not mapped
         object_name = yolo_id_to_object.get(yolo_id, str(yolo_id))
 
-        # Use analysis helper to count instances of this object in the DataFrame
-        count = analysis.count_object(df, yolo_id)
-        city_counts[object_name] = count
-
-        # Normalise city names in both DataFrame and input for matching
-        norm_city = video_info.normalise_str(city)
-        df_mapping['city_norm'] = df_mapping['City'].astype(str).map(video_info.normalise_str)
+        # Number of unique instances of this object in the video
+        city_counts[object_name] = video_counts[yolo_id]
 
-        match = df_mapping[df_mapping['city_norm'] == norm_city]
-
-        if not match.empty:
-            city_counts['iso'] = match.iloc[0]['ISO']  # If your mapping column is called 'iso'
-            city_counts['country'] = match.iloc[0]['Country']  # Column 'Country'
-            city_counts['continent'] = match.iloc[0]['Continent']  # Column 'Continent'
-        else:
-            city_counts['iso'] = None
-            city_counts['country'] = None
-            city_counts['continent'] = None
     result[city] = city_counts  # Store the results for this city/video
 
+# Add ISO code, country and continent of every city from the mapping, in one lookup
+mapping_columns = {'iso': 'ISO', 'country': 'Country', 'continent': 'Continent'}
+city_info = mapping_index.enrich(result.keys(), list(mapping_columns.values()))
+for city, city_counts in result.items():
+    for key, column in mapping_columns.items():
+        city_counts[key] = city_info.at[city, column]
+
 # Normalise keys in `sounds` just once, mapping them to their values
 if sounds and isinstance(sounds, dict):
     normalised_sounds = {
@@ -140,12 +159,23 @@ if sounds and isinstance(sounds, dict):
 else:
     normalised_sounds = {}
 
+# Loudness of every second of every video
+if normalised_sounds:
+    os.makedirs(SOUND_DIR, exist_ok=True)
+    for video, features in sounds.items():
+        if features is not None:
+            np.save(os.path.join(SOUND_DIR, f"{video}.npy"), features['sound_series'])
+
 for city, data in result.items():
     city_norm = video_info.normalise_str(city)
     country_norm = video_info.normalise_str(data['country'])
     key_norm = f"{city_norm}_{country_norm}"
-    if key_norm in normalised_sounds and normalised_sounds[key_norm] is not None:
-        result[city]['sound'] = float(normalised_sounds[key_norm])
+    features = normalised_sounds.get(key_norm)
+    if features is not None:
+        # The scalar features go in the results, and in the mapping if it has their columns
+        for key, value in features.items():
+            if key != 'sound_series':
+                result[city][key] = float(value)
     else:
         result[city]['sound'] = math.nan
 
@@ -154,20 +184,15 @@ nan_sound_cities = [city for city in result if math.isnan(result[city]['sound'])
 logger.info("Cities where the sound is not present: {nan_sound_cities}.".format(nan_sound_cities=nan_sound_cities))
 
 # --- Update mapping file (CSV) with the new object counts ---
-for city_country, values in result.items():
-
-    city_norm = video_info.normalise_str(city)
-
-    # Normalise all cities in the mapping dataframe (once, outside the loop is better for efficiency!)
-    df_mapping['City_norm'] = df_mapping['City'].apply(video_info.normalise_str)
+for city, values in result.items():
 
-    # Find the row(s) in the mapping CSV where 'City' matches this city/video name
-    idx = df_mapping[df_mapping['City_norm'] == city_norm].index
+    # Find the row in the mapping CSV where 'City' matches this city/video name
+    position = mapping_index.position(city)
 
-    if len(idx) == 0:
+    if position is None:
         logger.error(f"Warning: {city} not found in CSV.")   # Alert if the city name doesn't match any row
         continue
-    idx = idx[0]  # Take the first matching row index
+    idx = df_mapping.index[position]
 
     # For each counted object, update the corresponding column in the DataFrame
     for key, val in values.items():
@@ -188,7 +213,7 @@ plots.plot_choropleth(result,
                       )
 
 plots.stack_plot(result,
-                 df_mapping,
+                 mapping_index,
                  order_by="alphabetical",
                  title_text="",
                  filename="stack_alphabetical",
@@ -201,7 +226,7 @@ plots.stack_plot(result,
                  )
 
 plots.stack_plot(result,
-                 df_mapping,
+                 mapping_index,
                  order_by="average",
                  title_text="",
                  filename="stack_average",
@@ -214,7 +239,7 @@ plots.stack_plot(result,
                  )
 
 plots.stack_plot(result,
-                 df_mapping,
+                 mapping_index,
                  order_by="continent_average",
                  title_text="",
                  filename="continent_average",
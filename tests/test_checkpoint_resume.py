@@ -0,0 +1,117 @@
+"""
+Interrupts checkpointed `tracking_mode` and `batch_tracking_mode` runs and resumes them, with a stand-in for the YOLO
+model.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import os
+import threading
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from ultralytics.engine.results import Results
+import utils.yolo_detection as yolo_detection
+from utils.frame_tap import FRAME_STATS_DIR
+
+# Consts
+FRAMES = 40
+CHECKPOINT_INTERVAL = 10
+CRASH_FRAME = 25  # the first run fails on this frame, after the checkpoint at frame 20
+TITLE = "Test_City"
+BATCH_TITLES = ["Test_City", "Other_City"]
+
+
+class Scripted_model:
+    """
+    Stand-in for the YOLO model: detects one box moving across every frame, and fails on the `crash_frame`-th call.
+    """
+
+    def __init__(self, crash_frame=None):
+        self.crash_frame = crash_frame
+        self.calls = 0
+
+    def predict(self, frames, **kwargs):
+        self.calls += 1
+        if self.calls == self.crash_frame:
+            raise RuntimeError("interrupted")
+        x = 2.0 * self.calls
+        boxes = torch.tensor([[x, 10.0, x + 20.0, 30.0, 0.9, 0.0]])
+        return [Results(frame, path="", names={0: "person"}, boxes=boxes)
+                for frame in (frames if isinstance(frames, list) else [frames])]
+
+
+def write_video(path):
+    """
+    Writes a short video whose frames all differ in brightness.
+    """
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48))  # type: ignore
+    for i in range(FRAMES):
+        writer.write(np.full((48, 64, 3), 5 * i, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    return write_video(str(tmp_path / f"{TITLE}.mp4"))
+
+
+@pytest.fixture
+def detection(tmp_path, monkeypatch):
+    """
+    Returns a `YOLO_detection` that checkpoints every CHECKPOINT_INTERVAL frames and writes frame statistics, with
+    the checkpoints kept in the temporary directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    settings = {"checkpoint_interval": CHECKPOINT_INTERVAL, "frame_stats": True, "frame_stride": 1,
+                "analysis_fps": 0, "prefetch_queue_depth": 2, "output_format": "csv", "snaps_folder": None,
+                "display_frame_tracking": False, "save_annoted_img": False, "save_tracked_img": False,
+                "delete_labels": True, "delete_frames": True}
+    for name, value in settings.items():
+        monkeypatch.setattr(yolo_detection, name, value)
+    detection = yolo_detection.YOLO_detection(TITLE)
+    return detection
+
+
+def run(detection, video_path, output_dir, model):
+    detection.yolo = model
+    detection.tracking_mode(video_path, output_dir=output_dir)
+
+
+def test_resume_keeps_every_frame(detection, video_path, tmp_path):
+    reference_dir = str(tmp_path / "reference")
+    run(detection, video_path, reference_dir, Scripted_model())
+
+    output_dir = str(tmp_path / "resumed")
+    with pytest.raises(RuntimeError):
+        run(detection, video_path, output_dir, Scripted_model(crash_frame=CRASH_FRAME))
+    assert not os.path.exists(os.path.join(output_dir, FRAME_STATS_DIR, f"{TITLE}.csv"))
+    run(detection, video_path, output_dir, Scripted_model())
+
+    stats = pd.read_csv(os.path.join(output_dir, FRAME_STATS_DIR, f"{TITLE}.csv"))
+    assert stats["Frame Count"].tolist() == list(range(1, FRAMES + 1))
+    reference = pd.read_csv(os.path.join(reference_dir, FRAME_STATS_DIR, f"{TITLE}.csv"))
+    pd.testing.assert_frame_equal(stats, reference)
+
+    detections = pd.read_csv(os.path.join(output_dir, f"{TITLE}.csv"))
+    assert sorted(detections["Frame Count"].unique()) == list(range(1, FRAMES + 1))
+    assert not os.listdir(os.path.join("runs", "checkpoints"))
+
+
+def test_batch_failure_releases_every_slot(detection, tmp_path):
+    video_paths = [write_video(str(tmp_path / f"{title}.mp4")) for title in BATCH_TITLES]
+    output_dir = str(tmp_path / "batch")
+    detection.yolo = Scripted_model(crash_frame=CRASH_FRAME)
+    with pytest.raises(RuntimeError):
+        detection.batch_tracking_mode(video_paths, BATCH_TITLES, batch_size=2, output_dir=output_dir)
+    assert not [thread for thread in threading.enumerate() if thread.name == "frame-prefetcher"]
+
+    detection.yolo = Scripted_model()
+    detection.batch_tracking_mode(video_paths, BATCH_TITLES, batch_size=2, output_dir=output_dir)
+    for title in BATCH_TITLES:
+        detections = pd.read_csv(os.path.join(output_dir, f"{title}.csv"))
+        assert sorted(detections["Frame Count"].unique()) == list(range(1, FRAMES + 1))
+    assert not os.listdir(os.path.join("runs", "checkpoints"))
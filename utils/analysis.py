@@ -3,19 +3,40 @@ from custom_logger import CustomLogger
 from logmod import logs
 from tqdm import tqdm
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+from utils.detection_buffer import DETECTION_DTYPES
+from utils.timeseries import Detection_timeseries, SERIES_VERSION
+from utils.video_metadata import Video_metadata
 
 logs(show_level=common.get_configs("logger_level"), show_color=True)
 logger = CustomLogger(__name__)  # use custom logger
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed to read Parquet detection files and for the faster CSV parser
+    pa = pa_csv = pq = None
+
+loader_workers = common.get_configs("loader_workers")
+
+# Consts
+DETECTION_EXTENSIONS = (".csv", ".parquet")
+CSV_ENGINE = "pyarrow" if pq is not None else "c"  # the pyarrow parser is multithreaded and releases the GIL
+# Arrow types of DETECTION_DTYPES, used by the pyarrow CSV parser; nulls of the Arrow integers mark missing values
+ARROW_TYPES = {column: pa.from_numpy_dtype(getattr(pd.api.types.pandas_dtype(dtype), "numpy_dtype", dtype))
+               for column, dtype in DETECTION_DTYPES.items()} if pa is not None else {}
+
 
 class Analysis_class:
     def __init__(self) -> None:
         pass
 
-    def read_csv_files(self, folder_path):
+    def read_csv_files(self, folder_path, columns=None, frame_range=None):
         """
-        Reads all CSV files in the specified folders, processes them if configured,
+        Reads all CSV and Parquet detection files in the specified folders, processes them if configured,
         and returns their contents as a dictionary keyed by file name.
 
         This function will:
@@ -31,35 +52,143 @@ class Analysis_class:
         Args:
             folder_paths (list[str]): List of folder paths containing the CSV files.
             df_mapping (Any): A mapping object used to find values related to each file (for example, video IDs).
+            columns (list[str], optional): Columns to load. Defaults to all columns.
+            frame_range (tuple[int, int], optional): First and last `Frame Count` to load. Defaults to all frames.
 
         Returns:
             dict: Dictionary where keys are the base file names (without extension),
                   and values are the corresponding pandas DataFrames of each CSV file.
                   Only files meeting all value requirements are included.
         """
-        dfs = {}
         logger.info("Reading csv files.")
+        return self.map_detection_files(folder_path, lambda file_path: self.read_detections(
+            file_path, columns=columns, frame_range=frame_range))
+
+    @staticmethod
+    def map_detection_files(folder_path, func, workers=None):
+        """
+        Applies a function to every CSV and Parquet detection file of a folder, reading the files concurrently.
+
+        The files are processed by a pool of threads; parsing runs in native code that releases the GIL, so the
+        files are read in parallel. The throughput of every file is logged at debug level and the total at info
+        level. A file that fails is logged and left out of the results.
 
+        Args:
+            folder_path (str): Folder containing the detection files.
+            func (callable): Function called with the path of every file.
+            workers (int, optional): Number of threads. Defaults to `loader_workers`, or the number of cores if
+                that is 0.
+
+        Returns:
+            dict: Result of `func` for every file, keyed by the file name without extension, in file name order.
+        """
+        results = {}
         if not os.path.exists(folder_path):
             logger.warning(f"Folder does not exist: {folder_path}.")
+            return results
+
+        files = sorted(file for file in os.listdir(folder_path) if file.endswith(DETECTION_EXTENSIONS))
+        workers = min(workers or loader_workers or os.cpu_count() or 1, max(len(files), 1))
 
-        for file in tqdm(os.listdir(folder_path)):
-            if file.endswith(".csv"):
-                filename = os.path.splitext(file)[0]
+        def timed(file):
+            file_path = os.path.join(folder_path, file)
+            start = time.perf_counter()
+            result = func(file_path)
+            elapsed = time.perf_counter() - start
+            size_mb = os.path.getsize(file_path) / (1024 * 1024)
+            logger.debug(f"Read {file_path}: {size_mb:.2f} MB in {elapsed:.3f} s "
+                         f"({size_mb / max(elapsed, 1e-9):.1f} MB/s).")
+            return result, size_mb
 
-                file_path = os.path.join(folder_path, file)
+        start = time.perf_counter()
+        total_mb = 0.0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {file: executor.submit(timed, file) for file in files}
+            for file, future in tqdm(futures.items(), total=len(futures)):
                 try:
-                    logger.debug(f"Adding file {file_path} to dfs.")
+                    results[os.path.splitext(file)[0]], size_mb = future.result()
+                    total_mb += size_mb
+                except Exception as e:
+                    logger.error(f"Failed to read {os.path.join(folder_path, file)}: {e}.")
+        elapsed = time.perf_counter() - start
+        logger.info(f"Read {len(results)} files ({total_mb:.1f} MB) in {elapsed:.2f} s "
+                    f"({total_mb / max(elapsed, 1e-9):.1f} MB/s) with {workers} thread(s).")
+        return results
 
-                    # Read the CSV into a DataFrame
-                    df = pd.read_csv(file_path)
+    @staticmethod
+    def read_detections(file_path, columns=None, frame_range=None):
+        """
+        Reads a per-video detection file, loading only the requested columns and frames.
 
-                    # Add the DataFrame to the dict
-                    dfs[filename] = df
-                except Exception as e:
-                    logger.error(f"Failed to read {file_path}: {e}.")
-                    continue  # Skip to the next file if reading fails
-        return dfs
+        Parquet files are read column by column and row groups outside the frame range are skipped using their
+        `Frame Count` statistics. CSV files are parsed for the requested columns only, with the pyarrow parser
+        when pyarrow is installed, and filtered afterwards. Columns are typed with DETECTION_DTYPES while they are
+        parsed, so a row takes 27 bytes instead of 56 and `Unique Id` is a nullable integer rather than float64.
+
+        Args:
+            file_path (str): Path to a `.csv` or `.parquet` detection file.
+            columns (list[str], optional): Columns to load. Defaults to all columns.
+            frame_range (tuple[int, int], optional): First and last `Frame Count` to load (inclusive). Defaults to
+                all frames.
+
+        Returns:
+            DataFrame: The detections.
+        """
+        if file_path.endswith(".parquet"):
+            if pq is None:
+                raise ImportError("pyarrow is required to read Parquet detection files.")
+            filters = None
+            if frame_range is not None:
+                filters = [("Frame Count", ">=", frame_range[0]), ("Frame Count", "<=", frame_range[1])]
+            return Analysis_class.arrow_to_pandas(pq.read_table(file_path, columns=columns, filters=filters))
+
+        usecols = columns
+        if frame_range is not None and columns is not None and "Frame Count" not in columns:
+            usecols = list(columns) + ["Frame Count"]
+        try:
+            if pa_csv is not None:
+                df = Analysis_class.arrow_to_pandas(pa_csv.read_csv(file_path, convert_options=pa_csv.ConvertOptions(
+                    column_types=ARROW_TYPES, include_columns=usecols)))
+            else:
+                df = pd.read_csv(file_path, usecols=usecols, dtype=DETECTION_DTYPES)
+        except ValueError:
+            # Files written with float track IDs ('12.0') do not parse as integers; cast them after reading
+            df = Analysis_class.apply_schema(pd.read_csv(file_path, usecols=usecols, engine=CSV_ENGINE))
+        if frame_range is not None:
+            df = df[df["Frame Count"].between(frame_range[0], frame_range[1])].reset_index(drop=True)
+            if usecols is not columns:
+                df = df[columns]
+        return df
+
+    @staticmethod
+    def arrow_to_pandas(table):
+        """
+        Converts an Arrow table of detections to a DataFrame typed with DETECTION_DTYPES.
+
+        Integer columns with nulls become nullable integers directly, without a float64 copy, and the Arrow buffers
+        are released while the columns are converted.
+
+        Args:
+            table (pyarrow.Table): Detections.
+
+        Returns:
+            DataFrame: The detections with typed columns.
+        """
+        return Analysis_class.apply_schema(table.to_pandas(types_mapper={pa.int32(): pd.Int32Dtype()}.get,
+                                                           self_destruct=True))
+
+    @staticmethod
+    def apply_schema(df):
+        """
+        Casts the detection columns of a DataFrame to DETECTION_DTYPES, leaving other columns as they are.
+
+        Args:
+            df (DataFrame): Detections.
+
+        Returns:
+            DataFrame: The detections with typed columns.
+        """
+        return df.astype({column: dtype for column, dtype in DETECTION_DTYPES.items() if column in df.columns})
 
     def count_object(self, dataframe, id):
         """
@@ -83,3 +212,197 @@ class Analysis_class:
         num_groups = crossed_ids_grouped.ngroups
 
         return num_groups
+
+    def count_objects(self, dataframe, ids):
+        """
+        Counts the unique instances of several objects in a DataFrame in one pass.
+
+        Gives the same result as calling `count_object` for every ID, without scanning the DataFrame once per ID.
+
+        Args:
+            dataframe (DataFrame): The DataFrame containing object data.
+            ids (list[int]): The YOLO IDs of the objects to count.
+
+        Returns:
+            dict: Number of unique instances (distinct `Unique Id`) of every object, keyed by YOLO ID.
+        """
+        tracked = dataframe[["YOLO_id", "Unique Id"]].dropna()
+        tracked = tracked[tracked["YOLO_id"].isin(ids)]
+        counts = tracked.drop_duplicates().groupby("YOLO_id").size()
+        return {id: int(counts.get(id, 0)) for id in ids}
+
+    def summarise_detections(self, file_path):
+        """
+        Summarises a detection file: unique-track counts of every class and statistics of its tracks.
+
+        Args:
+            file_path (str): Path to a CSV or Parquet detection file.
+
+        Returns:
+            dict: A dictionary containing:
+                - counts (dict): Number of unique instances of every detected class, keyed by YOLO ID.
+                - tracks (dict): Number of detections, tracked detections and tracks, mean number of detections
+                  per track and last frame with a detection.
+        """
+        df = self.read_detections(file_path, columns=["YOLO_id", "Unique Id", "Frame Count"])
+        tracked = df.dropna(subset=["Unique Id"])
+
+        # One group per (class, track), as in count_objects
+        lengths = tracked.groupby(["YOLO_id", "Unique Id"]).size()
+        counts = lengths.groupby(level="YOLO_id").size()
+        return {
+            "counts": {int(yolo_id): int(count) for yolo_id, count in counts.items()},
+            "tracks": {
+                "Detections": len(df),
+                "Tracked detections": len(tracked),
+                "Tracks": len(lengths),
+                "Mean detections per track": float(lengths.mean()) if len(lengths) else 0.0,
+                "Last frame": int(df["Frame Count"].max()) if len(df) else 0,
+            },
+        }
+
+    def summarise_folder(self, folder_path, cache=None):
+        """
+        Summarises every detection file of a folder with `summarise_detections`.
+
+        Files are read concurrently with only the columns needed and reduced to their summary straight away, so the
+        detections of all videos are never held in memory together. With a cache only new or changed files are
+        read; the others are served from the cache.
+
+        Args:
+            folder_path (str): Folder containing the CSV or Parquet detection files.
+            cache (Summary_cache, optional): Cache of the summaries. Defaults to None (no caching).
+
+        Returns:
+            dict: Summary of every file, keyed by the file name without extension.
+        """
+        logger.info("Summarising the detection files.")
+        if cache is not None:
+            summaries = self.map_detection_files(folder_path, lambda file_path: cache.get(
+                "detections", file_path, self.summarise_detections))
+            if os.path.exists(folder_path):
+                cache.prune("detections", folder_path)
+            cache.save()
+        else:
+            summaries = self.map_detection_files(folder_path, self.summarise_detections)
+        return summaries
+
+    def count_objects_in_folder(self, folder_path, ids, cache=None):
+        """
+        Counts the unique instances of several objects in every detection file of a folder.
+
+        Args:
+            folder_path (str): Folder containing the CSV or Parquet detection files.
+            ids (list[int]): The YOLO IDs of the objects to count.
+            cache (Summary_cache, optional): Cache of the file summaries. Defaults to None (no caching).
+
+        Returns:
+            dict: Counts of every file as returned by `count_objects`, keyed by the file name without extension.
+        """
+        return {video: {id: summary["counts"].get(id, 0) for id in ids}
+                for video, summary in self.summarise_folder(folder_path, cache=cache).items()}
+
+    @staticmethod
+    def video_timing(video_path):
+        """
+        Reads the frame rate and number of frames of a video from its container headers.
+
+        Args:
+            video_path (str): Path to the video.
+
+        Returns:
+            tuple: Frame rate and number of frames, or None if the video cannot be read.
+        """
+        return Video_metadata.timing(video_path)
+
+    def timeseries_folder(self, folder_path, ids, video_timings, cache=None):
+        """
+        Computes the windowed time series of every detection file of a folder.
+
+        Files are read concurrently with only the three columns the series need. With a cache only new or changed
+        files are read, or files whose classes or video timing changed; the others are served from the cache.
+
+        Args:
+            folder_path (str): Folder containing the CSV or Parquet detection files.
+            ids (list[int]): The YOLO IDs of the classes to include.
+            video_timings (dict): Frame rate and number of frames of every video, keyed by the file name without
+                extension, as returned by `video_timing`. Files without an entry are skipped.
+            cache (Summary_cache, optional): Cache of the series. Defaults to None (no caching).
+
+        Returns:
+            dict: Series of every file as returned by `Detection_timeseries.compute`, keyed by the file name without
+                extension.
+        """
+        logger.info("Computing the time series of the detection files.")
+
+        def compute(file_path):
+            name = os.path.splitext(os.path.basename(file_path))[0]
+            if video_timings.get(name) is None:
+                return None
+            fps, n_frames = video_timings[name]
+
+            def compute_series(path):
+                df = self.read_detections(path, columns=["YOLO_id", "Unique Id", "Frame Count"])
+                return Detection_timeseries.compute(df, ids, fps, n_frames=n_frames)
+
+            if cache is None:
+                return compute_series(file_path)
+            # The series also depend on the classes and the timing of the video, so they are part of the version
+            return cache.get("timeseries", file_path, compute_series,
+                             version=(SERIES_VERSION, tuple(ids), fps, n_frames))
+
+        series = self.map_detection_files(folder_path, compute)
+        if cache is not None:
+            if os.path.exists(folder_path):
+                cache.prune("timeseries", folder_path)
+            cache.save()
+        skipped = sorted(name for name, value in series.items() if value is None)
+        if skipped:
+            logger.warning(f"No frame rate for the videos of {skipped}, their time series are skipped.")
+        return {name: value for name, value in series.items() if value is not None}
+
+    def stride_report(self, full_counts, strided_counts, yolo_id_to_object):
+        """
+        Compares object counts of videos analysed at a frame stride against the same videos analysed at full rate.
+
+        Args:
+            full_counts (dict): Object counts of the full-rate detections, keyed by video name, as returned by
+                `count_objects_in_folder`.
+            strided_counts (dict): Object counts of the strided detections, keyed by video name.
+            yolo_id_to_object (dict): YOLO class IDs to compare, mapped to their human-readable names.
+
+        Returns:
+            tuple: Two DataFrames:
+                - per video and class: full-rate count, strided count, difference and relative difference.
+                - per class: totals over all videos, relative difference of the totals, number of videos whose
+                  count changed and the largest relative difference of a single video.
+        """
+        videos = sorted(set(full_counts) & set(strided_counts))
+        missing = sorted(set(full_counts) ^ set(strided_counts))
+        if missing:
+            logger.warning(f"Videos present in only one of the compared sets are skipped: {missing}.")
+
+        rows = []
+        for video in videos:
+            for yolo_id, object_name in yolo_id_to_object.items():
+                full_count = full_counts[video][yolo_id]
+                strided_count = strided_counts[video][yolo_id]
+                rows.append({
+                    "Video": video,
+                    "Object": object_name,
+                    "Full count": full_count,
+                    "Strided count": strided_count,
+                })
+        details = pd.DataFrame(rows, columns=["Video", "Object", "Full count", "Strided count"])
+        details["Difference"] = details["Strided count"] - details["Full count"]
+        details["Relative difference"] = details["Difference"] / details["Full count"].where(details["Full count"] > 0)
+
+        summary = details.groupby("Object", sort=False).agg(**{
+            "Full count": ("Full count", "sum"),
+            "Strided count": ("Strided count", "sum"),
+            "Videos changed": ("Difference", lambda d: int((d != 0).sum())),
+            "Max relative difference": ("Relative difference", lambda d: d.abs().max()),
+        }).reset_index()
+        summary["Relative difference"] = ((summary["Strided count"] - summary["Full count"])
+                                          / summary["Full count"].where(summary["Full count"] > 0))
+        return details, summary
@@ -0,0 +1,231 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import json
+import os
+import pickle
+import shutil
+import common
+from utils.detection_buffer import Detection_buffer, PART_PATTERN
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+# Consts
+CHECKPOINT_DIR = os.path.join("runs", "checkpoints")  # outside runs/detect, which is cleared before every run
+
+
+class Video_checkpoint:
+    """
+    Periodic checkpoint of the detection run of one video.
+
+    While a video is tracked its detections, the summaries of its evicted tracks and, with `frame_stats`, its
+    per-frame statistics are appended to a partial output, a partial tracks table and a partial statistics table in
+    the checkpoint directory. Every checkpoint flushes them, then records the last committed frame, their sizes,
+    the tracker state and the track store. When a run is interrupted the next run rolls them back to the recorded
+    sizes, seeks to the frame after the committed one and continues from there.
+
+    The partial output is a CSV file, whose size is its length in bytes, or for Parquet output a directory of part
+    files, whose size is the number of parts.
+
+    The tracker and the track store are restored from their pickled state when possible. Otherwise both are reset:
+    the summaries of the tracks still active at the checkpoint are lost and the track IDs continue after the highest ID
+    already written, so IDs of the resumed part never collide with earlier ones. Every resume is recorded in the
+    checkpoint together with whether the tracker was restored or reset.
+    """
+
+    def __init__(self, video_title, input_video_path, stride, output_format="csv", frame_stats=False,
+                 checkpoint_dir=CHECKPOINT_DIR):
+        """
+        Initialises the checkpoint of a video.
+
+        Parameters:
+            video_title (str): Title of the video, used to name the checkpoint files.
+            input_video_path (str): Path to the input video.
+            stride (int): Frame stride of the run. A checkpoint taken with another stride is discarded.
+            output_format (str, optional): Format of the output, 'csv' or 'parquet'. Defaults to 'csv'.
+            frame_stats (bool, optional): Whether the run writes per-frame statistics. A checkpoint taken with the
+                other setting is discarded. Defaults to False.
+            checkpoint_dir (str, optional): Directory holding the checkpoints. Defaults to CHECKPOINT_DIR.
+        """
+        self.input_video_path = input_video_path
+        self.stride = stride
+        self.output_format = output_format
+        self.frame_stats = frame_stats
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        if output_format == "parquet":
+            self.output_path = os.path.join(checkpoint_dir, f"{video_title}.parts")
+        else:
+            self.output_path = os.path.join(checkpoint_dir, f"{video_title}.csv")
+        self.tracks_path = os.path.join(checkpoint_dir, f"{video_title}_tracks.csv")
+        self.frame_stats_path = os.path.join(checkpoint_dir, f"{video_title}_frame_stats.csv")
+        self.state_path = os.path.join(checkpoint_dir, f"{video_title}.json")
+        self.tracker_path = os.path.join(checkpoint_dir, f"{video_title}_tracker.pkl")
+        self.resumes = []  # frame and tracker status ('restored' or 'reset') of every resume of this video
+
+    def _video_signature(self):
+        """
+        Returns the size and modification time of the video, used to detect a replaced video.
+        """
+        stat = os.stat(self.input_video_path)
+        return {"video_size": stat.st_size, "video_mtime": int(stat.st_mtime)}
+
+    def _output_size(self):
+        """
+        Returns the size of the partial output: bytes of the CSV or number of Parquet parts (-1 if it is missing).
+        """
+        if self.output_format == "parquet":
+            return Detection_buffer.count_parts(self.output_path) if os.path.isdir(self.output_path) else -1
+        return os.path.getsize(self.output_path) if os.path.exists(self.output_path) else -1
+
+    @staticmethod
+    def _table_size(path):
+        """
+        Returns the size of a partial CSV table in bytes (-1 if it is missing).
+        """
+        return os.path.getsize(path) if os.path.exists(path) else -1
+
+    def detection_buffer(self):
+        """
+        Returns a detection buffer writing to the partial output.
+        """
+        return Detection_buffer(self.output_path, parts=self.output_format == "parquet")
+
+    def resume(self):
+        """
+        Prepares the partial output for the run and returns where it should start.
+
+        A checkpoint that does not match the video or the stride is discarded and the video is processed from the
+        start.
+
+        Returns:
+            tuple: A tuple containing:
+                - start_frame (int): Last committed frame, 0 to start from the beginning.
+                - session (Tracker_session or None): Restored tracker session, or None if it has to be reset.
+                - track_count (int): Highest track ID already written.
+                - tracks (Track_store or None): Restored track store, or None if it has to be reset.
+        """
+        state = None
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if (state.get("stride") != self.stride or state.get("video") != self.input_video_path or
+                    state.get("output_format") != self.output_format or
+                    state.get("frame_stats", False) != self.frame_stats or
+                    any(state.get(key) != value for key, value in self._video_signature().items()) or
+                    self._output_size() < state["output_size"] or
+                    self._table_size(self.tracks_path) < state.get("tracks_size", 0) or
+                    self._table_size(self.frame_stats_path) < state.get("frame_stats_size", 0)):
+                logger.warning(f"Discarding the checkpoint of {self.input_video_path}, it does not match the video.")
+                state = None
+
+        if state is None:
+            self.discard()
+            return 0, None, 0, None
+
+        # Drop the rows flushed after the checkpoint, they are detected again
+        if self.output_format == "parquet":
+            for i in range(state["output_size"], self._output_size()):
+                os.remove(os.path.join(self.output_path, PART_PATTERN.format(i)))
+        else:
+            with open(self.output_path, 'r+b') as f:
+                f.truncate(state["output_size"])
+        for path, key in ((self.tracks_path, "tracks_size"), (self.frame_stats_path, "frame_stats_size")):
+            if os.path.exists(path):
+                with open(path, 'r+b') as f:
+                    f.truncate(state.get(key, 0))
+
+        session = tracks = None
+        try:
+            with open(self.tracker_path, 'rb') as f:
+                saved = pickle.load(f)
+            if saved["frame"] == state["frame"]:
+                session, tracks = saved["session"], saved["tracks"]
+        except Exception as e:
+            logger.debug(f"Could not restore the tracker of {self.input_video_path}: {e}.")
+
+        self.resumes = state.get("resumes", []) + [{
+            "frame": state["frame"],
+            "tracker": "restored" if session is not None else "reset",
+        }]
+        state["resumes"] = self.resumes
+        self._write_state(state)
+        logger.info(f"Resuming {self.input_video_path} after frame {state['frame']}, "
+                    f"tracker {self.resumes[-1]['tracker']}.")
+        return state["frame"], session, state["track_count"], tracks
+
+    def save(self, frame, session, detections, tracks, frame_stats=None):
+        """
+        Commits the detections, track summaries and frame statistics up to `frame` and records the checkpoint.
+
+        Parameters:
+            frame (int): Last frame whose detections are in the buffer.
+            session (Tracker_session): Tracker session of the video.
+            detections (Detection_buffer): Detection buffer writing to the partial output.
+            tracks (Track_store): Track store of the video.
+            frame_stats (Frame_statistics, optional): Statistics of the frames, writing to `frame_stats_path`.
+        """
+        detections.flush()
+        tracks.flush()
+        if frame_stats is not None:
+            frame_stats.flush()
+
+        tmp_path = self.tracker_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({"frame": frame, "session": session, "tracks": tracks}, f)
+        os.replace(tmp_path, self.tracker_path)
+
+        self._write_state({
+            "video": self.input_video_path,
+            **self._video_signature(),
+            "stride": self.stride,
+            "output_format": self.output_format,
+            "frame": frame,
+            "output_size": self._output_size(),
+            "frame_stats": self.frame_stats,
+            "tracks_size": self._table_size(self.tracks_path),
+            "frame_stats_size": self._table_size(self.frame_stats_path),
+            "track_count": session.track_count,
+            "resumes": self.resumes,
+        })
+        logger.debug(f"Checkpoint of {self.input_video_path} at frame {frame}.")
+
+    def _write_state(self, state):
+        """
+        Atomically writes the checkpoint record.
+        """
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def finish(self, output_path, tracks_path, frame_stats_path=None):
+        """
+        Moves the completed output, tracks table and statistics table to their destinations and removes the
+        checkpoint.
+
+        Parameters:
+            output_path (str): Destination of the output.
+            tracks_path (str): Destination of the tracks table.
+            frame_stats_path (str, optional): Destination of the statistics table, if the run writes one.
+        """
+        if self.output_format == "parquet":
+            Detection_buffer.merge_parts(self.output_path, output_path)
+        else:
+            shutil.move(self.output_path, output_path)
+        os.makedirs(os.path.dirname(tracks_path) or ".", exist_ok=True)
+        shutil.move(self.tracks_path, tracks_path)
+        if frame_stats_path is not None:
+            os.makedirs(os.path.dirname(frame_stats_path) or ".", exist_ok=True)
+            shutil.move(self.frame_stats_path, frame_stats_path)
+        self.discard()
+
+    def discard(self):
+        """
+        Removes the checkpoint files of the video.
+        """
+        if os.path.isdir(self.output_path):
+            shutil.rmtree(self.output_path)
+        for path in (self.output_path, self.tracks_path, self.frame_stats_path, self.state_path, self.tracker_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,205 @@
+"""Country name and code resolution from tables built once from pycountry."""
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import functools
+import pandas as pd
+import pycountry
+from custom_logger import CustomLogger
+
+# common imports this module, so it uses the custom logger directly instead of reading the logger config
+logger = CustomLogger(__name__)  # use custom logger
+
+# Consts
+# Common country name variations, mapped to the names pycountry uses
+ALIASES = {
+    'Russia': 'Russian Federation',
+    'Syria': 'Syrian Arab Republic',
+    'South Korea': 'Korea, Republic of',
+    'North Korea': "Korea, Democratic People's Republic of",
+    'Korea': 'Korea, Republic of',
+    'Iran': 'Iran, Islamic Republic of',
+    'Vietnam': 'Viet Nam',
+    'Venezuela': 'Venezuela, Bolivarian Republic of',
+    'Bolivia': 'Bolivia, Plurinational State of',
+    'Moldova': 'Moldova, Republic of',
+    'Laos': "Lao People's Democratic Republic",
+    'Brunei': 'Brunei Darussalam',
+    'Czech Republic': 'Czechia',
+    'Ivory Coast': "Côte d'Ivoire",
+    'Cape Verde': 'Cabo Verde',
+    'Swaziland': 'Eswatini',
+    'Macau': 'Macao',
+    'Taiwan': 'Taiwan, Province of China',
+    'Tanzania': 'Tanzania, United Republic of',
+    # 'United States': 'United States of America',
+    'UK': 'United Kingdom',
+    'Palestine': 'Palestine, State of',
+    'Micronesia': 'Micronesia, Federated States of',
+    'Bahamas': 'Bahamas, The',
+    # 'Gambia': 'Gambia, The',
+    'São Tomé and Príncipe': 'Sao Tome and Principe',
+    'Turkiye': 'Türkiye',
+    'Turkey': 'Türkiye',
+    'Congo (Democratic Republic)': 'Congo, The Democratic Republic of the',
+    'Congo (Congo-Brazzaville)': 'Congo',
+    'Burma': 'Myanmar',
+    'East Timor': 'Timor-Leste',
+    'Saint Kitts': 'Saint Kitts and Nevis',
+    'Saint Vincent': 'Saint Vincent and the Grenadines',
+    'Saint Lucia': 'Saint Lucia',
+    'Antigua': 'Antigua and Barbuda',
+    'Trinidad': 'Trinidad and Tobago',
+    'Slovak Republic': 'Slovakia',
+    'Vatican': 'Holy See',
+}
+# Kosovo has no ISO 3166 entry in pycountry; these are the user-assigned codes in common use
+KOSOVO = {"name": "Kosovo", "iso2": "XK", "iso3": "XKX"}
+KOSOVO_FLAG = "🇽🇰"
+CODES = ("iso2", "iso3", "name", "flag")
+
+
+def flag_of(iso2):
+    """
+    Builds the flag emoji of an ISO-2 code from its regional indicator symbols.
+    """
+    return chr(ord('🇦') + (ord(iso2[0]) - ord('A'))) + chr(ord('🇦') + (ord(iso2[1]) - ord('A')))
+
+
+@functools.lru_cache(maxsize=None)
+def tables():
+    """
+    Builds the resolution tables on first use.
+
+    Returns:
+        tuple: Record of every country keyed by ISO-3 code, with the ISO-2 code, name and flag; the ISO-3 code of
+            every lowercased name, common name, official name and alias; and the ISO-3 code of every ISO-2 code.
+    """
+    records = {}
+    by_name = {}
+    by_iso2 = {}
+    for country in pycountry.countries:
+        records[country.alpha_3] = {"iso2": country.alpha_2, "iso3": country.alpha_3, "name": country.name,
+                                    "flag": flag_of(country.alpha_2)}
+        by_iso2[country.alpha_2] = country.alpha_3
+        for attribute in ("official_name", "common_name", "name"):  # name last, so it wins on clashes
+            name = getattr(country, attribute, None)
+            if name:
+                by_name[name.lower()] = country.alpha_3
+
+    records[KOSOVO["iso3"]] = dict(KOSOVO, flag=KOSOVO_FLAG)
+    by_name[KOSOVO["name"].lower()] = KOSOVO["iso3"]
+    by_iso2[KOSOVO["iso2"]] = KOSOVO["iso3"]
+
+    for alias, name in ALIASES.items():
+        iso3 = by_name.get(name.lower())
+        if iso3 is not None:
+            by_name.setdefault(alias.lower(), iso3)
+    return records, by_name, by_iso2
+
+
+def correct_country(country):
+    """
+    Corrects common country name variations for compatibility with pycountry.countries.get(name=...).
+    """
+    return ALIASES.get(country, country)
+
+
+def record(value, source):
+    """
+    Finds the record of a country.
+
+    Parameters:
+        value (str): Country name, ISO-2 code or ISO-3 code. Names are matched without regard to case, on the
+            pycountry name, common name and official name, and on the aliases in ALIASES.
+        source (str): What `value` is: 'country', 'iso2' or 'iso3'.
+
+    Returns:
+        dict or None: The record with keys 'iso2', 'iso3', 'name' and 'flag', or None if the country is unknown.
+    """
+    if not isinstance(value, str):
+        return None
+    records, by_name, by_iso2 = tables()
+    value = value.strip()
+    if source == "country":
+        iso3 = by_name.get(value.lower())
+        if iso3 is None:
+            iso3 = by_name.get(correct_country(value).lower())
+    elif source == "iso2":
+        iso3 = by_iso2.get(value.upper())
+    elif source == "iso3":
+        iso3 = value.upper()
+    else:
+        raise ValueError(f"Unknown source {source}, expected 'country', 'iso2' or 'iso3'.")
+    return records.get(iso3)
+
+
+def convert(values, source, target):
+    """
+    Converts country names or codes, for a single value or a whole pandas Series.
+
+    Parameters:
+        values (str or pd.Series): Country names or codes.
+        source (str): What `values` are: 'country', 'iso2' or 'iso3'.
+        target (str): What to return: 'iso2', 'iso3', 'name' or 'flag'.
+
+    Returns:
+        str, None or pd.Series: The converted value, None for unknown countries. A Series gives a Series of the
+            same index, resolving every distinct value once.
+    """
+    if target not in CODES:
+        raise ValueError(f"Unknown target {target}, expected one of {', '.join(CODES)}.")
+    if isinstance(values, pd.Series):
+        resolved = {value: convert(value, source, target) for value in values.dropna().unique()}
+        return values.map(resolved).astype(object).where(values.notna(), None)
+    found = record(values, source)
+    return found[target] if found else None
+
+
+def country_to_iso3(country):
+    """
+    Returns the ISO-3 code of a country name, or None if it is unknown.
+    """
+    return convert(country, "country", "iso3")
+
+
+def country_to_iso2(country):
+    """
+    Returns the ISO-2 code of a country name, or None if it is unknown.
+    """
+    return convert(country, "country", "iso2")
+
+
+def iso3_to_name(iso3):
+    """
+    Returns the pycountry name of an ISO-3 code, or None if it is unknown.
+    """
+    return convert(iso3, "iso3", "name")
+
+
+def iso3_to_iso2(iso3):
+    """
+    Returns the ISO-2 code of an ISO-3 code, or None if it is unknown.
+    """
+    return convert(iso3, "iso3", "iso2")
+
+
+def iso2_to_flag(iso2):
+    """
+    Returns the flag emoji of an ISO-2 code.
+
+    A missing code gives the flag of Kosovo, which historically was the only country without an ISO-2 code in the
+    mapping.
+
+    Parameters:
+        iso2 (str or pd.Series): ISO-2 codes.
+
+    Returns:
+        str or pd.Series: The flags.
+    """
+    if isinstance(iso2, pd.Series):
+        flags = {value: iso2_to_flag(value) for value in iso2.dropna().unique()}
+        return iso2.map(flags).where(iso2.notna(), KOSOVO_FLAG)
+    if iso2 is None:
+        logger.debug("Set ISO-2 to Kosovo.")
+        return KOSOVO_FLAG
+    flag = convert(iso2, "iso2", "flag")
+    return flag if flag is not None else flag_of(iso2)
@@ -0,0 +1,216 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import common
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed for the Parquet output
+    pa = pq = None
+
+# Consts
+FLUSH_ROWS = 65536  # number of detection rows kept in memory before they are appended to the CSV
+COLUMNS = ["YOLO_id", "X-center", "Y-center", "Width", "Height", "Unique Id", "Frame Count"]
+OUTPUT_FORMATS = ("csv", "parquet")
+# Schema of the detection tables, used for the Parquet output and when reading detection files: small integer
+# classes, float32 coordinates, nullable track IDs ('Unique Id' is empty for detections without a track ID) and int32
+# frame numbers
+DETECTION_DTYPES = {
+    "YOLO_id": "int16",
+    "X-center": "float32",
+    "Y-center": "float32",
+    "Width": "float32",
+    "Height": "float32",
+    "Unique Id": "Int32",
+    "Frame Count": "int32",
+}
+PART_PATTERN = "part-{:05d}.parquet"
+
+
+class Detection_buffer:
+    """
+    Preallocated columnar buffer for per-frame YOLO detections.
+
+    Boxes, classes and track IDs are copied straight from the tracker results into fixed-size numpy columns and
+    appended to the output file in large batches. The output keeps the schema previously produced from the YOLO
+    label files: `YOLO_id, X-center, Y-center, Width, Height, Unique Id, Frame Count`, with normalised box
+    coordinates and an empty `Unique Id` for detections without a track ID.
+
+    The output is a CSV file, or a Parquet file when its path ends with `.parquet`. Parquet output uses the compact
+    dtypes of DETECTION_DTYPES and writes every flush as a row group, so row groups cover consecutive frame ranges
+    and readers can skip them by their `Frame Count` statistics. With `parts` set the output path is a directory that
+    receives every flush as a separate Parquet file, which can be rolled back by deleting files; `merge_parts` turns
+    it into a single Parquet file.
+    """
+
+    def __init__(self, output_path, capacity=FLUSH_ROWS, parts=False):
+        """
+        Initialises an empty buffer.
+
+        Parameters:
+            output_path (str): Path to the CSV or Parquet file the detections are appended to, or the directory of
+                part files if `parts` is set.
+            capacity (int, optional): Number of rows held in memory before flushing. Defaults to FLUSH_ROWS.
+            parts (bool, optional): Write every flush as a separate Parquet file in `output_path`. Defaults to False.
+        """
+        self.output_path = output_path
+        self.parts = parts
+        self.format = "parquet" if parts or output_path.endswith(".parquet") else "csv"
+        if self.format == "parquet" and pq is None:
+            raise ImportError("pyarrow is required for the Parquet output.")
+        self.writer = None  # Parquet writer, opened on the first flush
+        self.parts_written = Detection_buffer.count_parts(output_path) if parts else 0
+        self.capacity = capacity
+        self.size = 0
+        self.yolo_id = np.empty(capacity, dtype=np.int64)
+        self.xywhn = np.empty((capacity, 4), dtype=np.float64)
+        self.unique_id = np.empty(capacity, dtype=np.float64)
+        self.frame_count = np.empty(capacity, dtype=np.int64)
+
+    def append(self, yolo_ids, xywhn, track_ids, frame_count):
+        """
+        Adds the detections of a single frame to the buffer.
+
+        Parameters:
+            yolo_ids (np.ndarray): Class ID of every detection, shape (n,).
+            xywhn (np.ndarray): Normalised centre x, centre y, width and height, shape (n, 4).
+            track_ids (np.ndarray or None): Track ID of every detection, or None if the frame is not tracked.
+            frame_count (int): Frame number the detections belong to.
+        """
+        n = len(yolo_ids)
+        start = 0
+        while start < n:
+            if self.size == self.capacity:
+                self.flush()
+            stop = min(n, start + self.capacity - self.size)
+            rows = slice(self.size, self.size + stop - start)
+            self.yolo_id[rows] = yolo_ids[start:stop]
+            self.xywhn[rows] = xywhn[start:stop]
+            self.unique_id[rows] = np.nan if track_ids is None else track_ids[start:stop]
+            self.frame_count[rows] = frame_count
+            self.size += stop - start
+            start = stop
+
+    def _to_frame(self):
+        """
+        Returns the buffered rows as a DataFrame.
+        """
+        n = self.size
+        return pd.DataFrame({
+            "YOLO_id": self.yolo_id[:n],
+            "X-center": self.xywhn[:n, 0],
+            "Y-center": self.xywhn[:n, 1],
+            "Width": self.xywhn[:n, 2],
+            "Height": self.xywhn[:n, 3],
+            "Unique Id": pd.array(self.unique_id[:n], dtype="Float64").astype("Int64"),
+            "Frame Count": self.frame_count[:n],
+        }, columns=COLUMNS)
+
+    def flush(self):
+        """
+        Appends the buffered rows to the output and empties the buffer.
+
+        The CSV header is written only when the CSV is created, so a video without any detection still yields a
+        header-only file. Likewise an empty Parquet output gets the schema without rows.
+        """
+        if self.format == "parquet":
+            self._flush_parquet()
+        else:
+            exists = os.path.exists(self.output_path)
+            if self.size == 0 and exists:
+                return
+
+            # %g keeps the same precision as the label files YOLO used to write
+            self._to_frame().to_csv(self.output_path, index=False, mode='a' if exists else 'w', header=not exists,
+                                    float_format="%g")
+        logger.debug(f"Flushed {self.size} detections to {self.output_path}.")
+        self.size = 0
+
+    def _flush_parquet(self):
+        """
+        Writes the buffered rows as one Parquet row group, or as the next part file.
+        """
+        if self.size == 0 and (self.writer is not None or self.parts_written > 0):
+            return
+        table = pa.Table.from_pandas(self._to_frame().astype(DETECTION_DTYPES), preserve_index=False)  # type: ignore
+        if self.parts:
+            os.makedirs(self.output_path, exist_ok=True)
+            part_path = os.path.join(self.output_path, PART_PATTERN.format(self.parts_written))
+            pq.write_table(table, part_path)  # type: ignore
+            self.parts_written += 1
+        else:
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.output_path, table.schema)  # type: ignore
+            self.writer.write_table(table, row_group_size=max(len(table), 1))
+
+    def close(self):
+        """
+        Flushes any remaining rows to the output and closes the Parquet writer.
+        """
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def release(self):
+        """
+        Closes the Parquet writer without flushing the buffered rows, after a failed run. The rows already flushed
+        stay in the output.
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self.size = 0
+
+    @staticmethod
+    def count_parts(parts_dir):
+        """
+        Returns the number of part files in a directory of Parquet parts.
+        """
+        if not os.path.isdir(parts_dir):
+            return 0
+        return len([file for file in os.listdir(parts_dir) if file.startswith("part-")])
+
+    @staticmethod
+    def merge_parts(parts_dir, output_path):
+        """
+        Combines the part files written with `parts` set into a single Parquet file, one row group per part, and
+        removes the directory.
+
+        Parameters:
+            parts_dir (str): Directory of part files.
+            output_path (str): Path of the Parquet file to write.
+        """
+        writer = None
+        for i in range(Detection_buffer.count_parts(parts_dir)):
+            table = pq.read_table(os.path.join(parts_dir, PART_PATTERN.format(i)))  # type: ignore
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)  # type: ignore
+            writer.write_table(table, row_group_size=max(len(table), 1))
+        if writer is not None:
+            writer.close()
+        shutil.rmtree(parts_dir)
+
+    @staticmethod
+    def write_label_file(path, yolo_ids, xywhn, track_ids):
+        """
+        Writes the detections of one frame in YOLO label format (one `class x y w h [id]` line per box).
+
+        Parameters:
+            path (str): Path of the label file to write.
+            yolo_ids (np.ndarray): Class ID of every detection.
+            xywhn (np.ndarray): Normalised centre x, centre y, width and height of every detection.
+            track_ids (np.ndarray or None): Track ID of every detection, or None if the frame is not tracked.
+        """
+        with open(path, 'w') as label_file:
+            for i in range(len(yolo_ids)):
+                line = (int(yolo_ids[i]), *xywhn[i]) + (() if track_ids is None else (int(track_ids[i]),))
+                label_file.write(("%g " * len(line)).rstrip() % line + "\n")
@@ -0,0 +1,190 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import glob
+import os
+import common
+from custom_logger import CustomLogger
+from logmod import logs
+import pandas as pd
+from utils.analysis import DETECTION_EXTENSIONS
+from utils.detection_buffer import COLUMNS
+from utils.mapping_index import MappingIndex
+from utils.track_store import TRACKS_DIR, TRACK_COLUMNS
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+try:
+    import duckdb
+except ImportError:  # duckdb is only needed for SQL queries over the detection files
+    duckdb = None
+
+loader_workers = common.get_configs("loader_workers")
+query_memory_limit = common.get_configs("query_memory_limit")
+
+# Consts
+SPILL_DIR = os.path.join(common.cache_dir, "duckdb")  # intermediate results that do not fit in memory go here
+# SQL types of the detection columns, matching the compact dtypes of the Parquet output
+DETECTION_TYPES = dict(zip(COLUMNS, ["SMALLINT", "FLOAT", "FLOAT", "FLOAT", "FLOAT", "INTEGER", "INTEGER"]))
+TRACK_TYPES = dict(zip(TRACK_COLUMNS, ["INTEGER", "SMALLINT", "INTEGER", "INTEGER", "INTEGER", "DOUBLE", "DOUBLE",
+                                       "DOUBLE"]))
+# Name of the video (`<city>_<country>`) from the path of its file
+VIDEO_NAME = r"regexp_extract(filename, '([^/\\]+)\.(csv|parquet)$', 1)"
+
+
+class Detection_query:
+    """
+    In-process SQL over all per-video detection files of the `data` directory, backed by DuckDB.
+
+    The files are registered as views and scanned by DuckDB on every query, in parallel and without being loaded
+    into pandas first; intermediate results larger than the memory limit are spilled to disk, so queries over the
+    whole corpus do not need it to fit in memory. The views are:
+        - detections: every row of the CSV and Parquet detection files, with the typed detection columns and
+          `video`, `city` and `country` taken from the file name (`<city>_<country>`).
+        - tracks: the tracks tables written next to the detection files, with the same three columns.
+        - mapping: the rows of the mapping CSV, with their position in `mapping_row`.
+        - detections_mapped: the detections joined to the columns of the mapping row of their city, found with
+          `MappingIndex` as in run.py.
+    """
+
+    def __init__(self, data_path=None, mapping_file=None, threads=None, memory_limit=None):
+        """
+        Opens an in-memory database and registers the views.
+
+        Parameters:
+            data_path (str, optional): Directory with the detection files. Defaults to the `data` config.
+            mapping_file (str, optional): The mapping CSV. Defaults to the `mapping` config.
+            threads (int, optional): Number of threads of the scans. Defaults to `loader_workers`, or the number of
+                cores if that is 0.
+            memory_limit (str, optional): Memory DuckDB may use before spilling to disk, e.g. '8GB'. Defaults to
+                `query_memory_limit`, or the DuckDB default if that is empty.
+        """
+        if duckdb is None:
+            raise ImportError("duckdb is required to query the detection files.")
+        self.data_path = data_path or common.get_configs("data")
+        self.mapping_file = mapping_file or common.get_configs("mapping")
+
+        os.makedirs(SPILL_DIR, exist_ok=True)
+        self.con = duckdb.connect(":memory:")
+        self.con.execute(f"SET threads = {int(threads or loader_workers or os.cpu_count() or 1)}")
+        self.con.execute(f"SET temp_directory = '{SPILL_DIR}'")
+        memory_limit = memory_limit or query_memory_limit
+        if memory_limit:
+            self.con.execute(f"SET memory_limit = '{memory_limit}'")
+        self.con.execute("SET preserve_insertion_order = false")  # lets scans and aggregations stream
+        self._register()
+
+    def _files(self, pattern):
+        """
+        Returns the SQL glob of `pattern` in the data directory, or None if no file matches it.
+        """
+        path = os.path.join(self.data_path, pattern)
+        return path.replace("'", "''") if glob.glob(path) else None
+
+    def _register(self):
+        """
+        Creates the views over the files.
+        """
+        scans = []
+        csv_files = self._files("*.csv")
+        if csv_files:
+            types = ", ".join(f"'{column}': '{sql_type}'" for column, sql_type in DETECTION_TYPES.items())
+            scans.append(f"SELECT * FROM read_csv('{csv_files}', header = true, columns = {{{types}}}, "
+                         "filename = true)")
+        parquet_files = self._files("*.parquet")
+        if parquet_files:
+            casts = ", ".join(f'CAST("{column}" AS {sql_type}) AS "{column}"'
+                              for column, sql_type in DETECTION_TYPES.items())
+            scans.append(f"SELECT {casts}, filename FROM read_parquet('{parquet_files}', filename = true)")
+        if not scans:
+            columns = ", ".join(f'CAST(NULL AS {sql_type}) AS "{column}"'
+                                for column, sql_type in DETECTION_TYPES.items())
+            scans.append(f"SELECT {columns}, '' AS filename WHERE false")
+        self._create_view("detections", " UNION ALL BY NAME ".join(f"({scan})" for scan in scans))
+
+        track_files = self._files(os.path.join(TRACKS_DIR, "*.csv"))
+        if track_files:
+            types = ", ".join(f"'{column}': '{sql_type}'" for column, sql_type in TRACK_TYPES.items())
+            self._create_view("tracks", f"SELECT * FROM read_csv('{track_files}', header = true, "
+                                        f"columns = {{{types}}}, filename = true)")
+
+        if os.path.exists(self.mapping_file):
+            # The mapping is small: it is matched to the videos in pandas, with the lookup run.py uses
+            df_mapping = pd.read_csv(self.mapping_file)
+            mapping_index = MappingIndex(df_mapping)
+            videos = sorted({os.path.splitext(os.path.basename(path))[0] for extension in DETECTION_EXTENSIONS
+                             for path in glob.glob(os.path.join(self.data_path, f"*{extension}"))})
+            video_rows = pd.DataFrame({
+                "video": pd.Series(videos, dtype=object),
+                "mapping_row": pd.Series([mapping_index.position(video.rsplit("_", 1)[0]) for video in videos],
+                                         dtype="Int64"),
+            })
+            self.con.register("mapping_df", df_mapping.assign(mapping_row=range(len(df_mapping))))
+            self.con.register("video_rows_df", video_rows)
+            self.con.execute("CREATE TABLE mapping AS SELECT * FROM mapping_df")
+            self.con.execute("CREATE TABLE video_rows AS SELECT * FROM video_rows_df")
+            self.con.unregister("mapping_df")
+            self.con.unregister("video_rows_df")
+
+            # City and country of the detections come from the file name; the mapping copies would clash with them
+            excluded = ", ".join(f'"{column}"' for column in ["mapping_row"] + [
+                column for column in df_mapping.columns if column.lower() in ("city", "country")])
+            self.con.execute(f"""
+                CREATE VIEW detections_mapped AS
+                SELECT d.*, m.* EXCLUDE ({excluded})
+                FROM detections d
+                LEFT JOIN video_rows v ON d.video = v.video
+                LEFT JOIN mapping m ON v.mapping_row = m.mapping_row
+            """)
+        else:
+            logger.warning(f"Mapping file {self.mapping_file} not found, the mapping views are not available.")
+
+    def _create_view(self, name, scan):
+        """
+        Creates a view over a scan of files, adding the video, city and country of every row.
+        """
+        self.con.execute(f"""
+            CREATE VIEW {name} AS
+            SELECT * EXCLUDE (filename, video),
+                   video,
+                   regexp_extract(video, '^(.*)_[^_]*$', 1) AS city,
+                   regexp_extract(video, '_([^_]*)$', 1) AS country
+            FROM (SELECT *, {VIDEO_NAME} AS video FROM ({scan}))
+        """)
+
+    def query(self, sql, params=None):
+        """
+        Runs a query and returns its result.
+
+        Parameters:
+            sql (str): The query, over the views of the class.
+            params (list, optional): Values of the `?` placeholders of the query. Defaults to None.
+
+        Returns:
+            DataFrame: The result.
+        """
+        return self.con.execute(sql, params or []).df()
+
+    def export(self, sql, output_path):
+        """
+        Writes the result of a query straight to a CSV or Parquet file, without holding it in memory.
+
+        Parameters:
+            sql (str): The query.
+            output_path (str): Path of the output; the format follows its extension (`.csv` or `.parquet`).
+        """
+        file_format = "PARQUET" if output_path.endswith(".parquet") else "CSV, HEADER"
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        self.con.execute(f"COPY ({sql}) TO '{output_path}' (FORMAT {file_format})")
+        logger.info(f"Wrote the result of the query to {output_path}.")
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
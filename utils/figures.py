@@ -3,6 +3,7 @@ from custom_logger import CustomLogger
 from logmod import logs
 import warnings
 import os
+import numpy as np
 import pandas as pd
 import shutil
 import plotly as py
@@ -11,6 +12,8 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from collections import defaultdict
 from utils.information import Video_info
+from utils.mapping_index import MappingIndex
+from utils import countries
 
 # Suppress the specific FutureWarning
 warnings.filterwarnings("ignore", category=FutureWarning, module="plotly")
@@ -100,7 +103,9 @@ class Plots():
         Plots a stacked bar graph based on the provided data and configuration.
 
         Parameters:
-            df_mapping (dict): A dictionary mapping categories to their respective DataFrames.
+            final_dict (dict): Object counts of every city.
+            df_mapping (DataFrame or MappingIndex): The mapping table, or its index. Passing the index avoids
+                rebuilding it for every plot.
             order_by (str): Criterion to order the bars, e.g., 'alphabetical' or 'average'.
             title_text (str): The title of the plot.
             filename (str): The name of the file to save the plot as.
@@ -125,6 +130,45 @@ class Plots():
         if message:
             logger.info(message)
 
+        fig, height = self.stack_figure(final_dict, df_mapping, order_by, title_text,
+                                        font_size_captions=font_size_captions,
+                                        x_axis_title_height=x_axis_title_height, legend_x=legend_x,
+                                        legend_y=legend_y, legend_spacing=legend_spacing)
+        self.save_plotly_figure(fig=fig,
+                                filename=filename,
+                                width=1800,
+                                height=height,
+                                scale=SCALE,
+                                save_eps=True,
+                                save_final=True)
+
+    def stack_figure(self, final_dict, df_mapping, order_by, title_text, font_size_captions=40,
+                     x_axis_title_height=110, legend_x=0.92, legend_y=0.015, legend_spacing=0.02):
+        """
+        Builds the stacked bar graph of `stack_plot`.
+
+        The cities are split into two columns. Each column is a single subplot with one bar trace per class, holding
+        the counts of all its cities, and one text trace with the city labels, so the number of traces and axes does
+        not grow with the number of cities. The tick labels of each column are repeated at its bottom by a second
+        x-axis overlaying the first.
+
+        Parameters:
+            final_dict (dict): Object counts of every city.
+            df_mapping (DataFrame or MappingIndex): The mapping table, or its index.
+            order_by (str): 'alphabetical', 'average' or 'continent_average'.
+            title_text (str): The title of the plot.
+            font_size_captions (int, optional): Font size for captions. Default is 40.
+            x_axis_title_height (int, optional): Vertical space for x-axis title. Default is 110.
+            legend_x (float, optional): X position of the legend. Default is 0.92.
+            legend_y (float, optional): Y position of the legend. Default is 0.015.
+            legend_spacing (float, optional): Spacing between legend entries. Default is 0.02.
+
+        Returns:
+            tuple: The figure and its height in pixels.
+        """
+        if not isinstance(df_mapping, MappingIndex):
+            df_mapping = MappingIndex(df_mapping)
+
         keys_of_interest = ["Persons", "Cars", "Cycles", "Motorbikes",
                             "Buses", "Trucks", "Traffic lights"]
 
@@ -174,159 +218,73 @@ class Plots():
         # Determine how many cities will be in each column
         num_cities_per_col = len(cities_ordered) // 2 + len(cities_ordered) % 2  # Split cities into two groups
 
+        # Flag and ISO code labels of all cities, resolved in one batch
+        iso_codes = df_mapping.enrich(cities_ordered, ["ISO"])["ISO"]
+        flags = countries.iso2_to_flag(countries.convert(iso_codes, "iso3", "iso2"))
+        city_labels = {city: flags[city] + " " + city + " " + "(" + iso_codes[city] + ")"  # type: ignore
+                       for city in cities_ordered}
+
         # Define a base height per row and calculate total figure height
         TALL_FIG_HEIGHT = num_cities_per_col * BASE_HEIGHT_PER_ROW
 
+        # One subplot per column; every city is a row of it, at y = its position in the column (top to bottom)
         fig = make_subplots(
-            rows=num_cities_per_col, cols=2,  # Two columns
-            vertical_spacing=0.0005,  # Reduce the vertical spacing
+            rows=1, cols=2,  # Two columns
             horizontal_spacing=0.01,  # Reduce horizontal spacing between columns
-            row_heights=[1.0] * (num_cities_per_col),
         )
 
+        # Counts of every city (rows) and key (columns), in plotting order
+        values = np.array([[final_dict[city].get(k, 0) for k in keys_of_interest] for city in cities_ordered],
+                          dtype=float).reshape(len(cities_ordered), len(keys_of_interest))
+        totals = values.sum(axis=1)
+        y_labels = [f'{city_labels[city]} {int(total)}' for city, total in zip(cities_ordered, totals)]
+
         # Create key-to-colour mapping (add near start of stack_plot):
         key_to_colour = {k: bar_colours[i] for i, k in enumerate(keys_of_interest)}
 
-        # Plot left column (first half of cities)
-        for i, city in enumerate(cities_ordered[:num_cities_per_col]):
-
-            iso_code = self.info.get_value(df_mapping, "City", city, None, None, "ISO")
-
-            # build up textual label for left column
-            city_label = self.info.iso2_to_flag(self.info.iso3_to_iso2(
-                iso_code)) + " " + city + " " + "(" + iso_code + ")"  # type: ignore
-
-            # Row for day and night
-            row = i + 1
-
-            # Sum of all keys of interest for this city
-            total_value = sum(final_dict[city].get(k, 0) for k in keys_of_interest)
-            y_label = f'{city_label} {int(total_value)}'
-
-            # Add a bar for each key, stacking them
-            cumulative = 0
-            for key in keys_of_interest:
-                value = final_dict[city].get(key, 0)
-                if value > 0:
-                    fig.add_trace(go.Bar(
-                        x=[value], y=[y_label], orientation='h',
-                        name=f"{key.title()}",
-                        marker=dict(color=key_to_colour[key]),
-                        text=[f"{int(value)}"],
-                        textposition='inside',
-                        showlegend=(i == 0),
-                        textfont=dict(size=14, color='white'),
-                    ), row=row, col=1)
-                    cumulative += value
-
-            # Add city label at the end of the bar
-            fig.add_annotation(
-                x=cumulative + 0.5,
-                y=y_label,
-                text=y_label,
-                showarrow=False,
-                font=dict(size=14, color="black"),
-                xanchor="left",
-                yanchor="middle",
-                row=row,
-                col=1
-            )
-
-        for i, city in enumerate(cities_ordered[num_cities_per_col:]):
-            # parts = city_country.split("_")
-            # city = "_".join(parts[:-1])
-
-            iso_code = self.info.get_value(df_mapping, "City", city, None, None, "ISO")
-
-            # build up textual label for left column
-            city_label = self.info.iso2_to_flag(self.info.iso3_to_iso2(
-                iso_code)) + " " + city + " " + "(" + iso_code + ")"  # type: ignore
-            row = i + 1
-
-            # Sum of all keys of interest for this city
-            total_value = sum(final_dict[city].get(k, 0) for k in keys_of_interest)
-            y_label = f'{city_label} {int(total_value)}'
-
-            # Add a bar for each key, stacking them
-            cumulative = 0
-            for key in keys_of_interest:
-                value = final_dict[city].get(key, 0)
-                if value > 0:
-                    fig.add_trace(go.Bar(
-                        x=[value], y=[y_label], orientation='h',
-                        name=f"{key.title()}",
-                        marker=dict(color=key_to_colour[key]),
-                        text=[f"{int(value)}"],
-                        textposition='inside',
-                        showlegend=(i == 0),
-                        textfont=dict(size=14, color='white'),
-                    ), row=row, col=2)
-                    cumulative += value
-
-            # Add city label at the end of the bar
-            fig.add_annotation(
-                x=cumulative + 0.5,
-                y=y_label,
-                text=y_label,
-                showarrow=False,
-                font=dict(size=14, color="black"),
-                xanchor="left",
-                yanchor="middle",
-                row=row,
-                col=2
-            )
-
-        max_value = max(
-            sum(final_dict[city].get(k, 0) for k in keys_of_interest)
-            for city in cities_ordered
-        ) if cities_ordered else 0
+        # Left column (first half of cities), then right column
+        for col, rows in ((1, slice(0, num_cities_per_col)), (2, slice(num_cities_per_col, None))):
+            column_values = values[rows]
+            positions = np.arange(len(column_values))
+            labels = y_labels[rows]
+            if not len(column_values):
+                continue
+
+            # One bar trace per key for all cities of the column, stacking them; zero counts draw nothing
+            for k, key in enumerate(keys_of_interest):
+                fig.add_trace(go.Bar(
+                    x=column_values[:, k], y=positions, orientation='h',
+                    name=f"{key.title()}",
+                    marker=dict(color=key_to_colour[key]),
+                    text=[f"{int(value)}" if value > 0 else "" for value in column_values[:, k]],
+                    textposition='inside',
+                    showlegend=(col == 1),
+                    textfont=dict(size=14, color='white'),
+                    width=0.8,  # leave a gap between the cities
+                    hovertext=labels,
+                ), row=1, col=col)
+
+            # Add city labels at the end of the bars, as one text trace
+            fig.add_trace(go.Scatter(
+                x=totals[rows] + 0.5, y=positions, mode='text',
+                text=labels,
+                textposition='middle right',
+                textfont=dict(size=14, color="black"),
+                cliponaxis=False,
+                showlegend=False,
+                hoverinfo='skip',
+            ), row=1, col=col)
+
+        max_value = totals.max() if len(totals) else 0
         max_value += 15
 
-        # Identify the last row for each column where the last city is plotted
-        last_row_left_column = num_cities_per_col * 2  # The last row in the left column
-        last_row_right_column = (len(cities_ordered) - num_cities_per_col) * 2  # The last row in the right column
-        first_row_left_column = 1  # The first row in the left column
-        first_row_right_column = 1  # The first row in the right column
-
-        # Update the loop for updating x-axes based on max values for speed and time
-        for i in range(1, num_cities_per_col * 2 + 1):  # Loop through all rows in both columns
-            # Update x-axis for the left column
-            if i % 2 == 1:  # Odd rows
-                fig.update_xaxes(
-                    range=[0, max_value],
-                    row=i,
-                    col=1,
-                    showticklabels=(i == first_row_left_column),
-                    side='top', showgrid=False
-                )
-            else:  # Even rows (representing time)
-                fig.update_xaxes(
-                    range=[0, max_value],
-                    row=i,
-                    col=1,
-                    showticklabels=(i == last_row_left_column),
-                    side='bottom', showgrid=False
-                )
+        # Every row of both columns is one city slot, the first city at the top
+        fig.update_yaxes(range=[num_cities_per_col - 0.5, -0.5])
 
-            # Update x-axis for the right column
-            if i % 2 == 1:  # Odd rows
-                fig.update_xaxes(
-                    range=[0, max_value],
-                    row=i,
-                    col=2,  # Use speed max value for top axis
-                    showticklabels=(i == first_row_right_column),
-                    side='top', showgrid=False
-                )
-            else:  # Even rows (representing time)
-                fig.update_xaxes(
-                    range=[0, max_value],
-                    row=i,
-                    col=2,  # Use time max value for bottom axis
-                    showticklabels=(i == last_row_right_column),
-                    side='bottom', showgrid=False
-                )
+        # The tick labels of the x-axes are shown at the top
+        fig.update_xaxes(range=[0, max_value], side='top', showgrid=False)
 
-        # Set the x-axis labels (title_text) only for the last row and the first row
+        # Set the x-axis labels (title_text) at the top of both columns
         fig.update_xaxes(
             title=dict(text=title_text,
                        font=dict(size=font_size_captions)),
@@ -335,21 +293,25 @@ class Plots():
             ticklen=10,
             tickwidth=2,
             tickcolor='black',
-            row=1,
-            col=1
         )
 
-        fig.update_xaxes(
-            title=dict(text=title_text,
-                       font=dict(size=font_size_captions)),
-            tickfont=dict(size=font_size_captions),
-            ticks='outside',
-            ticklen=10,
-            tickwidth=2,
-            tickcolor='black',
-            row=1,
-            col=2
-        )
+        # Repeat the tick labels at the bottom of both columns, on x-axes 'x3' and 'x4' overlaying 'x' and 'x2'. An
+        # empty trace on each makes sure the axis is drawn
+        for xaxis, yaxis, overlaying in (("xaxis3", "y", "x"), ("xaxis4", "y2", "x2")):
+            fig.update_layout({xaxis: dict(
+                overlaying=overlaying,
+                anchor=yaxis,
+                range=[0, max_value],
+                side='bottom',
+                showgrid=False,
+                tickfont=dict(size=font_size_captions),
+                ticks='outside',
+                ticklen=10,
+                tickwidth=2,
+                tickcolor='black',
+            )})
+            fig.add_trace(go.Scatter(x=[], y=[], xaxis=xaxis.replace("axis", ""), yaxis=yaxis, showlegend=False,
+                                     hoverinfo='skip'))
 
         # Update both y-axes (for left and right columns) to hide the tick labels
         fig.update_yaxes(showticklabels=False)
@@ -377,32 +339,22 @@ class Plots():
         # Generate gridline positions
         x_grid_values = [start + i * step for i in range(count)]
 
-        for x in x_grid_values:
-            fig.add_shape(
+        # Gridlines of both columns (x-axes 'x' and 'x2'), set at once: every `add_shape` validates all shapes
+        # already in the layout again
+        shapes = [
+            dict(
                 type="line",
                 x0=x,
                 y0=0,
                 x1=x,
                 y1=1,  # Set the position of the gridlines
-                xref='x',
+                xref=xref,
                 yref='paper',  # Ensure gridlines span the whole chart (yref='paper' spans full height)
                 line=dict(color="darkgray", width=1),  # Customize the appearance of the gridlines
                 layer="above"  # Draw the gridlines above the bars
             )
-
-        # Manually add gridlines using `shapes` for the right column (x-axis 'x2')
-        for x in x_grid_values:
-            fig.add_shape(
-                type="line",
-                x0=x,
-                y0=0,
-                x1=x,
-                y1=1,  # Set the position of the gridlines
-                xref='x2',
-                yref='paper',  # Apply to right column (x-axis 'x2')
-                line=dict(color="darkgray", width=1),  # Customize the appearance of the gridlines
-                layer="above"  # Draw the gridlines above the bars
-            )
+            for xref in ('x', 'x2') for x in x_grid_values
+        ]
 
         legend_items = [
             {"name": key.capitalize(), "color": bar_colours[i]}
@@ -418,7 +370,7 @@ class Plots():
                                              font_size=font_size_captions)
 
         # Add a box around the first column (left side)
-        fig.add_shape(
+        shapes.append(dict(
             type="rect",
             xref="paper",
             yref="paper",
@@ -427,10 +379,10 @@ class Plots():
             x1=0.495,
             y1=0.0,
             line=dict(color="black", width=2)  # Black border for the box
-        )
+        ))
 
         # Add a box around the second column (right side)
-        fig.add_shape(
+        shapes.append(dict(
             type="rect",
             xref="paper",
             yref="paper",
@@ -439,7 +391,8 @@ class Plots():
             x1=1,
             y1=0.0,
             line=dict(color="black", width=2)  # Black border for the box
-        )
+        ))
+        fig.update_layout(shapes=shapes)
 
         fig.update_yaxes(
             tickfont=dict(size=TEXT_SIZE, color="black"),
@@ -455,13 +408,7 @@ class Plots():
 
         # Final adjustments and display
         fig.update_layout(margin=dict(l=80, r=80, t=x_axis_title_height, b=10))
-        self.save_plotly_figure(fig=fig,
-                                filename=filename,
-                                width=1800,
-                                height=TALL_FIG_HEIGHT,
-                                scale=SCALE,
-                                save_eps=True,
-                                save_final=True)
+        return fig, TALL_FIG_HEIGHT
 
     def plot_choropleth(self, data_dict, value_key=None, title_text=None, filename=None):
         """
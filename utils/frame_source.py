@@ -0,0 +1,230 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import queue
+import threading
+import time
+import cv2
+import common
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+# Consts
+PUT_TIMEOUT = 0.1  # seconds the decoder waits on a full queue before checking whether it was stopped
+
+
+class Frame_prefetcher:
+    """
+    Decodes the frames of a video on a background thread, ahead of the consumer.
+
+    The decoder thread pushes frames into a bounded queue while the caller runs inference on earlier frames, so
+    decoding and inference overlap. The class mimics the parts of `cv2.VideoCapture` used by the tracking loops
+    (`read`, `isOpened`, `get`, `release`). With a queue depth of 0 frames are decoded synchronously in `read`.
+
+    With a stride above 1 only every stride-th frame is returned. The frames in between are skipped with
+    `grab()`, so they are never converted to images, but they are still decoded: every frame depends on the ones
+    before it back to the last keyframe. Seeking to the next analysed frame would decode from that keyframe again,
+    which is slower unless the stride is longer than the keyframe interval.
+
+    Queue occupancy is sampled on every read. When the consumer often finds the queue empty, inference is waiting
+    on the decoder and the run is decode-bound; when the decoder often finds the queue full, the run is
+    inference-bound.
+    """
+
+    def __init__(self, input_video_path, queue_depth=0, stride=1, start_frame=0):
+        """
+        Opens the video and starts the decoder thread.
+
+        Parameters:
+            input_video_path (str): Path to the input video.
+            queue_depth (int, optional): Maximum number of decoded frames waiting in the queue. 0 disables the
+                background thread. Defaults to 0.
+            stride (int, optional): Return every stride-th frame, starting with the first one. Defaults to 1.
+            start_frame (int, optional): Number of frames already processed. Reading continues with frame
+                `start_frame + stride`, as if the frames up to `start_frame` had just been read. Defaults to 0.
+
+        Instance Variables:
+            self.frame_index (int): 1-based position in the video of the frame last returned by `read`.
+        """
+        self.input_video_path = input_video_path
+        self.queue_depth = queue_depth
+        self.stride = max(1, int(stride))
+        self.cap = cv2.VideoCapture(input_video_path)
+        self.frame_index = 0
+        self._decoded = 0  # frames consumed from the video so far, including skipped ones
+        if start_frame > 0:
+            self._seek(start_frame)
+
+        # Statistics
+        self.frames_read = 0
+        self.occupancy_sum = 0  # sum of the queue sizes seen by the consumer
+        self.consumer_waits = 0  # reads that found the queue empty
+        self.consumer_wait_time = 0.0
+        self.producer_waits = 0  # frames the decoder could not queue straight away
+        self.producer_wait_time = 0.0
+
+        self._finished = False
+        self._stop = threading.Event()
+        self._thread = None
+        if queue_depth > 0:
+            self._queue = queue.Queue(maxsize=queue_depth)
+            self._thread = threading.Thread(target=self._decode, name="frame-prefetcher", daemon=True)
+            self._thread.start()
+
+    def _seek(self, frame_index):
+        """
+        Positions the video after the first `frame_index` frames.
+
+        Falls back to grabbing the frames one by one if the container does not support accurate seeking.
+        """
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        if int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) != frame_index:
+            logger.warning(f"Seeking is not accurate in {self.input_video_path}, skipping {frame_index} frames.")
+            self.cap.release()
+            self.cap = cv2.VideoCapture(self.input_video_path)
+            for _ in range(frame_index):
+                if not self.cap.grab():
+                    break
+        self._decoded = frame_index
+        self.frame_index = frame_index
+
+    def _decode(self):
+        """
+        Decoder thread: reads frames and queues them until the video ends or the prefetcher is released.
+        """
+        while not self._stop.is_set():
+            item = self._next_frame()
+            if not self._put(item) or not item[0]:
+                break
+
+    def _next_frame(self):
+        """
+        Skips to the next frame on the stride and converts it to an image.
+
+        Returns:
+            tuple: (success, frame, frame_index).
+        """
+        if self._decoded > 0:
+            for _ in range(self.stride - 1):
+                if not self.cap.grab():
+                    return False, None, self._decoded
+                self._decoded += 1
+        success, frame = self.cap.read()
+        if success:
+            self._decoded += 1
+        return success, frame, self._decoded
+
+    def _put(self, item):
+        """
+        Queues an item, waiting while the queue is full.
+
+        Returns:
+            bool: False if the prefetcher was released before the item could be queued.
+        """
+        if self._queue.full():
+            self.producer_waits += 1
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=PUT_TIMEOUT)
+                self.producer_wait_time += time.perf_counter() - start
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def isOpened(self):
+        """
+        Returns True while frames can still be read.
+        """
+        return self.cap.isOpened() and not self._finished
+
+    def get(self, prop_id):
+        """
+        Returns a property of the underlying `cv2.VideoCapture`.
+        """
+        return self.cap.get(prop_id)
+
+    def read(self):
+        """
+        Returns the next frame of the video.
+
+        Returns:
+            tuple: (success, frame), as returned by `cv2.VideoCapture.read`.
+        """
+        if self._finished:
+            return False, None
+        if self._thread is None:
+            success, frame, frame_index = self._next_frame()
+        else:
+            size = self._queue.qsize()
+            self.occupancy_sum += size
+            if size == 0:
+                self.consumer_waits += 1
+            start = time.perf_counter()
+            success, frame, frame_index = self._queue.get()
+            self.consumer_wait_time += time.perf_counter() - start
+
+        if success:
+            self.frames_read += 1
+            self.frame_index = frame_index
+        else:
+            self._finished = True
+        return success, frame
+
+    def stats(self):
+        """
+        Summarises the queue occupancy seen during the run.
+
+        Returns:
+            dict: A dictionary containing:
+                - frames (int): Number of frames read.
+                - queue_depth (int): Configured queue depth.
+                - mean_occupancy (float): Average number of queued frames found by the consumer.
+                - consumer_waits (int): Reads that found the queue empty.
+                - consumer_wait_s (float): Seconds the consumer spent waiting for frames.
+                - producer_waits (int): Frames the decoder had to hold back because the queue was full.
+                - producer_wait_s (float): Seconds the decoder spent waiting for free space.
+                - bound (str): 'decode', 'inference' or 'unknown' if prefetching is disabled.
+        """
+        reads = max(self.frames_read, 1)
+        if self._thread is None:
+            bound = "unknown"
+        elif self.consumer_wait_time > self.producer_wait_time:
+            bound = "decode"
+        else:
+            bound = "inference"
+        return {
+            "frames": self.frames_read,
+            "queue_depth": self.queue_depth,
+            "mean_occupancy": round(self.occupancy_sum / reads, 2),
+            "consumer_waits": self.consumer_waits,
+            "consumer_wait_s": round(self.consumer_wait_time, 2),
+            "producer_waits": self.producer_waits,
+            "producer_wait_s": round(self.producer_wait_time, 2),
+            "bound": bound,
+        }
+
+    def log_stats(self):
+        """
+        Logs the queue occupancy statistics of the run.
+        """
+        if self._thread is None:
+            return
+        stats = self.stats()
+        logger.info(f"Prefetch queue for {self.input_video_path}: mean occupancy {stats['mean_occupancy']}/"
+                    f"{stats['queue_depth']} over {stats['frames']} frames; inference waited "
+                    f"{stats['consumer_wait_s']} s for frames ({stats['consumer_waits']} times), decoder waited "
+                    f"{stats['producer_wait_s']} s for space ({stats['producer_waits']} times). "
+                    f"The run is {stats['bound']}-bound.")
+
+    def release(self):
+        """
+        Stops the decoder thread and releases the video.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.cap.release()
+        self._finished = True
@@ -0,0 +1,163 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import os
+import cv2
+import pandas as pd
+import common
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+# Consts
+FRAME_STATS_DIR = "frame_stats"  # per-frame image statistics, next to the detection files
+FRAME_STATS_COLUMNS = ["Frame Count", "Brightness", "Contrast", "Sharpness"]
+
+
+class Frame_consumer:
+    """
+    Base class of the consumers of a `Frame_tap`.
+
+    A consumer is registered once and then sees every frame the tap decodes. Consumers are called in the order
+    they were registered and share a per-frame `state` dictionary, so a consumer can use what an earlier one
+    computed for the same frame (e.g. the detections of the frame) without computing it again.
+    """
+
+    def on_frame(self, frame_index, frame, state):
+        """
+        Processes a frame. The frame is shared between the consumers and must not be modified.
+
+        Parameters:
+            frame_index (int): 1-based position of the frame in the video.
+            frame (np.ndarray): The decoded BGR frame.
+            state (dict): Results of the earlier consumers for this frame; a consumer may add its own.
+
+        Returns:
+            bool: False to stop the tap after this frame; any other value continues.
+        """
+        return True
+
+    def close(self):
+        """
+        Called once after the last frame, in the order the consumers were registered.
+        """
+
+
+class Frame_tap:
+    """
+    Decodes a video once and feeds every frame to all registered consumers.
+
+    Detection, image writers, snapshots and per-frame statistics register on the same tap, so adding an analysis
+    of the frames does not add a decode of the video.
+    """
+
+    def __init__(self, cap):
+        """
+        Parameters:
+            cap (Frame_prefetcher): Source of the frames, already positioned at the first frame to process.
+        """
+        self.cap = cap
+        self.consumers = []
+
+    def register(self, consumer):
+        """
+        Adds a consumer, called after the ones already registered. Returns the consumer.
+        """
+        self.consumers.append(consumer)
+        return consumer
+
+    def run(self):
+        """
+        Reads the video to its end, or until a consumer stops it, and then closes the consumers.
+
+        If a consumer raises, the others are not closed, so outputs such as checkpoints are left as they were
+        when the error happened. The video is released in any case, so its decoder thread and file handle do not
+        outlive the run.
+
+        Returns:
+            int: Number of frames fed to the consumers.
+        """
+        frames = 0
+        running = True
+        try:
+            while running and self.cap.isOpened():
+                success, frame = self.cap.read()
+                if not success:
+                    break
+                frames += 1
+                state = {}
+                for consumer in self.consumers:
+                    if consumer.on_frame(self.cap.frame_index, frame, state) is False:
+                        running = False
+                        break
+
+            for consumer in self.consumers:
+                consumer.close()
+        finally:
+            self.cap.release()
+        return frames
+
+
+class Snapshot_writer(Frame_consumer):
+    """
+    Saves one frame of the video as an image, as `VideoFrameExtractor` does for the first frame.
+    """
+
+    def __init__(self, snap_path, frame_index=1):
+        """
+        Parameters:
+            snap_path (str): Path of the image.
+            frame_index (int, optional): 1-based position of the frame to save. Defaults to the first frame.
+        """
+        self.snap_path = snap_path
+        self.frame_index = frame_index
+
+    def on_frame(self, frame_index, frame, state):
+        if frame_index == self.frame_index:
+            os.makedirs(os.path.dirname(self.snap_path) or ".", exist_ok=True)
+            cv2.imwrite(self.snap_path, frame)
+            logger.info(f"Saved frame {frame_index} as {self.snap_path}")
+
+
+class Frame_statistics(Frame_consumer):
+    """
+    Collects image statistics of every frame and writes them to a CSV file: mean brightness and contrast
+    (standard deviation) of the grey image, and sharpness as the variance of its Laplacian.
+
+    Rows are appended to the CSV on every `flush`, which checkpoints call together with the detection buffer, so a
+    resumed run continues the file of the interrupted one.
+    """
+
+    def __init__(self, output_path, append=False):
+        """
+        Parameters:
+            output_path (str): Path of the CSV file.
+            append (bool, optional): Add the rows to an existing file, when a run continues from a checkpoint.
+                Otherwise the file is replaced on the first flush. Defaults to False.
+        """
+        self.output_path = output_path
+        self.append = append
+        self.rows = []
+
+    def on_frame(self, frame_index, frame, state):
+        grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        mean, std = cv2.meanStdDev(grey)
+        _, laplacian_std = cv2.meanStdDev(cv2.Laplacian(grey, cv2.CV_32F))
+        self.rows.append((frame_index, float(mean[0, 0]), float(std[0, 0]), float(laplacian_std[0, 0]) ** 2))
+
+    def flush(self):
+        """
+        Appends the collected rows to the CSV file and empties the buffer. The header is written when the file is
+        created, so a video without frames still yields a header-only file.
+        """
+        exists = self.append and os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0
+        if not self.rows and exists:
+            return
+        os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+        pd.DataFrame(self.rows, columns=FRAME_STATS_COLUMNS).to_csv(self.output_path, mode="a" if exists else "w",
+                                                                    header=not exists, index=False)
+        self.rows = []
+        self.append = True
+
+    def close(self):
+        self.flush()
@@ -1,8 +1,20 @@
 import cv2
+import math
 import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import common
 from custom_logger import CustomLogger
 from logmod import logs
+from utils.video_metadata import Video_metadata
+
+try:
+    import av
+except ImportError:  # without PyAV the frames of the contact sheets are grabbed with OpenCV
+    av = None
+
+# Consts
+SHEET_SUFFIX = "_sheet"  # contact sheets are saved as <video>_sheet.png next to the first frame
 
 
 class VideoFrameExtractor:
@@ -12,6 +24,8 @@ class VideoFrameExtractor:
         self.logger = CustomLogger(__name__)
         self.input_folder = common.get_configs("videos")
         self.output_folder = common.get_configs("snaps")
+        self.sheet_frames = common.get_configs("snap_sheet_frames")
+        self.workers = common.get_configs("video_workers")
         self.video_extensions = ('.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm')
         self._create_output_folder()
 
@@ -21,6 +35,11 @@ class VideoFrameExtractor:
             os.makedirs(self.output_folder)
             self.logger.info(f"Created output folder: {self.output_folder}")
 
+    @staticmethod
+    def is_up_to_date(video_path, snap_path):
+        """Check whether a snapshot exists and is newer than its video."""
+        return os.path.exists(snap_path) and os.path.getmtime(snap_path) >= os.path.getmtime(video_path)
+
     def extract_first_frame(self, filename):
         """Extract and save the first frame of a given video file."""
         video_path = os.path.join(self.input_folder, filename)
@@ -35,11 +54,111 @@ class VideoFrameExtractor:
             self.logger.error(f"Could not read {filename}")
         cap.release()
 
+    @staticmethod
+    def grab_frames(video_path, timestamps):
+        """
+        Grab the frames of a video at the given times (in seconds), as BGR arrays.
+
+        With PyAV every grab seeks to the keyframe at or before its time and decodes only that frame, so a frame
+        late in a long video costs as much as the first one. OpenCV, used without PyAV, decodes up to the exact
+        frame after its seek instead. Times that cannot be read are left out.
+        """
+        frames = []
+        if av is not None:
+            with av.open(video_path) as container:
+                stream = container.streams.video[0]
+                start = stream.start_time or 0
+                for timestamp in timestamps:
+                    container.seek(start + int(timestamp / stream.time_base), stream=stream, backward=True,
+                                   any_frame=False)
+                    frame = next(container.decode(stream), None)
+                    if frame is not None:
+                        frames.append(frame.to_ndarray(format="bgr24"))
+            return frames
+
+        cap = cv2.VideoCapture(video_path)
+        for timestamp in timestamps:
+            cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+            success, frame = cap.read()
+            if success:
+                frames.append(frame)
+        cap.release()
+        return frames
+
+    @staticmethod
+    def contact_sheet(frames, columns=None):
+        """Tile frames of the same size into a grid, row by row; empty cells are left black."""
+        columns = columns or math.ceil(math.sqrt(len(frames)))
+        rows = math.ceil(len(frames) / columns)
+        height, width = frames[0].shape[:2]
+        sheet = np.zeros((rows * height, columns * width, 3), dtype=np.uint8)
+        for i, frame in enumerate(frames):
+            if frame.shape[:2] != (height, width):
+                frame = cv2.resize(frame, (width, height))
+            row, column = divmod(i, columns)
+            sheet[row * height:(row + 1) * height, column * width:(column + 1) * width] = frame
+        return sheet
+
+    def process_video(self, filename, info):
+        """Save the snapshots of a video that are missing or older than it; return whether any was written."""
+        video_path = os.path.join(self.input_folder, filename)
+        name = os.path.splitext(filename)[0]
+        snap_path = os.path.join(self.output_folder, name + ".png")
+        sheet_path = os.path.join(self.output_folder, name + SHEET_SUFFIX + ".png")
+        snap_stale = not self.is_up_to_date(video_path, snap_path)
+        sheet_stale = self.sheet_frames > 1 and not self.is_up_to_date(video_path, sheet_path)
+        if not snap_stale and not sheet_stale:
+            return False
+
+        if not sheet_stale:
+            self.extract_first_frame(filename)
+            return True
+
+        # Evenly spaced frames, starting with the first one, which is also the first-frame snapshot
+        duration = info.get('duration') if info else 0
+        timestamps = [duration * i / self.sheet_frames for i in range(self.sheet_frames)] if duration else [0]
+        frames = self.grab_frames(video_path, timestamps)
+        if not frames:
+            self.logger.error(f"Could not read {filename}")
+            return False
+        if snap_stale:
+            cv2.imwrite(snap_path, frames[0])
+            self.logger.info(f"Saved first frame of {filename} as {os.path.basename(snap_path)}")
+        cv2.imwrite(sheet_path, self.contact_sheet(frames))
+        self.logger.info(f"Saved contact sheet of {len(frames)} frames of {filename} as "
+                         f"{os.path.basename(sheet_path)}")
+        return True
+
     def process_all_videos(self):
-        """Process all supported video files in the input folder."""
-        for filename in os.listdir(self.input_folder):
-            if filename.lower().endswith(self.video_extensions):
-                self.extract_first_frame(filename)
+        """
+        Process all supported video files in the input folder, skipping the ones without a video stream.
+
+        Snapshots that are newer than their video are kept, so a re-run only extracts frames of new or changed
+        videos. The videos are processed by `video_workers` threads.
+        """
+        filenames = sorted(filename for filename in os.listdir(self.input_folder)
+                           if filename.lower().endswith(self.video_extensions))
+        # The headers of all videos are read in one batch, without opening a decoder per file
+        metadata = Video_metadata.probe_many(os.path.join(self.input_folder, filename) for filename in filenames)
+        pending = []
+        for filename in filenames:
+            info = metadata[os.path.join(self.input_folder, filename)]
+            if info is not None and not info.get('video_codec'):
+                self.logger.warning(f"Skipping {filename}: no video stream")
+                continue
+            pending.append((filename, info))
+
+        def process(item):
+            try:
+                return self.process_video(*item)
+            except Exception as e:
+                self.logger.error(f"Could not extract the snapshots of {item[0]}: {e}")
+                return False
+
+        workers = min(self.workers or os.cpu_count() or 1, max(len(pending), 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            written = sum(executor.map(process, pending))
+        self.logger.info(f"Snapshots: {written} videos extracted, {len(pending) - written} up to date or unreadable")
 
 
 if __name__ == "__main__":
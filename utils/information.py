@@ -4,17 +4,24 @@ from logmod import logs
 import os
 import statistics
 import pandas as pd
-import pycountry
-import subprocess
-import json
-import unicodedata
+import time
+from concurrent.futures import ThreadPoolExecutor
 from utils.sound import Video_sound
-import numpy as np
+from utils.video_metadata import Video_metadata
+from utils import countries
+from utils.mapping_index import MappingIndex, normalise_str, strip_accents
 
 logs(show_level=common.get_configs("logger_level"), show_color=True)
 logger = CustomLogger(__name__)  # use custom logger
 sound_class = Video_sound()
 
+# Consts
+AUDIO_VERSION = 2  # version of the cached audio features; 2 moved the series and peak to absolute dBFS
+LEGACY_AUDIO_KINDS = ("loudness",)  # cache kinds of earlier audio summaries, replaced by "audio"
+
+video_workers = common.get_configs("video_workers")
+sound_thresholds = common.get_configs("sound_thresholds")
+
 
 class Video_info:
     def __init__(self) -> None:
@@ -33,7 +40,7 @@ class Video_info:
         """
         return round(size / (1024 * 1024), 2)
 
-    def analyse_video_files(self, folder_path, video_extensions=None):
+    def analyse_video_files(self, folder_path, video_extensions=None, cache=None):
         """
         Analyzes video files in a given folder, returning the average file size (MB),
         standard deviation of file sizes (MB), the file with the maximum size,
@@ -43,15 +50,25 @@ class Video_info:
             folder_path (str): Path to the folder to scan.
             video_extensions (tuple, optional): File extensions to consider as videos.
                 Defaults to common video formats.
+            cache (Summary_cache, optional): Cache of the audio features of every video, so only new or changed
+                videos are decoded. Defaults to None (no caching).
+
+        The videos are probed and their audio decoded by `video_workers` threads; the information of every video is
+        logged and the results are returned in file name order. A video that fails is logged and does not stop
+        the others.
+
+        The average size of the videos and its standard deviation, the largest and smallest videos, and the loudest
+        and quietest videos are logged.
 
         Returns:
-            dict: A dictionary containing:
-                - average_size_MB (float)
-                - std_dev_size_MB (float)
-                - max_size_file (str)
-                - max_size_MB (float)
-                - min_size_file (str)
-                - min_size_MB (float)
+            dict: Audio features of every video, keyed by its name without extension (None if they could not be
+                computed):
+                - sound (float): RMS loudness of the whole track relative to its own peak, in dB, as before.
+                - sound_rms (float): RMS loudness of the whole track in absolute dBFS.
+                - sound_peak (float): Peak level in absolute dBFS.
+                - sound_series (np.ndarray): RMS loudness of every second in absolute dBFS.
+                - sound_above_<threshold> (float): Share of the seconds louder than every `sound_thresholds` value,
+                  in absolute dBFS.
         """
         if video_extensions is None:
             # Common video file extensions
@@ -60,22 +77,32 @@ class Video_info:
         files_info = []
         db_results = {}
 
-        # List all files in the directory and check if they are video files
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith(video_extensions):
-                full_path = os.path.join(folder_path, filename)
-                info = self.get_video_info(full_path)
+        # List all video files in the directory, in name order so the results do not depend on the file system
+        filenames = sorted(filename for filename in os.listdir(folder_path)
+                           if filename.lower().endswith(video_extensions))
+
+        # Probe the videos and decode their audio concurrently; both release the GIL or run in subprocesses
+        workers = min(video_workers or os.cpu_count() or 1, max(len(filenames), 1))
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda filename: self.analyse_video_file(
+                os.path.join(folder_path, filename), cache=cache), filenames))
+        logger.debug(f"Analysed {len(filenames)} videos in {time.perf_counter() - start:.2f} s "
+                     f"with {workers} thread(s).")
+
+        for filename, (info, size, features) in zip(filenames, results):
+            if info is not None:
                 self.print_video_info(info)
-                if os.path.isfile(full_path):
-                    size = os.path.getsize(full_path)
-                    files_info.append((filename, size))
-                    try:
-                        name_without_ext, _ = os.path.splitext(filename)
-                        db = sound_class.audio_db_from_video(full_path)
-                        db_results[name_without_ext] = float(db) if isinstance(db, np.floating) else db
-                    except Exception:
-                        name_without_ext, _ = os.path.splitext(filename)
-                        db_results[name_without_ext] = None  # or log the error
+            if size is not None:
+                files_info.append((filename, size))
+                name_without_ext, _ = os.path.splitext(filename)
+                db_results[name_without_ext] = features
+
+        if cache is not None:
+            cache.prune("audio", folder_path)
+            for kind in LEGACY_AUDIO_KINDS:
+                cache.drop(kind)
+            cache.save()
 
         if not files_info:
             logger.info("No video files found in folder: %s", folder_path)
@@ -92,7 +119,7 @@ class Video_info:
         logger.info(f"The largest video file is '{max_file}' with size {Video_info.convert_to_mb(max_size)} MB.")
         logger.info(f"The smallest video file is '{min_file}' with size {Video_info.convert_to_mb(min_size)} MB.")
 
-        valid_db_results = {k: v for k, v in db_results.items() if v is not None}
+        valid_db_results = {k: v["sound"] for k, v in db_results.items() if v is not None}
         if valid_db_results:
             max_db_file = max(valid_db_results, key=valid_db_results.get)  # type: ignore
             min_db_file = min(valid_db_results, key=valid_db_results.get)  # type: ignore
@@ -106,6 +133,50 @@ class Video_info:
 
         return db_results
 
+    def analyse_video_file(self, video_path, cache=None):
+        """
+        Probes a video and computes the features of its audio track. Errors are logged and do not propagate, so
+        one broken file does not stop the analysis of the others.
+
+        Args:
+            video_path (str): Path to the video.
+            cache (Summary_cache, optional): Cache of the audio features of every video. Defaults to None (no
+                caching).
+
+        Returns:
+            tuple: Information from `get_video_info` (None if probing failed), size of the file in bytes (None if
+                it is not a file) and audio features as returned by `analyse_video_files` (None if they could not
+                be computed).
+        """
+        info = None
+        try:
+            info = self.get_video_info(video_path)
+        except Exception as e:
+            logger.warning(f"Could not probe {video_path}: {e}.")
+
+        if not os.path.isfile(video_path):
+            return info, None, None
+        size = os.path.getsize(video_path)
+        try:
+            # The thresholds are applied after the cache, so changing them does not decode the videos again
+            if cache is not None:
+                audio = cache.get("audio", video_path, sound_class.audio_features_from_video, version=AUDIO_VERSION)
+            else:
+                audio = sound_class.audio_features_from_video(video_path)
+        except Exception as e:
+            logger.debug(f"Could not compute the audio features of {video_path}: {e}.")
+            return info, size, None
+
+        features = {
+            "sound": float(audio["db"]),
+            "sound_rms": float(audio["rms_db"]),
+            "sound_peak": float(audio["peak_db"]),
+            "sound_series": audio["series"],
+        }
+        for threshold, share in Video_sound.time_above(audio["series"], sound_thresholds).items():
+            features[f"sound_above_{threshold}"] = share
+        return info, size, features
+
     def video_processing_time_stats(self, df):
         """
         Calculate statistics related to video processing times from a DataFrame.
@@ -150,49 +221,10 @@ class Video_info:
         logger.info(f"The city with the shortest processing time is '{min_row['City']}' with {min_row['Video processing time (in s)']:.2f} seconds.")  # noqa:E501
 
     def get_video_info(self, video_path):
-        cmd = [
-            'ffprobe',
-            '-v', 'error',
-            '-show_entries', 'format:stream',
-            '-of', 'json',
-            video_path
-        ]
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        info = json.loads(result.stdout)
-
-        format_info = info.get('format', {})
-        streams = info.get('streams', [])
-
-        video_stream = next((s for s in streams if s['codec_type'] == 'video'), None)
-        audio_stream = next((s for s in streams if s['codec_type'] == 'audio'), None)
-
-        data = {
-            'file': os.path.basename(video_path),
-            'duration': float(format_info.get('duration', 0)),
-            'size_MB': round(int(format_info.get('size', 0)) / (1024 * 1024), 2),
-            'bitrate_kbps': round(int(format_info.get('bit_rate', 0)) / 1000, 2) if format_info.get('bit_rate') else None,  # noqa:E501
-            'container': format_info.get('format_name', ''),
-        }
-        if video_stream:
-            data.update({
-                'video_codec': video_stream.get('codec_name', ''),
-                'width': video_stream.get('width', ''),
-                'height': video_stream.get('height', ''),
-                'resolution': f"{video_stream.get('width', '')}x{video_stream.get('height', '')}",
-                'fps': eval(video_stream['r_frame_rate']) if 'r_frame_rate' in video_stream else '',
-                'aspect_ratio': video_stream.get('display_aspect_ratio', ''),
-                'color_space': video_stream.get('color_space', ''),
-                'color_depth': f"{video_stream.get('bits_per_raw_sample', '')} bit" if video_stream.get('bits_per_raw_sample') else '',  # noqa:E501
-                'chroma_subsampling': video_stream.get('chroma_subsampling', ''),
-            })
-        if audio_stream:
-            data.update({
-                'audio_codec': audio_stream.get('codec_name', ''),
-                'audio_channels': audio_stream.get('channels', ''),
-                'audio_sample_rate': audio_stream.get('sample_rate', ''),
-                'audio_language': audio_stream.get('tags', {}).get('language', ''),
-            })
-        return data
+        """
+        Reads the metadata of a video from its container headers, see `Video_metadata.probe`.
+        """
+        return Video_metadata.probe(video_path)
 
     def count_cities_by_continent(self, df):
         """
@@ -216,7 +248,9 @@ class Video_info:
         that both column_name1 matches column_value1 and column_name2 matches column_value2.
 
         Parameters:
-        df (pandas.DataFrame): The DataFrame containing the mapping file.
+        df (pandas.DataFrame or MappingIndex): The DataFrame containing the mapping file, or its MappingIndex.
+                                               A MappingIndex answers lookups on its city and country columns
+                                               without scanning the table. The DataFrame is not modified.
         column_name1 (str): The first column to search for the matching value.
         column_value1 (str): The value to search for in column_name1.
         column_name2 (str or None): The second column to search for the matching value (optional).
@@ -228,25 +262,25 @@ class Video_info:
         Any: The value from target_column that corresponds to the matching values in both
              column_name1 and column_name2.
         """
+        if isinstance(df, MappingIndex):
+            if column_name1 == df.city_column and column_name2 in (None, df.country_column):
+                return df.get(column_value1, target_column, country=column_value2)
+            df = df.df
+
         # Normalise column_name1 values
-        df[column_name1] = df[column_name1].astype(str).map(self.normalise_str)
+        column1 = df[column_name1].astype(str).map(self.normalise_str)
         column_value1 = self.normalise_str(column_value1)
 
         # If no second condition is given
         if column_name2 is None and column_value2 is None:
-            filtered_df = df[df[column_name1] == column_value1]
+            filtered_df = df[column1 == column_value1]
         else:
-            # Normalize column_name2 values
-            df[column_name2] = df[column_name2].astype(str).map(self.normalise_str)
             if column_value2 == "unknown":
-                column_value2 = float('nan')
+                filtered_df = df[(column1 == column_value1) & (df[column_name2].isna())]
             else:
-                column_value2 = self.normalise_str(column_value2)
-
-            if pd.isna(column_value2):
-                filtered_df = df[(df[column_name1] == column_value1) & (df[column_name2].isna())]
-            else:
-                filtered_df = df[(df[column_name1] == column_value1) & (df[column_name2] == column_value2)]
+                # Normalize column_name2 values
+                column2 = df[column_name2].map(self.normalise_str)
+                filtered_df = df[(column1 == column_value1) & (column2 == self.normalise_str(column_value2))]
 
         if not filtered_df.empty:
             return filtered_df.iloc[0][target_column]
@@ -254,23 +288,10 @@ class Video_info:
             return None
 
     def iso2_to_flag(self, iso2):
-        if iso2 is None:
-            # Return a placeholder or an empty string if the ISO-2 code is not available
-            logger.debug("Set ISO-2 to Kosovo.")
-            return "🇽🇰"
-        return chr(ord('🇦') + (ord(iso2[0]) - ord('A'))) + chr(ord('🇦') + (ord(iso2[1]) - ord('A')))
+        return countries.iso2_to_flag(iso2)
 
     def iso3_to_iso2(self, iso3_code):
-        try:
-            # Find the country by ISO-3 code
-            country = pycountry.countries.get(alpha_3=iso3_code)
-
-            # Return the ISO-2 code
-            return country.alpha_2 if country else None
-
-        except AttributeError or LookupError as e:
-            logger.debug(f"Converting up ISO-3 {iso3_code} to ISO-2 returned error: {e}.")
-            return None
+        return countries.iso3_to_iso2(iso3_code)
 
     def print_video_info(self, info):
         logger.info(f"File: {info.get('file')}")
@@ -295,17 +316,10 @@ class Video_info:
         """
         Removes accents/diacritics from a string.
         """
-        if not isinstance(text, str):
-            return text
-        text = unicodedata.normalize('NFD', text)
-        return ''.join([c for c in text if not unicodedata.combining(c)])
+        return strip_accents(text)
 
     def normalise_str(self, text):
         """
         Normalise to NFC, lowercase, strip whitespace, and remove accents.
         """
-        if not isinstance(text, str):
-            return text
-        text = unicodedata.normalize('NFC', text.strip().lower())
-        text = self.strip_accents(text)
-        return text
+        return normalise_str(text)
@@ -0,0 +1,150 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import unicodedata
+import numpy as np
+import pandas as pd
+import common
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+
+def strip_accents(text):
+    """
+    Removes accents/diacritics from a string.
+    """
+    if not isinstance(text, str):
+        return text
+    text = unicodedata.normalize('NFD', text)
+    return ''.join([c for c in text if not unicodedata.combining(c)])
+
+
+def normalise_str(text):
+    """
+    Normalise to NFC, lowercase, strip whitespace, and remove accents.
+    """
+    if not isinstance(text, str):
+        return text
+    text = unicodedata.normalize('NFC', text.strip().lower())
+    text = strip_accents(text)
+    return text
+
+
+class MappingIndex:
+    """
+    Index of the mapping table by normalised city and, optionally, country.
+
+    The key columns are normalised once when the index is built and mapped to the position of their first row, so
+    a lookup is a dictionary access instead of a scan of the whole table. The table itself is not modified; values
+    written to it later through `position` stay visible to lookups because rows are addressed by position.
+    """
+
+    def __init__(self, df_mapping, city_column="City", country_column="Country"):
+        """
+        Builds the index.
+
+        Parameters:
+            df_mapping (DataFrame): The mapping table.
+            city_column (str, optional): Column holding the city names. Defaults to "City".
+            country_column (str, optional): Column holding the country names. Defaults to "Country".
+        """
+        self.df = df_mapping
+        self.city_column = city_column
+        self.country_column = country_column
+
+        cities = df_mapping[city_column].astype(str).map(normalise_str).tolist()
+        if country_column in df_mapping.columns:
+            countries = [normalise_str(country) if isinstance(country, str) else None
+                         for country in df_mapping[country_column]]
+        else:
+            countries = [None] * len(cities)
+
+        # First row of every key, as a filter followed by .iloc[0] would return
+        self.by_city = {}
+        self.by_city_country = {}
+        for position, (city, country) in enumerate(zip(cities, countries)):
+            self.by_city.setdefault(city, position)
+            self.by_city_country.setdefault((city, country), position)
+
+    @classmethod
+    def from_csv(cls, mapping_file, **kwargs):
+        """
+        Reads the mapping CSV and builds its index.
+
+        Parameters:
+            mapping_file (str): Path to the mapping CSV.
+
+        Returns:
+            MappingIndex: The index of the mapping table.
+        """
+        return cls(pd.read_csv(mapping_file), **kwargs)
+
+    def position(self, city, country=None):
+        """
+        Returns the row position of a city, optionally restricted to a country.
+
+        Parameters:
+            city (str): City name, in any case and with or without accents.
+            country (str, optional): Country name. "unknown" matches rows without a country. Defaults to None,
+                which matches any country.
+
+        Returns:
+            int or None: Position of the first matching row, or None if there is none.
+        """
+        city = normalise_str(str(city))
+        if country is None:
+            return self.by_city.get(city)
+        country = None if country == "unknown" else normalise_str(country)
+        return self.by_city_country.get((city, country))
+
+    def get(self, city, column, country=None, default=None):
+        """
+        Returns a value of the row of a city.
+
+        Parameters:
+            city (str): City name.
+            column (str): Column to read.
+            country (str, optional): Country name, see `position`. Defaults to None.
+            default (Any, optional): Value returned if the city is not in the table. Defaults to None.
+
+        Returns:
+            Any: The value, or `default`.
+        """
+        position = self.position(city, country)
+        if position is None:
+            return default
+        return self.df[column].iat[position]
+
+    def positions(self, cities):
+        """
+        Returns the row positions of many cities at once.
+
+        Parameters:
+            cities (Iterable[str]): City names.
+
+        Returns:
+            np.ndarray: Row position of every city, -1 for cities not in the table.
+        """
+        keys = pd.Series(list(cities), dtype=object).astype(str).map(normalise_str)
+        return keys.map(self.by_city).fillna(-1).to_numpy(dtype=np.int64)
+
+    def enrich(self, cities, columns):
+        """
+        Looks up several columns for many cities in one vectorised step.
+
+        Parameters:
+            cities (Iterable[str]): City names.
+            columns (list[str]): Columns of the mapping table to return.
+
+        Returns:
+            DataFrame: One row per city, indexed by the given names, with the requested columns. Cities not in
+                the table get None.
+        """
+        cities = list(cities)
+        positions = self.positions(cities)
+        found = positions >= 0
+        values = np.full((len(cities), len(columns)), None, dtype=object)
+        if found.any():
+            values[found] = self.df[columns].iloc[positions[found]].to_numpy(dtype=object)
+        return pd.DataFrame(values, index=pd.Index(cities), columns=columns)
@@ -0,0 +1,87 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import os
+import shutil
+import numpy as np
+from ultralytics import YOLO
+import common
+from utils.summary_cache import file_hash
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+# Consts
+BACKENDS = ("pytorch", "torchscript", "onnx", "openvino")
+MODELS_CACHE_DIR = os.path.join(common.cache_dir, "models")
+# Backends exported with a dynamic batch dimension, so `batch_tracking_mode` can run several frames at once;
+# TorchScript accepts any batch size as exported
+DYNAMIC_BACKENDS = ("onnx", "openvino")
+
+
+def export_model(weights, backend, imgsz):
+    """
+    Returns the path of the model exported to a CPU runtime, exporting it only if it is not cached yet.
+
+    Exports are stored in `_cache/models`, in a directory keyed by the weights file name and hash, the input size,
+    the backend and whether the input shape is dynamic, so the export cost is paid once per model version. ONNX and
+    OpenVINO models are exported with dynamic input shapes; a static export would only accept batches of one frame.
+
+    Args:
+        weights (str): Path to the PyTorch weights, e.g. `yolo11x.pt`.
+        backend (str): One of BACKENDS. `pytorch` returns the weights unchanged.
+        imgsz (int): Input size the model is exported for.
+
+    Returns:
+        str: Path to the weights or the exported model.
+
+    Raises:
+        ValueError: If the backend is not supported.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported model backend {backend}. Supported backends: {', '.join(BACKENDS)}.")
+    if backend == "pytorch":
+        return weights
+
+    if not os.path.exists(weights):
+        # Let ultralytics download the official weights so they can be hashed
+        YOLO(weights)
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    dynamic = backend in DYNAMIC_BACKENDS
+    export_dir = os.path.join(MODELS_CACHE_DIR, f"{stem}_{file_hash(weights)[:16]}_{imgsz}_{backend}"
+                                                f"{'_dynamic' if dynamic else ''}")
+    marker = os.path.join(export_dir, "exported_model")  # holds the file name of the finished export
+
+    if os.path.exists(marker):
+        with open(marker) as f:
+            return os.path.join(export_dir, f.read().strip())
+
+    logger.info(f"Exporting {weights} to {backend} with input size {imgsz}{' (dynamic)' if dynamic else ''}.")
+    os.makedirs(export_dir, exist_ok=True)
+    cached_weights = os.path.join(export_dir, os.path.basename(weights))
+    shutil.copy(weights, cached_weights)
+    exported = YOLO(cached_weights).export(format=backend, imgsz=imgsz, dynamic=dynamic)
+    os.remove(cached_weights)
+
+    with open(marker, 'w') as f:
+        f.write(os.path.basename(exported))
+    logger.info(f"Cached exported model at {exported}.")
+    return str(exported)
+
+
+def load_model(weights, backend="pytorch", imgsz=640):
+    """
+    Loads a YOLO model for the requested backend and warms it up on a dummy frame.
+
+    Args:
+        weights (str): Path to the PyTorch weights.
+        backend (str, optional): One of BACKENDS. Defaults to `pytorch`.
+        imgsz (int, optional): Inference input size. Defaults to 640.
+
+    Returns:
+        YOLO: The loaded model.
+    """
+    model = YOLO(export_model(weights, backend, imgsz), task="detect")
+    model.predict(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, verbose=False)
+    logger.info(f"Loaded {weights} with the {backend} backend.")
+    return model
@@ -0,0 +1,223 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import os
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import psutil
+import common
+from utils.detection_buffer import OUTPUT_FORMATS
+from utils.frame_tap import FRAME_STATS_DIR
+from utils.track_store import TRACKS_DIR
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+# Consts
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+# YOLO_detection instance of a worker process, created once by _init_worker
+_detection = None
+
+
+def _export_model():
+    """
+    Exports the configured model to the configured backend, if it is not cached yet.
+
+    Runs in a process of its own, so the export finishes before the workers start loading the model and torch is
+    never imported in the parent process.
+    """
+    from utils.model_cache import export_model
+    export_model(common.get_configs("model"), common.get_configs("model_backend"), common.get_configs("model_imgsz"))
+
+
+def _init_worker(torch_threads):
+    """
+    Initialises a worker process: limits the torch thread count and creates the detector with its model loaded
+    and warmed up, so every video of the worker reuses it.
+
+    Parameters:
+        torch_threads (int): Number of threads torch may use in this worker. 0 keeps the torch default.
+    """
+    global _detection
+    import torch
+    from utils.yolo_detection import YOLO_detection
+
+    if torch_threads > 0:
+        torch.set_num_threads(torch_threads)
+    _detection = YOLO_detection()
+    _detection.get_model()
+
+
+def _process_videos(videos, data_path, scratch_root, batch_videos, delete_runs_files):
+    """
+    Runs detection on a group of videos in an isolated scratch directory and moves the CSVs to `data_path`.
+
+    Parameters:
+        videos (list[tuple]): (full path, name without extension) of the videos to process.
+        data_path (str): Directory the per-video CSVs are moved to.
+        scratch_root (str): Parent of the scratch directories.
+        batch_videos (int): Number of videos tracked side by side with batched inference.
+        delete_runs_files (bool): Whether to delete the scratch directory afterwards.
+
+    Returns:
+        list[str]: Names of the processed videos.
+    """
+    names = [name for _, name in videos]
+    scratch_dir = os.path.join(scratch_root, names[0])  # video names are unique, so is the scratch dir
+    os.makedirs(scratch_dir, exist_ok=True)
+
+    if batch_videos > 1:
+        _detection.batch_tracking_mode([path for path, _ in videos], names, batch_size=batch_videos,  # type: ignore
+                                       output_dir=scratch_dir)
+    else:
+        for full_path, name in videos:
+            _detection.set_video_title(name)  # type: ignore
+            _detection.tracking_mode(full_path, video_fps=25, output_dir=scratch_dir)  # type: ignore
+
+    # Move the newly created CSV or Parquet files and tracks tables from the scratch directory to the target data
+    # directory. Tracks tables and frame statistics go to subdirectories, so they are not read as detection files
+    output_format = common.get_configs("output_format")
+    os.makedirs(os.path.join(data_path, TRACKS_DIR), exist_ok=True)
+    for name in names:
+        shutil.move(os.path.join(scratch_dir, TRACKS_DIR, f"{name}.csv"),
+                    os.path.join(data_path, TRACKS_DIR, f"{name}.csv"))
+        shutil.move(os.path.join(scratch_dir, f"{name}.{output_format}"),
+                    os.path.join(data_path, f"{name}.{output_format}"))
+        frame_stats_path = os.path.join(scratch_dir, FRAME_STATS_DIR, f"{name}.csv")
+        if os.path.exists(frame_stats_path):
+            os.makedirs(os.path.join(data_path, FRAME_STATS_DIR), exist_ok=True)
+            shutil.move(frame_stats_path, os.path.join(data_path, FRAME_STATS_DIR, f"{name}.csv"))
+
+    # If enabled, clean up the scratch directory after the videos are processed
+    if delete_runs_files:
+        shutil.rmtree(scratch_dir)
+    return names
+
+
+class Video_orchestrator:
+    def __init__(self, video_folder, data_path, scratch_root=None):
+        """
+        Initialises the orchestrator that runs YOLO detection over a folder of videos.
+
+        Parameters:
+            video_folder (str): Directory containing the videos to process.
+            data_path (str): Directory to store the per-video CSV detection results.
+            scratch_root (str, optional): Parent of the per-task scratch directories. Defaults to `runs/detect`.
+
+        Instance Variables:
+            self.max_workers (int): Maximum number of worker processes, from `detection_workers`.
+            self.torch_threads (int): Torch threads per worker, from `torch_threads` (0 = torch default).
+            self.worker_memory_gb (float): Memory a worker is expected to need, from `worker_memory_gb`
+                (0 = no memory budget).
+            self.batch_videos (int): Number of videos a worker tracks side by side, from `batch_videos`.
+        """
+        self.video_folder = video_folder
+        self.data_path = data_path
+        self.scratch_root = scratch_root if scratch_root is not None else os.path.join("runs", "detect")
+        self.max_workers = common.get_configs("detection_workers")
+        self.torch_threads = common.get_configs("torch_threads")
+        self.worker_memory_gb = common.get_configs("worker_memory_gb")
+        self.batch_videos = common.get_configs("batch_videos")
+        self.delete_runs_files = common.get_configs("delete_runs_files")
+
+    def pending_videos(self):
+        """
+        Lists the videos that still need to be processed.
+
+        Hidden files, non-video files and videos whose CSV or Parquet output is already present in `data_path` are
+        skipped.
+
+        Returns:
+            list[tuple]: (full path, name without extension) of every pending video, sorted by name.
+        """
+        pending = []
+        for filename in sorted(os.listdir(self.video_folder)):
+            # Skip hidden files and any files that don't look like common video file types
+            if filename.startswith('.') or not filename.lower().endswith(VIDEO_EXTENSIONS):
+                continue
+
+            full_path = os.path.join(self.video_folder, filename)
+            if not os.path.isfile(full_path):
+                continue
+            name_without_ext = os.path.splitext(filename)[0]
+
+            # If a processed output already exists for this video, skip it (no need to re-run)
+            if any(os.path.exists(os.path.join(self.data_path, f"{name_without_ext}.{extension}"))
+                   for extension in OUTPUT_FORMATS):
+                logger.info(f"Processed video file already present for {name_without_ext}")
+                continue
+            pending.append((full_path, name_without_ext))
+        return pending
+
+    def worker_count(self, num_tasks):
+        """
+        Determines how many worker processes to start.
+
+        The count is bounded by `detection_workers`, by the number of cores divided by the torch threads per
+        worker, by the available memory divided by `worker_memory_gb`, and by the number of tasks.
+
+        Parameters:
+            num_tasks (int): Number of tasks to run.
+
+        Returns:
+            int: Number of workers, at least 1.
+        """
+        limits = [self.max_workers, num_tasks]
+        if self.torch_threads > 0:
+            limits.append((os.cpu_count() or 1) // self.torch_threads)
+        if self.worker_memory_gb > 0:
+            available_gb = psutil.virtual_memory().available / (1024 ** 3)
+            limits.append(int(available_gb // self.worker_memory_gb))
+        return max(1, min(limits))
+
+    def run(self):
+        """
+        Processes all pending videos, in parallel worker processes if more than one worker is allowed.
+
+        Every task (one video, or `batch_videos` videos in batch mode) gets its own scratch directory below
+        `scratch_root`, so workers never share YOLO output paths.
+        """
+        pending = self.pending_videos()
+        if not pending:
+            return
+        os.makedirs(self.data_path, exist_ok=True)   # Ensure data directory exists
+
+        group = max(1, self.batch_videos)
+        tasks = [pending[i:i + group] for i in range(0, len(pending), group)]
+        workers = self.worker_count(len(tasks))
+        # run.py is a plain script, so spawned workers would re-run it on import: workers are only forked
+        if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            logger.warning("Worker processes need the fork start method, which this platform lacks; processing "
+                           "the videos serially.")
+            workers = 1
+        logger.info(f"Processing {len(pending)} videos in {len(tasks)} tasks with {workers} worker(s).")
+
+        if workers == 1:
+            _init_worker(self.torch_threads)
+            for videos in tasks:
+                _process_videos(videos, self.data_path, self.scratch_root, self.batch_videos, self.delete_runs_files)
+            return
+
+        # Torch is only imported inside the workers, so nothing torch-related is inherited from this process
+        mp_context = multiprocessing.get_context("fork")
+
+        # Export the model once up front instead of letting every worker race to fill the cache
+        if common.get_configs("model_backend") != "pytorch":
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as executor:
+                executor.submit(_export_model).result()
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=mp_context,
+                                 initializer=_init_worker,
+                                 initargs=(self.torch_threads,)) as executor:
+            futures = {executor.submit(_process_videos, videos, self.data_path, self.scratch_root,
+                                       self.batch_videos, self.delete_runs_files): videos for videos in tasks}
+            for future in as_completed(futures):
+                names = [name for _, name in futures[future]]
+                try:
+                    future.result()
+                    logger.info(f"Finished processing {', '.join(names)}.")
+                except Exception as e:
+                    logger.error(f"Failed to process {', '.join(names)}: {e}.")
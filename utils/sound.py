@@ -1,7 +1,9 @@
-import numpy as np
-from moviepy.editor import VideoFileClip
-from scipy.io import wavfile
+import collections
 import os
+import re
+import subprocess
+import threading
+import numpy as np
 import common
 from custom_logger import CustomLogger
 from logmod import logs
@@ -9,26 +11,206 @@ from logmod import logs
 logs(show_level=common.get_configs("logger_level"), show_color=True)
 logger = CustomLogger(__name__)  # use custom logger
 
+# Consts
+SOUND_DIR = os.path.join(common.output_dir, "sound")  # loudness of every second of every video
+SAMPLE_RATE = 44100  # audio is decoded at 44.1 kHz
+CHANNELS = 2  # and as stereo, as the WAV export used before streaming did
+CHUNK_FRAMES = 65536  # stereo samples decoded per chunk (256 KB of 16-bit PCM)
+DURATION_PATTERN = re.compile(r"Duration: (\d\d):(\d\d):(\d\d\.\d\d)")  # duration of the input in the ffmpeg log
+LOG_LINES = 50  # last lines of the ffmpeg log kept for error messages
+FULL_SCALE = 32768  # largest magnitude of a 16-bit sample
+
 
 class Video_sound():
 
     def __init__(self) -> None:
         pass
 
+    @staticmethod
+    def stream_pcm(video_path, chunk_frames=CHUNK_FRAMES):
+        """
+        Decodes the audio track of a video with ffmpeg and yields it in fixed-size chunks, without temporary files.
+
+        The track is cut or padded with silence to the duration of the container as ffmpeg reports it (rounded to
+        centiseconds), which is the length of the WAV export used before, so the same samples are analysed.
+
+        Args:
+            video_path (str): Path to the video file.
+            chunk_frames (int, optional): Number of stereo samples per chunk. Defaults to CHUNK_FRAMES.
+
+        Yields:
+            np.ndarray: 16-bit PCM samples, shape (n, 2), at SAMPLE_RATE; the last chunk may be shorter.
+
+        Raises:
+            ValueError: If the video has no audio track.
+            RuntimeError: If ffmpeg fails to decode the audio.
+        """
+        cmd = [
+            'ffmpeg', '-nostdin', '-hide_banner', '-nostats', '-v', 'info',
+            '-i', video_path,
+            '-map', '0:a:0', '-vn',
+            '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', str(CHANNELS), '-ar', str(SAMPLE_RATE),
+            '-',
+        ]
+        chunk_bytes = chunk_frames * CHANNELS * 2
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=chunk_bytes) as proc:
+            # Read the log on a thread, so a chatty decoder cannot block on a full pipe. ffmpeg logs the duration
+            # of the input before it writes any output.
+            log = collections.deque(maxlen=LOG_LINES)
+            header = {}
+            header_read = threading.Event()
+
+            def read_log():
+                for line in iter(proc.stderr.readline, b''):  # type: ignore
+                    line = line.decode(errors='replace')
+                    log.append(line)
+                    match = DURATION_PATTERN.search(line)
+                    if match and "duration" not in header:
+                        hours, minutes, seconds = match.groups()
+                        header["duration"] = 3600 * int(hours) + 60 * int(minutes) + float(seconds)
+                        header_read.set()
+                header_read.set()
+
+            reader = threading.Thread(target=read_log, daemon=True)
+            reader.start()
+
+            remaining = None  # samples left before the duration of the container is reached
+            stopped = False
+            try:
+                while True:
+                    raw = proc.stdout.read(chunk_bytes)  # type: ignore
+                    if not raw:
+                        break
+                    if remaining is None:
+                        header_read.wait()
+                        remaining = int(SAMPLE_RATE * header["duration"]) if "duration" in header else -1
+                    usable = len(raw) - len(raw) % (CHANNELS * 2)
+                    chunk = np.frombuffer(raw[:usable], dtype='<i2').reshape(-1, CHANNELS)
+                    if remaining >= 0:
+                        chunk = chunk[:remaining]
+                        remaining -= len(chunk)
+                    if len(chunk):
+                        yield chunk
+                    if remaining == 0:
+                        stopped = True
+                        break
+            finally:
+                # Stops ffmpeg once enough samples are read, or if the consumer stops early
+                if proc.poll() is None:
+                    proc.kill()
+            proc.wait()
+            reader.join()
+            if proc.returncode != 0 and not stopped:
+                error = "".join(log)
+                if "matches no streams" in error:
+                    raise ValueError(f"No audio track found in {video_path}")
+                raise RuntimeError(f"Could not decode the audio of {video_path}: {error.strip()}")
+
+        # The track ended before the duration of the container: pad it with silence
+        if remaining is None:
+            remaining = int(SAMPLE_RATE * header["duration"]) if "duration" in header else 0
+        while remaining > 0:
+            yield np.zeros((min(remaining, chunk_frames), CHANNELS), dtype=np.int16)
+            remaining -= chunk_frames
+
+    def audio_features_from_video(self, video_path):
+        """
+        Computes the loudness features of the audio track of a video in a single decode.
+
+        `db` keeps the scale of the WAV-based loudness, where the track is first normalised to its own peak, so it
+        measures how loud the track is relative to its loudest sample. All other features are on the absolute
+        dBFS scale of the 16-bit samples (0 dBFS is the largest sample value), so they can be compared with each
+        other, with fixed thresholds and across videos.
+
+        Every chunk from `stream_pcm` is converted to mono by summing the channels, and its squares are binned into
+        seconds with one `np.bincount`, so the work per chunk is a few vectorised operations. Only the sums of every
+        second are kept, so the memory used is a few bytes per second of audio.
+
+        Args:
+            video_path (str): Path to the video file.
+
+        Returns:
+            dict: The features:
+                - db (float): RMS loudness of the whole track relative to its peak, in dB, as
+                  `audio_db_from_video` returns it.
+                - rms_db (float): RMS loudness of the whole track in absolute dBFS.
+                - peak_db (float): Peak level of the mono signal in absolute dBFS.
+                - series (np.ndarray): RMS loudness of every second of the track in absolute dBFS; the last second
+                  may be partial.
+
+        Raises:
+            ValueError: If the video has no audio track.
+            Exception: For other file I/O or decoding errors.
+        """
+        # The sum of the channels is the mono signal times 2; integer sums are exact for any length
+        count = 0
+        peak = 0
+        blocks = []  # (first second, sums of squares of the seconds) of every chunk
+        for chunk in self.stream_pcm(video_path):
+            summed = chunk.astype(np.int64).sum(axis=1)
+            seconds = np.arange(count, count + len(summed)) // SAMPLE_RATE
+            # Squares of 16-bit sums stay below 2**34, and their sum over a second below 2**53: float64 is exact
+            blocks.append((seconds[0], np.bincount(seconds - seconds[0], weights=summed * summed)))
+            count += len(summed)
+            peak = max(peak, int(np.abs(summed).max(initial=0)))
+
+        if count == 0:
+            raise ValueError(f"No audio samples decoded from {video_path}")
+
+        n_seconds = -(-count // SAMPLE_RATE)
+        second_sums = np.zeros(n_seconds)
+        for first, sums in blocks:
+            second_sums[first:first + len(sums)] += sums
+        second_counts = np.full(n_seconds, SAMPLE_RATE)
+        second_counts[-1] = count - SAMPLE_RATE * (n_seconds - 1)
+
+        # RMS of the mono signal, (L + R) / 2, overall and per second
+        rms = np.sqrt(second_sums.sum() / count) / 2
+        series = np.sqrt(second_sums / second_counts) / 2
+        max_abs = peak / 2
+        # For `db` a mono signal exceeding 1 was scaled to a peak of 1
+        normalised_rms = rms / max_abs if max_abs > 1 else rms
+
+        # Convert to decibels; on the absolute scale 0 dBFS is the largest 16-bit magnitude
+        with np.errstate(divide="ignore"):
+            return {
+                "db": 20 * np.log10(normalised_rms) if normalised_rms > 0 else -np.inf,
+                "rms_db": 20 * np.log10(rms / FULL_SCALE) if rms > 0 else -np.inf,
+                "peak_db": 20 * np.log10(max_abs / FULL_SCALE) if max_abs > 0 else -np.inf,
+                "series": 20 * np.log10(series / FULL_SCALE),
+            }
+
+    @staticmethod
+    def time_above(series, thresholds):
+        """
+        Computes the share of the seconds of a loudness series that are louder than every threshold.
+
+        Args:
+            series (np.ndarray): Loudness of every second in absolute dBFS, as in `audio_features_from_video`.
+            thresholds (list[float]): Thresholds in absolute dBFS.
+
+        Returns:
+            dict: Share of time, between 0 and 1, above every threshold, keyed by the threshold.
+        """
+        series = np.asarray(series)
+        if not len(series):
+            return {threshold: np.nan for threshold in thresholds}
+        above = series[None, :] > np.asarray(thresholds, dtype=np.float64)[:, None]
+        return dict(zip(thresholds, above.mean(axis=1).tolist()))
+
     def audio_db_from_video(self, video_path):
         """
-        Extracts the audio track from a video file, computes its RMS (root mean square) amplitude,
-        and returns the loudness in decibels relative to digital full scale (dBFS).
-
-        The function works as follows:
-            1. Loads the video and extracts its audio track.
-            2. Saves the audio temporarily as a WAV file (16-bit PCM).
-            3. Loads the WAV file and converts it to a mono (single channel) signal if necessary.
-            4. Normalises the audio data to the range [-1, 1] based on its data type.
-            5. Calculates the RMS value of the audio waveform.
-            6. Converts the RMS value to dBFS (where 0 dBFS is the maximum possible amplitude).
-            7. Cleans up the temporary audio file.
-            8. Returns the dBFS value. If the audio track is missing, raises an exception.
+        Computes the RMS (root mean square) loudness of the audio track of a video in decibels relative to digital
+        full scale (dBFS).
+
+        It is the `db` feature of `audio_features_from_video`, which works as follows:
+            1. Streams the audio track as 16-bit PCM at 44.1 kHz stereo from ffmpeg, in fixed-size chunks.
+            2. Converts every chunk to mono by averaging the channels.
+            3. Keeps the sum of squares of every second and the peak absolute value, so only a few bytes per second
+               of audio are held in memory.
+            4. Calculates the RMS value of the mono waveform, normalised by its peak as the WAV-based version did
+               (the mono average is a float array, which it scaled to [-1, 1] by its peak).
+            5. Converts the RMS value to dBFS and returns it. If the audio track is missing, raises an exception.
 
         Args:
             video_path (str): Path to the video file.
@@ -40,54 +222,4 @@ class Video_sound():
             ValueError: If the video has no audio track.
             Exception: For other file I/O or decoding errors.
         """
-        # Load the video file
-        video = VideoFileClip(video_path)
-        audio = video.audio
-
-        # If there is no audio track, raise an exception
-        if audio is None:
-            raise ValueError(f"No audio track found in {video_path}")
-
-        # Save the audio as a temporary WAV file (16-bit PCM)
-        temp_audio = "temp_audio.wav"
-        audio.write_audiofile(temp_audio, fps=44100, nbytes=2, codec='pcm_s16le', logger=None)
-
-        # Read the audio data from the temporary file
-        sr, data = wavfile.read(temp_audio)
-
-        # If the audio is stereo (2D), convert to mono by averaging the channels
-        if len(data.shape) == 2:
-            data = data.mean(axis=1)
-
-        # Normalise the audio to floating point values in [-1, 1]
-        if data.dtype == np.int16:
-            # Standard 16-bit PCM
-            data = data.astype(np.float32) / 32768
-        elif data.dtype == np.int32:
-            # 32-bit PCM
-            data = data.astype(np.float32) / 2147483648
-        elif data.dtype == np.uint8:
-            # 8-bit PCM (unsigned): 0-255 to -1 to 1
-            data = (data.astype(np.float32) - 128) / 128
-        elif np.issubdtype(data.dtype, np.floating):
-            # If already float, ensure max amplitude is <= 1
-            max_abs = np.max(np.abs(data))
-            if max_abs > 1:
-                data = data / max_abs
-        else:
-            # Unknown or exotic format
-            logger.debug(f"Unknown dtype: {data.dtype}, shape: {data.shape}")
-            data = data.astype(np.float32)
-
-        # Calculate RMS (Root Mean Square) of the audio waveform
-        rms = np.sqrt(np.mean(data ** 2))
-
-        # Convert RMS to dBFS (decibels relative to full scale)
-        # 0 dBFS means maximum possible amplitude; typical audio is negative
-        db = 20 * np.log10(rms) if rms > 0 else -np.inf
-
-        # Remove the temporary file to clean up
-        os.remove(temp_audio)
-
-        # Return the loudness in dBFS
-        return db
+        return self.audio_features_from_video(video_path)["db"]
@@ -0,0 +1,155 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import hashlib
+import os
+import pickle
+import threading
+import common
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+# Consts
+CACHE_FILE = os.path.join(common.cache_dir, "summaries.pkl")
+SUMMARY_VERSION = 1  # bump when the content of a summary changes, so older entries are recomputed
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """
+    Computes the SHA-256 hash of a file, reading it in chunks.
+
+    Args:
+        path (str): Path to the file.
+        chunk_size (int, optional): Number of bytes read at a time. Defaults to 1 MB.
+
+    Returns:
+        str: Hexadecimal digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Summary_cache:
+    """
+    Persistent cache of per-file summaries, such as the object counts of a detection file or the loudness of a
+    video.
+
+    Entries are keyed by the kind of summary and the path of the file, and store the size, modification time and
+    content hash of the file they were computed from. A file whose size and modification time are unchanged is
+    served from the cache without being read. If only the modification time changed the file is hashed, and the
+    entry is still used when the content is the same. Otherwise the summary is recomputed. Entries of files that
+    no longer exist are dropped by `prune`. `get` may be called from several threads at once.
+    """
+
+    def __init__(self, cache_file=CACHE_FILE):
+        """
+        Loads the cache from disk, starting empty if there is no usable cache file.
+
+        Parameters:
+            cache_file (str, optional): Path of the cache file. Defaults to CACHE_FILE.
+        """
+        self.cache_file = cache_file
+        self.entries = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as f:
+                    self.entries = pickle.load(f)
+            except Exception as e:
+                logger.warning(f"Could not load the summary cache {cache_file}, starting empty: {e}.")
+
+    def get(self, kind, path, compute, version=SUMMARY_VERSION):
+        """
+        Returns the summary of a file, computing it only if the file is new or changed.
+
+        Parameters:
+            kind (str): Kind of summary, e.g. 'detections' or 'loudness'.
+            path (str): Path to the file.
+            compute (callable): Function computing the summary from the path. Exceptions are not cached.
+            version (int or tuple, optional): Version of the summaries of this kind, which may include the
+                settings the summary depends on besides the file. Entries of another version are recomputed.
+                Defaults to SUMMARY_VERSION.
+
+        Returns:
+            Any: The summary.
+        """
+        key = (kind, os.path.abspath(path))
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and entry["version"] == version and entry["size"] == stat.st_size:
+            if entry["mtime"] == stat.st_mtime_ns or entry["hash"] == file_hash(path):
+                with self.lock:
+                    if entry["mtime"] != stat.st_mtime_ns:
+                        entry["mtime"] = stat.st_mtime_ns
+                        self.dirty = True
+                    self.hits += 1
+                return entry["summary"]
+
+        summary = compute(path)
+        digest = file_hash(path)
+        with self.lock:
+            self.entries[key] = {
+                "version": version,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "hash": digest,
+                "summary": summary,
+            }
+            self.misses += 1
+            self.dirty = True
+        return summary
+
+    def prune(self, kind, folder_path):
+        """
+        Drops the entries of a kind for files in `folder_path` that no longer exist.
+
+        Parameters:
+            kind (str): Kind of summary.
+            folder_path (str): Folder whose entries are checked.
+        """
+        folder = os.path.abspath(folder_path)
+        stale = [key for key in self.entries
+                 if key[0] == kind and os.path.dirname(key[1]) == folder and not os.path.exists(key[1])]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self.dirty = True
+            logger.debug(f"Dropped {len(stale)} stale {kind} summaries of {folder_path}.")
+
+    def drop(self, kind):
+        """
+        Drops all entries of a kind, e.g. one that is no longer computed.
+
+        Parameters:
+            kind (str): Kind of summary.
+        """
+        stale = [key for key in self.entries if key[0] == kind]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self.dirty = True
+            logger.debug(f"Dropped {len(stale)} {kind} summaries.")
+
+    def save(self):
+        """
+        Writes the cache to disk if it changed, replacing the previous file atomically.
+        """
+        if self.hits or self.misses:
+            logger.info(f"Summary cache: {self.hits} files served from the cache, {self.misses} recomputed.")
+            self.hits = self.misses = 0
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+        tmp_path = self.cache_file + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.entries, f)
+        os.replace(tmp_path, self.cache_file)
+        self.dirty = False
@@ -0,0 +1,158 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import os
+import numpy as np
+import pandas as pd
+import common
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+# Consts
+TIMESERIES_DIR = os.path.join(common.output_dir, "timeseries")
+SECOND = 1  # window of the per-second series, in seconds
+MINUTE = 60  # window of the per-minute series, in seconds
+SERIES_DTYPE = np.int32
+SERIES_VERSION = 1  # bump when the computation of the series changes, so cached series are recomputed
+
+
+class Detection_timeseries:
+    """
+    Windowed time series of a detection table.
+
+    Every detection is binned by the time of its `Frame Count` in the video, and every series is computed for all
+    classes at once with numpy binned counts, without a Python loop over the detections. Tracks are keyed on their
+    `Unique Id` together with their class, as in `Analysis_class.count_objects`. The series of a video are kept as
+    a dictionary of arrays with one row per class:
+        - classes (C,): YOLO IDs of the rows.
+        - active (C, S): number of distinct tracks seen in every second.
+        - peak (C, S): largest number of detections of the class in a single frame of every second.
+        - new (C, M): number of tracks first seen in every minute.
+        - seconds (1,): length of the series in seconds.
+    Series of several videos, e.g. of the same city, are merged by placing them one after the other.
+    """
+
+    @staticmethod
+    def compute(df, ids, fps, n_frames=None):
+        """
+        Computes the time series of a detection table.
+
+        Parameters:
+            df (DataFrame): Detections with the columns `YOLO_id`, `Unique Id` and `Frame Count` (1-based position
+                of the frame in the video).
+            ids (list[int]): YOLO IDs of the classes to include.
+            fps (float): Frame rate of the video.
+            n_frames (int, optional): Number of frames of the video, so the series cover the whole video. Defaults
+                to the last frame with a detection.
+
+        Returns:
+            dict: The series, see the class description.
+        """
+        classes = np.array(sorted(ids), dtype=np.int64)
+        last_frame = int(df["Frame Count"].max()) if len(df) else 0
+        n_frames = max(n_frames or 0, last_frame)
+        n_seconds = int(np.ceil(n_frames / fps / SECOND))
+        n_minutes = int(np.ceil(n_frames / fps / MINUTE))
+        series = {
+            "classes": classes.astype(np.int16),
+            "active": np.zeros((len(classes), n_seconds), dtype=SERIES_DTYPE),
+            "peak": np.zeros((len(classes), n_seconds), dtype=SERIES_DTYPE),
+            "new": np.zeros((len(classes), n_minutes), dtype=SERIES_DTYPE),
+            "seconds": np.array([n_frames / fps], dtype=np.float64),
+        }
+
+        yolo_ids = df["YOLO_id"].to_numpy()
+        keep = np.isin(yolo_ids, classes)
+        if not keep.any():
+            return series
+        row = np.searchsorted(classes, yolo_ids[keep].astype(np.int64))
+        frame = df["Frame Count"].to_numpy()[keep].astype(np.int64)
+        time = (frame - 1) / fps
+        second = np.minimum((time // SECOND).astype(np.int64), n_seconds - 1)
+
+        # Peak: detections per (class, frame), then the largest count within every second
+        frame_keys, frame_counts = np.unique(row * (n_frames + 1) + frame, return_counts=True)
+        frame_rows, frames = np.divmod(frame_keys, n_frames + 1)
+        frame_seconds = np.minimum(((frames - 1) / fps // SECOND).astype(np.int64), n_seconds - 1)
+        np.maximum.at(series["peak"], (frame_rows, frame_seconds), frame_counts.astype(SERIES_DTYPE))
+
+        track = df["Unique Id"].to_numpy(dtype=np.float64, na_value=np.nan)[keep]
+        tracked = ~np.isnan(track)
+        if not tracked.any():
+            return series
+        row, frame, second = row[tracked], frame[tracked], second[tracked]
+        _, track = np.unique(track[tracked].astype(np.int64), return_inverse=True)
+        track_key = row * (track.max() + 1) + track  # one key per (class, track)
+
+        # Active: distinct (class, track, second) triples, counted per (class, second)
+        active_keys = np.unique(track_key * n_seconds + second)
+        np.add.at(series["active"], (active_keys // n_seconds // (track.max() + 1), active_keys % n_seconds), 1)
+
+        # New: the minute of the first detection of every track
+        order = np.lexsort((frame, track_key))
+        first = order[np.r_[True, track_key[order][1:] != track_key[order][:-1]]]
+        minute = np.minimum(((frame[first] - 1) / fps // MINUTE).astype(np.int64), n_minutes - 1)
+        np.add.at(series["new"], (row[first], minute), 1)
+        return series
+
+    @staticmethod
+    def merge(series_list):
+        """
+        Merges the series of several videos by placing them one after the other in time.
+
+        Parameters:
+            series_list (list[dict]): Series as returned by `compute`, in the order they are joined.
+
+        Returns:
+            dict: The merged series, with a row for every class present in any of them.
+        """
+        classes = np.unique(np.concatenate([series["classes"] for series in series_list]))
+        merged = {"classes": classes.astype(np.int16),
+                  "seconds": np.array([sum(float(series["seconds"][0]) for series in series_list)])}
+        for name in ("active", "peak", "new"):
+            parts = []
+            for series in series_list:
+                part = np.zeros((len(classes), series[name].shape[1]), dtype=SERIES_DTYPE)
+                part[np.searchsorted(classes, series["classes"])] = series[name]
+                parts.append(part)
+            merged[name] = np.concatenate(parts, axis=1)
+        return merged
+
+    @staticmethod
+    def summarise(series):
+        """
+        Reduces series to one row of density metrics per class.
+
+        Parameters:
+            series (dict): Series as returned by `compute` or `merge`.
+
+        Returns:
+            DataFrame: Per class (`YOLO_id`): mean and largest number of active tracks per second, mean number of new
+                tracks per minute and the peak number of objects in a single frame.
+        """
+        minutes = max(float(series["seconds"][0]) / MINUTE, 1e-9)
+        active = series["active"]
+        return pd.DataFrame({
+            "YOLO_id": series["classes"].astype(int),
+            "Mean active per second": active.mean(axis=1) if active.shape[1] else 0.0,
+            "Max active per second": active.max(axis=1, initial=0),
+            "New per minute": series["new"].sum(axis=1) / minutes,
+            "Peak concurrent": series["peak"].max(axis=1, initial=0),
+        })
+
+    @staticmethod
+    def save(series, path):
+        """
+        Writes series to a compressed `.npz` file.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, **series)
+
+    @staticmethod
+    def load(path):
+        """
+        Reads series written by `save`.
+        """
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
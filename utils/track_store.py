@@ -0,0 +1,183 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import os
+import numpy as np
+import pandas as pd
+import common
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+# Consts
+HISTORY = 30  # centre points kept per track for drawing its trail
+FLUSH_ROWS = 4096  # track summaries kept in memory before they are appended to the tracks CSV
+INITIAL_CAPACITY = 256  # track slots allocated up front, doubled when full
+TRACKS_DIR = "tracks"  # subdirectory of the output directory holding the per-video tracks tables
+TRACK_COLUMNS = ["Unique Id", "YOLO_id", "First Frame", "Last Frame", "Frames", "Path Length", "Mean Width",
+                 "Mean Height"]
+
+
+class Track_store:
+    """
+    Bounded store of the active tracks of a video.
+
+    Every track (a track ID together with its class, the pair that object counting groups on) owns a slot in
+    preallocated numpy arrays, holding a fixed-size ring buffer of its last centre points and running statistics.
+    Tracks not seen for `ttl` frames are evicted and their slot is reused, so memory stays bounded by the number of
+    tracks alive at the same time. On eviction the summary of the track is queued for the tracks table: class,
+    first and last frame, number of frames it was detected in, path length of its centre and mean box size, all in
+    normalised coordinates.
+
+    Queued summaries are appended to the tracks CSV every FLUSH_ROWS evictions and on every `flush`, so neither the
+    memory of the store nor its pickled checkpoint grows with the number of tracks of the video. Rows are in the
+    order the tracks were evicted.
+    """
+
+    def __init__(self, ttl, output_csv, history=HISTORY, capacity=INITIAL_CAPACITY):
+        """
+        Initialises an empty store.
+
+        Parameters:
+            ttl (int): Number of video frames a track may go unseen before it is evicted.
+            output_csv (str): Path of the tracks CSV the summaries are appended to.
+            history (int, optional): Centre points kept per track. Defaults to HISTORY.
+            capacity (int, optional): Initial number of track slots. Defaults to INITIAL_CAPACITY.
+        """
+        self.ttl = ttl
+        self.output_csv = output_csv
+        self.history = history
+        self.slots = {}  # (track ID, class) -> slot
+        self.free = []  # slots released by evicted tracks
+        self.summaries = []  # rows of the tracks table not yet appended to the CSV
+        self.written = 0  # rows appended to the CSV by this store
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """
+        Allocates the slot arrays, keeping the contents of the existing slots.
+        """
+        old = getattr(self, "capacity", 0)
+        arrays = {
+            "points": np.zeros((capacity, self.history, 2), dtype=np.float32),
+            "head": np.zeros(capacity, dtype=np.int32),  # next position in the ring buffer
+            "first_frame": np.zeros(capacity, dtype=np.int64),
+            "last_frame": np.zeros(capacity, dtype=np.int64),
+            "frames": np.zeros(capacity, dtype=np.int64),
+            "path_length": np.zeros(capacity, dtype=np.float64),
+            "size_sum": np.zeros((capacity, 2), dtype=np.float64),
+            "last_xy": np.zeros((capacity, 2), dtype=np.float64),
+            "active": np.zeros(capacity, dtype=bool),
+        }
+        for name, array in arrays.items():
+            if old:
+                array[:old] = getattr(self, name)
+            setattr(self, name, array)
+        self.free.extend(range(capacity - 1, old - 1, -1))
+        self.capacity = capacity
+
+    def update(self, frame, yolo_ids, xywhn, track_ids):
+        """
+        Adds the tracked detections of a frame and evicts the tracks that expired.
+
+        Parameters:
+            frame (int): Frame number of the detections.
+            yolo_ids (np.ndarray): Class ID of every detection.
+            xywhn (np.ndarray): Normalised centre x, centre y, width and height of every detection.
+            track_ids (np.ndarray or None): Track ID of every detection, or None if the frame is not tracked.
+        """
+        if track_ids is not None:
+            for track_id, yolo_id, box in zip(track_ids.tolist(), yolo_ids.tolist(), xywhn):
+                slot = self.slots.get((track_id, yolo_id))
+                if slot is None:
+                    if not self.free:
+                        self._allocate(self.capacity * 2)
+                    slot = self.free.pop()
+                    self.slots[(track_id, yolo_id)] = slot
+                    self.active[slot] = True
+                    self.head[slot] = 0
+                    self.first_frame[slot] = frame
+                    self.frames[slot] = 0
+                    self.path_length[slot] = 0.0
+                    self.size_sum[slot] = 0.0
+                else:
+                    self.path_length[slot] += np.hypot(*(box[:2] - self.last_xy[slot]))
+                self.points[slot, self.head[slot] % self.history] = box[:2]
+                self.head[slot] += 1
+                self.last_xy[slot] = box[:2]
+                self.last_frame[slot] = frame
+                self.frames[slot] += 1
+                self.size_sum[slot] += box[2:4]
+
+        expired = np.flatnonzero(self.active & (self.last_frame < frame - self.ttl))
+        if len(expired):
+            self._evict(expired)
+
+    def _evict(self, slots):
+        """
+        Emits the summaries of the tracks in `slots` and releases the slots.
+        """
+        slot_keys = {slot: key for key, slot in self.slots.items()}
+        for slot in slots.tolist():
+            track_id, yolo_id = slot_keys[slot]
+            mean_size = self.size_sum[slot] / self.frames[slot]
+            self.summaries.append((track_id, yolo_id, int(self.first_frame[slot]), int(self.last_frame[slot]),
+                                   int(self.frames[slot]), float(self.path_length[slot]), float(mean_size[0]),
+                                   float(mean_size[1])))
+            del self.slots[(track_id, yolo_id)]
+            self.active[slot] = False
+            self.free.append(slot)
+        if len(self.summaries) >= FLUSH_ROWS:
+            self.flush()
+
+    def trail(self, track_id, yolo_id):
+        """
+        Returns the last centre points of a track, oldest first.
+
+        Parameters:
+            track_id (int): Track ID.
+            yolo_id (int): Class ID of the track.
+
+        Returns:
+            np.ndarray: Normalised centre points, shape (n, 2). Empty if the track is not in the store.
+        """
+        slot = self.slots.get((track_id, yolo_id))
+        if slot is None:
+            return np.empty((0, 2), dtype=np.float32)
+        head = int(self.head[slot])
+        if head <= self.history:
+            return self.points[slot, :head]
+        return np.roll(self.points[slot], -(head % self.history), axis=0)
+
+    def close(self):
+        """
+        Evicts all remaining tracks, so every track has a summary.
+        """
+        active = np.flatnonzero(self.active)
+        if len(active):
+            self._evict(active)
+
+    def flush(self):
+        """
+        Appends the queued summaries to the tracks CSV and empties the queue.
+
+        The CSV header is written only when the CSV is created, so a video without any track still yields a
+        header-only file.
+        """
+        exists = os.path.exists(self.output_csv) and os.path.getsize(self.output_csv) > 0
+        if not self.summaries and exists:
+            return
+        os.makedirs(os.path.dirname(self.output_csv) or ".", exist_ok=True)
+        pd.DataFrame(self.summaries, columns=TRACK_COLUMNS).to_csv(self.output_csv, index=False,
+                                                                   mode='a' if exists else 'w', header=not exists,
+                                                                   float_format="%g")
+        self.written += len(self.summaries)
+        self.summaries = []
+
+    def write(self):
+        """
+        Closes the store and appends the summaries of all remaining tracks to the tracks CSV.
+        """
+        self.close()
+        self.flush()
+        logger.debug(f"Wrote {self.written} track summaries to {self.output_csv}.")
@@ -0,0 +1,70 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import torch
+from ultralytics.trackers.basetrack import BaseTrack
+from ultralytics.trackers.track import TRACKER_MAP
+from ultralytics.utils import IterableSimpleNamespace, YAML
+from ultralytics.utils.checks import check_yaml
+import common
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+# Consts
+TRACKER_CONFIG = "bytetrack.yaml"
+TRACKER_FRAME_RATE = 30  # frame rate ultralytics assumes when it creates a tracker for model.track()
+
+
+class Tracker_session:
+    """
+    Tracker state belonging to a single video.
+
+    Ultralytics keeps its trackers on the predictor and numbers tracks with a counter shared by every tracker in the
+    process. A session owns its own tracker together with its own track ID counter, so several videos can be tracked
+    side by side on the results of one batched forward pass without their track IDs leaking into each other. Every
+    session numbers its tracks from 1, exactly as a fresh `model.track()` call would.
+    """
+
+    def __init__(self, frame_rate=TRACKER_FRAME_RATE, tracker_config=TRACKER_CONFIG):
+        """
+        Initialises a new tracker session.
+
+        Parameters:
+            frame_rate (float, optional): Frame rate of the tracked frames. Defaults to TRACKER_FRAME_RATE.
+            tracker_config (str, optional): Ultralytics tracker configuration. Defaults to TRACKER_CONFIG.
+        """
+        cfg = IterableSimpleNamespace(**YAML.load(check_yaml(tracker_config)))
+        self.tracker = TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=frame_rate)
+        self.track_count = 0
+
+    def reset(self):
+        """
+        Clears the tracker state and restarts the track IDs from 1.
+        """
+        self.tracker.reset()
+        self.track_count = 0
+
+    def update(self, result):
+        """
+        Updates the tracker with the detections of one frame, mirroring what `model.track()` does to its results.
+
+        Parameters:
+            result (ultralytics.engine.results.Results): Prediction result of the frame.
+
+        Returns:
+            Results: The result restricted to the tracked boxes, with their track IDs. If the tracker returns no
+                tracks the untracked detections are returned unchanged.
+        """
+        # Use this session's ID counter while the tracker creates new tracks
+        BaseTrack._count = self.track_count
+        try:
+            tracks = self.tracker.update(result.boxes.cpu().numpy(), result.orig_img)
+        finally:
+            self.track_count = BaseTrack._count
+
+        if len(tracks) == 0:
+            return result
+        result = result[tracks[:, -1].astype(int)]
+        result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return result
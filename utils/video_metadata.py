@@ -0,0 +1,218 @@
+# by Shadab Alam <md_shadab_alam@outlook.com>
+import json
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+import common
+from custom_logger import CustomLogger
+from logmod import logs
+
+logs(show_level=common.get_configs("logger_level"), show_color=True)
+logger = CustomLogger(__name__)  # use custom logger
+
+try:
+    import av
+except ImportError:  # PyAV is optional: without it the metadata is read with ffprobe
+    av = None
+
+# Consts
+# Names of the ffmpeg colour spaces (AVColorSpace), as ffprobe reports them; unspecified ones are left out
+COLOR_SPACES = {0: "gbr", 1: "bt709", 4: "fcc", 5: "bt470bg", 6: "smpte170m", 7: "smpte240m", 8: "ycgco",
+                9: "bt2020nc", 10: "bt2020c", 11: "smpte2085", 12: "chroma-derived-nc", 13: "chroma-derived-c",
+                14: "ictcp"}
+
+
+class Video_metadata:
+    """
+    Container metadata of videos: duration, size, codecs, resolution, frame rate and frame count.
+
+    The headers are read in-process with PyAV, which only parses the container and does not decode any frame;
+    ffprobe is run instead when PyAV is not installed or cannot open a file. Both return the same fields. The
+    metadata of every file is memoised on its path, size and modification time, so callers can ask for it freely.
+    """
+
+    cache = {}
+    lock = threading.Lock()
+
+    @staticmethod
+    def probe(video_path):
+        """
+        Reads the metadata of a video.
+
+        Parameters:
+            video_path (str): Path to the video.
+
+        Returns:
+            dict: file, duration (s), size_MB, bitrate_kbps, container and frame_count; video_codec, width, height,
+                resolution, fps, aspect_ratio, color_space, color_depth and chroma_subsampling if there is a video
+                stream; audio_codec, audio_channels, audio_sample_rate and audio_language if there is an audio
+                stream.
+        """
+        stat = os.stat(video_path)
+        key = os.path.abspath(video_path)
+        with Video_metadata.lock:
+            entry = Video_metadata.cache.get(key)
+        if entry is not None and entry[0] == (stat.st_size, stat.st_mtime_ns):
+            return dict(entry[1])
+
+        data = None
+        if av is not None:
+            try:
+                data = Video_metadata.read_headers(video_path)
+            except Exception as e:
+                logger.debug(f"Could not read the headers of {video_path} with PyAV, using ffprobe: {e}.")
+        if data is None:
+            data = Video_metadata.ffprobe(video_path)
+
+        with Video_metadata.lock:
+            Video_metadata.cache[key] = ((stat.st_size, stat.st_mtime_ns), data)
+        return dict(data)
+
+    @staticmethod
+    def probe_many(video_paths, workers=None):
+        """
+        Reads the metadata of several videos concurrently.
+
+        Parameters:
+            video_paths (list[str]): Paths to the videos.
+            workers (int, optional): Number of threads. Defaults to one per core.
+
+        Returns:
+            dict: Metadata of every video as returned by `probe`, keyed by its path; None for the videos that
+                could not be read.
+        """
+        def safe_probe(video_path):
+            try:
+                return Video_metadata.probe(video_path)
+            except Exception as e:
+                logger.warning(f"Could not read the metadata of {video_path}: {e}.")
+                return None
+
+        video_paths = list(video_paths)
+        workers = min(workers or os.cpu_count() or 1, max(len(video_paths), 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(video_paths, executor.map(safe_probe, video_paths)))
+
+    @staticmethod
+    def timing(video_path):
+        """
+        Returns the frame rate and number of frames of a video, or None if they cannot be read.
+        """
+        try:
+            data = Video_metadata.probe(video_path)
+        except Exception as e:
+            logger.debug(f"Could not read the metadata of {video_path}: {e}.")
+            return None
+        if not data.get("fps"):
+            return None
+        return data["fps"], data["frame_count"]
+
+    @staticmethod
+    def read_headers(video_path):
+        """
+        Reads the metadata of a video from its container headers with PyAV.
+        """
+        with av.open(video_path, metadata_errors="ignore") as container:  # type: ignore
+            duration = container.duration / av.time_base if container.duration else 0.0  # type: ignore
+            data = Video_metadata.format_fields(video_path, duration, container.bit_rate, container.format.name)
+            video_stream = container.streams.video[0] if container.streams.video else None
+            audio_stream = container.streams.audio[0] if container.streams.audio else None
+
+            if video_stream is not None:
+                codec = video_stream.codec_context
+                sample_aspect_ratio = video_stream.sample_aspect_ratio
+                display_aspect_ratio = video_stream.display_aspect_ratio
+                fps = float(video_stream.base_rate) if video_stream.base_rate else ''
+                try:
+                    depth = av.VideoFormat(codec.pix_fmt).components[0].bits if codec.pix_fmt else 0  # type: ignore
+                except ValueError:
+                    depth = 0
+                data.update({
+                    'video_codec': codec.name,
+                    'width': codec.width,
+                    'height': codec.height,
+                    'resolution': f"{codec.width}x{codec.height}",
+                    'fps': fps,
+                    'aspect_ratio': (f"{display_aspect_ratio.numerator}:{display_aspect_ratio.denominator}"
+                                     if sample_aspect_ratio and display_aspect_ratio else ''),
+                    'color_space': COLOR_SPACES.get(int(codec.colorspace), ''),
+                    'color_depth': f"{depth} bit" if depth else '',
+                    'chroma_subsampling': '',  # not reported by ffprobe either
+                })
+                data['frame_count'] = video_stream.frames or (int(round(duration * fps)) if fps else 0)
+            if audio_stream is not None:
+                codec = audio_stream.codec_context
+                data.update({
+                    'audio_codec': codec.name,
+                    'audio_channels': codec.channels,
+                    'audio_sample_rate': str(codec.sample_rate),
+                    'audio_language': audio_stream.metadata.get('language', ''),
+                })
+        return data
+
+    @staticmethod
+    def ffprobe(video_path):
+        """
+        Reads the metadata of a video with an ffprobe subprocess.
+        """
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-show_entries', 'format:stream',
+            '-of', 'json',
+            video_path
+        ]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        info = json.loads(result.stdout)
+
+        format_info = info.get('format', {})
+        streams = info.get('streams', [])
+
+        video_stream = next((s for s in streams if s['codec_type'] == 'video'), None)
+        audio_stream = next((s for s in streams if s['codec_type'] == 'audio'), None)
+
+        duration = float(format_info.get('duration', 0))
+        data = Video_metadata.format_fields(video_path, duration, int(format_info.get('bit_rate', 0) or 0),
+                                            format_info.get('format_name', ''), int(format_info.get('size', 0)))
+        if video_stream:
+            # The frame rate is a fraction such as '30000/1001'
+            fps = float(Fraction(video_stream['r_frame_rate'])) if 'r_frame_rate' in video_stream else ''
+            data.update({
+                'video_codec': video_stream.get('codec_name', ''),
+                'width': video_stream.get('width', ''),
+                'height': video_stream.get('height', ''),
+                'resolution': f"{video_stream.get('width', '')}x{video_stream.get('height', '')}",
+                'fps': fps,
+                'aspect_ratio': video_stream.get('display_aspect_ratio', ''),
+                'color_space': video_stream.get('color_space', ''),
+                'color_depth': f"{video_stream.get('bits_per_raw_sample', '')} bit" if video_stream.get('bits_per_raw_sample') else '',  # noqa:E501
+                'chroma_subsampling': video_stream.get('chroma_subsampling', ''),
+            })
+            nb_frames = int(video_stream.get('nb_frames', 0) or 0)
+            data['frame_count'] = nb_frames or (int(round(duration * fps)) if fps else 0)
+        if audio_stream:
+            data.update({
+                'audio_codec': audio_stream.get('codec_name', ''),
+                'audio_channels': audio_stream.get('channels', ''),
+                'audio_sample_rate': audio_stream.get('sample_rate', ''),
+                'audio_language': audio_stream.get('tags', {}).get('language', ''),
+            })
+        return data
+
+    @staticmethod
+    def format_fields(video_path, duration, bit_rate, container, size=None):
+        """
+        Returns the fields of the container, shared by both readers.
+        """
+        if size is None:
+            size = os.path.getsize(video_path)
+        return {
+            'file': os.path.basename(video_path),
+            'duration': float(duration),
+            'size_MB': round(size / (1024 * 1024), 2),
+            'bitrate_kbps': round(bit_rate / 1000, 2) if bit_rate else None,
+            'container': container,
+            'frame_count': 0,
+        }
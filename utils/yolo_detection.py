@@ -1,15 +1,20 @@
 # by Shadab Alam <md_shadab_alam@outlook.com>
-from ultralytics import YOLO
 import os
 import common
 from custom_logger import CustomLogger
 from logmod import logs
 from tqdm import tqdm
 import cv2
-from collections import defaultdict
-import shutil
 import numpy as np
-import pandas as pd
+from utils.checkpoint import Video_checkpoint
+from utils.detection_buffer import Detection_buffer
+from utils.frame_source import Frame_prefetcher
+from utils.frame_tap import Frame_consumer, Frame_tap, Frame_statistics, Snapshot_writer, FRAME_STATS_DIR
+from utils.frames_extractor import VideoFrameExtractor
+from utils.model_cache import load_model
+from utils.track_store import Track_store, TRACKS_DIR
+from utils.tracker_session import Tracker_session, TRACKER_FRAME_RATE
+from utils.video_metadata import Video_metadata
 
 logs(show_level=common.get_configs("logger_level"), show_color=True)
 logger = CustomLogger(__name__)  # use custom logger
@@ -20,6 +25,16 @@ save_annoted_img = common.get_configs("save_annoted_img")
 save_tracked_img = common.get_configs("save_tracked_img")
 delete_labels = common.get_configs("delete_labels")
 delete_frames = common.get_configs("delete_frames")
+prefetch_queue_depth = common.get_configs("prefetch_queue_depth")
+frame_stride = common.get_configs("frame_stride")
+analysis_fps = common.get_configs("analysis_fps")
+model_backend = common.get_configs("model_backend")
+model_imgsz = common.get_configs("model_imgsz")
+checkpoint_interval = common.get_configs("checkpoint_interval")
+output_format = common.get_configs("output_format")
+track_ttl_frames = common.get_configs("track_ttl_frames")
+frame_stats = common.get_configs("frame_stats")
+snaps_folder = common.get_configs("snaps")
 
 # Consts
 LINE_TICKNESS = 1
@@ -38,10 +53,12 @@ class YOLO_detection:
 
         Instance Variables:
             self.model (str): The model configuration loaded from common.get_configs("model").
+            self.yolo (YOLO): The loaded model, created on first use and reused for every video.
             self.resolution (str): The video resolution. Initialised as None and set later when needed.
             self.video_title (str): The title of the video.
         """
         self.model = common.get_configs("model")
+        self.yolo = None
         self.resolution = None
         self.video_title = video_title
 
@@ -54,193 +71,482 @@ class YOLO_detection:
         """
         self.video_title = title
 
-    def tracking_mode(self, input_video_path, video_fps=25):
+    def get_model(self):
+        """
+        Returns the YOLO model, loading it on the first call.
+
+        The model is loaded once per instance (and so once per worker process) with the backend set in
+        `model_backend`, warmed up on a dummy frame and then reused for every video.
+
+        Returns:
+            YOLO: The loaded model.
+        """
+        if self.yolo is None:
+            self.yolo = load_model(self.model, backend=model_backend, imgsz=model_imgsz)
+        return self.yolo
+
+    @staticmethod
+    def open_video(input_video_path, video_title, output_path, with_frame_stats=False):
+        """
+        Prepares the frame reader, tracker session and detection buffer of a video, resuming from its checkpoint
+        when checkpoints are enabled.
+
+        Parameters:
+            input_video_path (str): Path to the input video.
+            video_title (str): Title of the video.
+            output_path (str): Destination of the CSV or Parquet output of the video.
+            with_frame_stats (bool, optional): Also prepare the per-frame statistics of the video, checkpointed
+                with the detections. Defaults to False.
+
+        Returns:
+            dict: The state of the video: title, cap, session, tracks, detections, frame_stats (None if not
+                prepared), checkpoint (None if disabled), stride, output_path, tracks_path and frame_stats_path.
+        """
+        stride = YOLO_detection.analysis_stride(input_video_path)
+        output_dir, output_file = os.path.split(output_path)
+        name = os.path.splitext(output_file)[0]
+        tracks_path = os.path.join(output_dir, TRACKS_DIR, f"{name}.csv")
+        frame_stats_path = os.path.join(output_dir, FRAME_STATS_DIR, f"{name}.csv") if with_frame_stats else None
+        checkpoint = None
+        start_frame, session, track_count, tracks = 0, None, 0, None
+        if checkpoint_interval > 0:
+            checkpoint = Video_checkpoint(video_title, input_video_path, stride, output_format=output_format,
+                                          frame_stats=with_frame_stats)
+            start_frame, session, track_count, tracks = checkpoint.resume()
+
+        if session is None:
+            # Fresh tracker for this video, slowed down to the rate of the analysed frames. The model is shared
+            # between videos but no track state is carried over from the previous one. After a resume with a reset
+            # tracker the track IDs continue after the ones already written
+            session = Tracker_session(frame_rate=TRACKER_FRAME_RATE / stride)
+            session.track_count = track_count
+        if tracks is None:
+            # The tracker forgets lost tracks after a number of analysed frames, so the TTL scales with the stride
+            tracks = Track_store(ttl=track_ttl_frames * stride,
+                                 output_csv=checkpoint.tracks_path if checkpoint is not None else tracks_path)
+
+        return {
+            "title": video_title,
+            # Decode the analysed frames ahead of inference on a background thread
+            "cap": Frame_prefetcher(input_video_path, queue_depth=prefetch_queue_depth, stride=stride,
+                                    start_frame=start_frame),
+            "session": session,
+            # Trails and summaries of the tracks, written to `tracks/<video_title>.csv` next to the output
+            "tracks": tracks,
+            # Detections are collected in memory and appended to the CSV in large batches
+            "detections": (checkpoint.detection_buffer() if checkpoint is not None
+                           else Detection_buffer(output_path)),
+            # Image statistics of every frame, written to `frame_stats/<video_title>.csv` next to the output
+            "frame_stats": (Frame_statistics(checkpoint.frame_stats_path if checkpoint is not None
+                                             else frame_stats_path, append=start_frame > 0)
+                            if with_frame_stats else None),
+            "checkpoint": checkpoint,
+            "stride": stride,
+            "output_path": output_path,
+            "tracks_path": tracks_path,
+            "frame_stats_path": frame_stats_path,
+        }
+
+    @staticmethod
+    def commit_frame(video, yolo_ids, xywhn, ids):
+        """
+        Stores the detections of the current frame of a video and takes a checkpoint every `checkpoint_interval`
+        analysed frames.
+
+        Parameters:
+            video (dict): State of the video, as returned by `open_video`.
+            yolo_ids (np.ndarray): Class ID of every detection.
+            xywhn (np.ndarray): Normalised centre x, centre y, width and height of every detection.
+            ids (np.ndarray or None): Track ID of every detection, or None if the frame is not tracked.
+        """
+        cap = video["cap"]
+        video["detections"].append(yolo_ids, xywhn, ids, cap.frame_index)
+        video["tracks"].update(cap.frame_index, yolo_ids, xywhn, ids)
+        if video["checkpoint"] is not None and cap.frames_read % checkpoint_interval == 0:
+            video["checkpoint"].save(cap.frame_index, video["session"], video["detections"], video["tracks"],
+                                     video["frame_stats"])
+
+    @staticmethod
+    def close_video(video):
+        """
+        Releases the video, writes the remaining detections to its output, its tracks table and its frame
+        statistics.
+
+        Parameters:
+            video (dict): State of the video, as returned by `open_video`.
+        """
+        video["cap"].release()
+        video["cap"].log_stats()
+        video["detections"].close()
+        video["tracks"].write()
+        if video["frame_stats"] is not None:
+            video["frame_stats"].flush()
+        if video["checkpoint"] is not None:
+            video["checkpoint"].finish(video["output_path"], video["tracks_path"], video["frame_stats_path"])
+
+    @staticmethod
+    def abort_video(video):
+        """
+        Releases a video whose run failed: stops its decoder and closes its open writers, but does not write its
+        remaining detections, tracks table or statistics, nor finish its checkpoint.
+
+        Parameters:
+            video (dict): State of the video, as returned by `open_video`.
+        """
+        video["cap"].release()
+        video["detections"].release()
+        logger.warning(f"Released {video['title']} after a failure, its output is incomplete.")
+
+    def tracking_mode(self, input_video_path, video_fps=25, output_dir=None):
         """
         Performs object tracking on a video using YOLO and saves tracking results.
 
         Parameters:
             input_video_path (str): Path to the input video.
-            output_video_path (str): Path to save the final output video.
             video_fps (int, optional): Frames per second for the output video (default is 25).
+            output_dir (str, optional): Scratch directory for the CSV, frames and labels of this video. Separate
+                processes must use separate directories. Defaults to `runs/detect`.
+
+        Only every k-th frame is analysed when `frame_stride` or `analysis_fps` is set; the skipped frames are
+        dropped at the decoder and the tracker's frame rate is lowered to match, so lost tracks are kept for the same
+        stretch of video as at full rate. `Frame Count` always refers to the position of the frame in the video.
+
+        With `checkpoint_interval` set, the detections are committed every so many analysed frames and an
+        interrupted run continues after the last committed frame instead of starting over.
 
-        This function processes each frame:
+        The video is decoded once by a `Frame_tap`, which feeds every analysed frame to the registered consumers:
+        detection and tracking, the annotated-frame writers, the first-frame snapshot in `snaps` (when it is
+        missing or older than the video) and, with `frame_stats`, the per-frame image statistics written to
+        `frame_stats/<video_title>.csv` next to the output. New per-frame analyses register on the same tap.
+
+        This function processes each analysed frame:
             - Runs YOLO tracking.
             - Saves annotated frames and tracking data.
             - Optionally displays the annotated video.
-            - Appends tracking labels to a CSV file.
+            - Renders, encodes and displays frames only when `save_annoted_img`, `save_tracked_img`,
+              `display_frame_tracking` or `delete_frames` asks for them; otherwise the run is headless.
+            - Buffers the tracked boxes in memory and appends them to a CSV or Parquet file (`output_format`) in
+              batches.
         """
-        model = YOLO(self.model)
-        cap = cv2.VideoCapture(input_video_path)
+        model = self.get_model()
 
-        # Store the track history
-        track_history = defaultdict(lambda: [])
+        # Rendering happens only when something consumes the rendered frames: the annotated frame is needed for
+        # saving it, and the annotated frame with the track lines for the display window and the tracked frames
+        draw_tracks = display_frame_tracking or save_tracked_img
+        annotate = save_annoted_img or draw_tracks
 
         # Output paths for frames, txt files, and final video
-        frames_output_path = os.path.join("runs", "detect", "frames")
-        annotated_frame_output_path = os.path.join("runs", "detect", "annotated_frames")
-        tracked_frame_output_path = os.path.join("runs", "detect", "tracked_frame")
-        txt_output_path = os.path.join("runs", "detect", "labels")
-        text_filename = os.path.join("runs", "detect", "track", "labels", "image0.txt")
-        display_video_output_path = os.path.join("runs", "detect", "display_video.mp4")
-
-        # Create directories if they don't exist
-        os.makedirs(frames_output_path, exist_ok=True)
-        os.makedirs(txt_output_path, exist_ok=True)
-        os.makedirs(annotated_frame_output_path, exist_ok=True)
-        os.makedirs(tracked_frame_output_path, exist_ok=True)
+        if output_dir is None:
+            output_dir = os.path.join("runs", "detect")
+        frames_output_path = os.path.join(output_dir, "frames")
+        annotated_frame_output_path = os.path.join(output_dir, "annotated_frames")
+        tracked_frame_output_path = os.path.join(output_dir, "tracked_frame")
+        txt_output_path = os.path.join(output_dir, "labels")
+        output_path = os.path.join(output_dir, f"{self.video_title}.{output_format}")
+        display_video_output_path = os.path.join(output_dir, "display_video.mp4")
+
+        # Create the directories that will be written to
+        os.makedirs(output_dir, exist_ok=True)
+        for path, used in ((frames_output_path, delete_frames is False),
+                           (txt_output_path, delete_labels is False),
+                           (annotated_frame_output_path, save_annoted_img),
+                           (tracked_frame_output_path, save_tracked_img)):
+            if used:
+                os.makedirs(path, exist_ok=True)
+
+        # Open the video, continuing from its checkpoint if there is one
+        video = YOLO_detection.open_video(input_video_path, self.video_title, output_path,
+                                          with_frame_stats=frame_stats)
+        cap = video["cap"]
 
         # Initialise a VideoWriter for the final video
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # type: ignore
 
+        display_video_writer = None
         if display_frame_tracking:
             display_video_writer = cv2.VideoWriter(display_video_output_path,
                                                    fourcc, video_fps, (int(cap.get(3)), int(cap.get(4))))
 
-        # Open video and get total frames
-        cap = cv2.VideoCapture(input_video_path)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        # Get total frames from the container headers
+        timing = Video_metadata.timing(input_video_path)
+        total_frames = timing[1] if timing else 0
 
         if total_frames == 0:
             logger.warning("Warning: Could not determine total frames. Progress bar may not work correctly.")
             total_frames = None  # Prevent tqdm from setting a fixed length
 
         # Setup progress bar
-        progress_bar = tqdm(total=total_frames, unit="frames", dynamic_ncols=True)
-
-        # Loop through the video frames
-        frame_count = 0  # Variable to track the frame number
-        while cap.isOpened():
-            # Read a frame from the video
-            success, frame = cap.read()
-
-            if success:
-
-                frame_count += 1  # Increment frame count
-
-                # Run YOLO tracking on the frame, persisting tracks between frames
-                results = model.track(frame,
-                                      tracker='bytetrack.yaml',
-                                      persist=True,
-                                      conf=confidence,
-                                      save=True,
-                                      save_txt=True,
-                                      line_width=LINE_TICKNESS,
-                                      show_labels=SHOW_LABELS,
-                                      show_conf=SHOW_CONF,
-                                      show=RENDER,
-                                      verbose=False)
-
-                # Update progress bar
-                progress_bar.update(1)
-
-                # Get the boxes and track IDs
-                boxes = results[0].boxes.xywh.cpu()  # type: ignore
-                if boxes.size(0) == 0:
-                    with open(text_filename, 'w') as file:   # noqa: F841
-                        pass
-
-                try:
-                    track_ids = results[0].boxes.id.int().cpu().tolist()  # type: ignore
-
-                    # Visualise the results on the frame
-                    annotated_frame = results[0].plot()
-
-                # Save annotated frame to file
-                    if save_annoted_img:
-                        frame_filename = os.path.join(annotated_frame_output_path, f"frame_{frame_count}.jpg")
-                        cv2.imwrite(frame_filename, annotated_frame)
-
-                except Exception:
-                    pass
-
-                # Save txt file with bounding box information
-                with open(text_filename, 'r') as text_file:
-                    data = text_file.read()
-                new_txt_file_name = os.path.join("runs", "detect", "labels", f"label_{frame_count}.txt")
-                with open(new_txt_file_name, 'w') as new_file:
-                    new_file.write(data)
-
-                labels_path = os.path.join("runs", "detect", "labels")
-                output_csv_path = os.path.join("runs", "detect", f"{self.video_title}.csv")
-
-                YOLO_detection.merge_txt_to_csv_dynamically(labels_path, output_csv_path, frame_count)
-
-                os.remove(text_filename)
-                if delete_labels is True:
-                    os.remove(os.path.join("runs", "detect", "labels", f"label_{frame_count}.txt"))
-
-                # save the labelled image
-                if delete_frames is False:
-                    image_filename = os.path.join("runs", "detect", "track", "image0.jpg")
-                    new_img_file_name = os.path.join("runs", "detect", "frames", f"frame_{frame_count}.jpg")
-                    shutil.move(image_filename, new_img_file_name)
-
-                # Plot the tracks
-                try:
-                    for box, track_id in zip(boxes, track_ids):
-                        x, y, w, h = box
-                        track = track_history[track_id]
-                        track.append((float(x), float(y)))  # x, y center point
-                        if len(track) > 30:  # retain 90 tracks for 90 frames
-                            track.pop(0)
-
-                        # Draw the tracking lines
-                        points = np.hstack(track).astype(np.int32).reshape((-1, 1, 2))
-                        cv2.polylines(annotated_frame, [points], isClosed=False, color=(230, 230, 230),
-                                      thickness=LINE_TICKNESS*5)
-
-                except Exception:
-                    pass
-
-                # Display the annotated frame
-                if display_frame_tracking:
-                    cv2.imshow("YOLOv11 Tracking", annotated_frame)
-                    display_video_writer.write(annotated_frame)
-
-                # Save the annotated frame here
-                if save_tracked_img:
-                    frame_filename = os.path.join(tracked_frame_output_path, f"frame_tracked_{frame_count}.jpg")
-                    cv2.imwrite(frame_filename, annotated_frame)
-
-                # Break the loop if 'q' is pressed
-                if cv2.waitKey(1) & 0xFF == ord("q"):
-                    break
-            else:
-                break
-
-        # Release the video capture object and close the display window
-        cap.release()
-        cv2.destroyAllWindows()
-        progress_bar.close()
+        progress_bar = tqdm(total=total_frames, initial=cap.frame_index, unit="frames", dynamic_ncols=True)
+
+        # Every consumer of the frames is fed from the same decode of the video
+        tap = Frame_tap(cap)
+        if video["frame_stats"] is not None:
+            # Registered before the detector, so the statistics of a frame are in the buffer when the detector
+            # takes a checkpoint at that frame
+            tap.register(video["frame_stats"])
+        tap.register(Detector_consumer(model, video, progress_bar,
+                                       txt_output_path if delete_labels is False else None,
+                                       frames_output_path if delete_frames is False else None))
+        if annotate:
+            tap.register(Annotated_writer(video,
+                                          annotated_frame_output_path if save_annoted_img else None,
+                                          tracked_frame_output_path if save_tracked_img else None,
+                                          display_video_writer))
+
+        # The first-frame snapshot comes from this decode, so the frame extractor does not open the video again
+        if snaps_folder and cap.frame_index == 0:
+            snap_path = os.path.join(snaps_folder, f"{self.video_title}.png")
+            if not VideoFrameExtractor.is_up_to_date(input_video_path, snap_path):
+                tap.register(Snapshot_writer(snap_path))
+
+        # Loop through the video frames, then release the video and write the remaining detections and the tracks
+        # table. The display writer is released even if a consumer fails
+        try:
+            tap.run()
+        finally:
+            if display_video_writer is not None:
+                display_video_writer.release()
+
+    def batch_tracking_mode(self, input_video_paths, video_titles, batch_size, output_dir=None):
+        """
+        Performs object tracking on several videos at once, advancing them in lockstep.
+
+        Every step reads one frame from each active video and runs the frames through YOLO as a single batch. Each
+        video has its own tracker session, so track IDs never leak between videos, and its own detection buffer
+        writing `<output_dir>/<video_title>.<output_format>` with the same schema as `tracking_mode`. When a video
+        ends its slot is given to the next pending video, keeping the batch full until the queue runs dry.
+
+        Frames of different resolutions are letterboxed to a common square input when batched together; videos of
+        the same resolution get the same preprocessing as in `tracking_mode`. Annotated frames, tracked frames and
+        the display window are not produced in this mode. Checkpoints are taken per video, as in `tracking_mode`.
+
+        Parameters:
+            input_video_paths (list[str]): Paths to the input videos.
+            video_titles (list[str]): Title of every video, used to name its CSV.
+            batch_size (int): Number of videos processed side by side.
+            output_dir (str, optional): Scratch directory for the CSVs. Defaults to `runs/detect`.
+        """
+        if display_frame_tracking or save_annoted_img or save_tracked_img:
+            logger.warning("Frame display and annotated or tracked frame saving are not available in batch mode.")
+
+        model = self.get_model()
+        if output_dir is None:
+            output_dir = os.path.join("runs", "detect")
+        os.makedirs(output_dir, exist_ok=True)
+
+        pending = list(zip(input_video_paths, video_titles))
+        total_frames = 0
+        for metadata in Video_metadata.probe_many(path for path, _ in pending).values():
+            total_frames += metadata["frame_count"] if metadata else 0
+
+        # Setup progress bar
+        progress_bar = tqdm(total=total_frames or None, unit="frames", dynamic_ncols=True)
+
+        videos = []  # videos currently being processed, one per slot in the batch
+        try:
+            while pending or videos:
+                # Fill the free slots with the next pending videos
+                while pending and len(videos) < batch_size:
+                    input_video_path, video_title = pending.pop(0)
+                    logger.info(f"Tracking objects in {video_title}.")
+                    video = YOLO_detection.open_video(input_video_path, video_title,
+                                                      os.path.join(output_dir, f"{video_title}.{output_format}"))
+                    progress_bar.update(video["cap"].frame_index)
+                    videos.append(video)
+
+                # Read one frame from every video, retiring the videos that have ended. A video leaves its slot
+                # once its outputs are written
+                frames = []
+                for video in list(videos):
+                    success, frame = video["cap"].read()
+                    if success:
+                        frames.append(frame)
+                    else:
+                        YOLO_detection.close_video(video)
+                        videos.remove(video)
+                if not frames:
+                    continue
+
+                # Run YOLO on all frames in one forward pass and track each video separately
+                results = model.predict(frames,
+                                        conf=confidence,
+                                        imgsz=model_imgsz,
+                                        line_width=LINE_TICKNESS,
+                                        show_labels=SHOW_LABELS,
+                                        show_conf=SHOW_CONF,
+                                        show=RENDER,
+                                        verbose=False)
+
+                for video, result in zip(videos, results):
+                    result = video["session"].update(result)
+                    yolo_ids, xywhn, ids = YOLO_detection.boxes_to_arrays(result)
+                    YOLO_detection.commit_frame(video, yolo_ids, xywhn, ids)
+
+                progress_bar.update(sum(video["stride"] for video in videos))
+        finally:
+            # After a failure the videos still in a slot are released without completing their outputs, so their
+            # decoder threads and files are closed and checkpointed videos resume from their last checkpoint
+            for video in videos:
+                YOLO_detection.abort_video(video)
+            progress_bar.close()
+
+    @staticmethod
+    def analysis_stride(input_video_path):
+        """
+        Determines how many decoded frames make up one analysed frame.
+
+        If `analysis_fps` is set the stride is the video frame rate divided by it (rounded, at least 1); otherwise
+        it is `frame_stride`.
+
+        Parameters:
+            input_video_path (str): Path to the input video.
+
+        Returns:
+            int: The frame stride, 1 to analyse every frame.
+        """
+        if analysis_fps:
+            timing = Video_metadata.timing(input_video_path)
+            if timing and timing[0] > 0:
+                return max(1, int(round(timing[0] / analysis_fps)))
+            logger.warning(f"Could not determine the frame rate of {input_video_path}, using frame_stride.")
+        return max(1, int(frame_stride))
 
     @staticmethod
-    def merge_txt_to_csv_dynamically(txt_location, output_csv, frame_count):
+    def boxes_to_arrays(result):
+        """
+        Extracts the detections of a YOLO result as numpy arrays.
+
+        Parameters:
+            result (ultralytics.engine.results.Results): Tracking result of one frame.
+
+        Returns:
+            tuple: Class IDs, normalised xywh boxes and track IDs (None if the frame is not tracked).
         """
-        Merges YOLO-format label data from a .txt file into a CSV, frame by frame.
+        yolo_ids = result.boxes.cls.int().cpu().numpy()  # type: ignore
+        xywhn = result.boxes.xywhn.cpu().numpy()  # type: ignore
+        ids = result.boxes.id  # type: ignore
+        ids = ids.int().cpu().numpy() if ids is not None else None
+        return yolo_ids, xywhn, ids
 
+
+class Detector_consumer(Frame_consumer):
+    """
+    Runs YOLO and the tracker on every frame of a `Frame_tap`, and stores the detections and tracks of the video.
+
+    The tracking result and detections of the frame are put in the shared state as `result`, `yolo_ids`, `xywhn`
+    and `ids`, for the consumers registered after it.
+    """
+
+    def __init__(self, model, video, progress_bar, txt_output_path=None, frames_output_path=None):
+        """
         Parameters:
-            txt_location (str): Directory containing label .txt files.
-            output_csv (str): Path to the CSV file to update.
-            frame_count (int): Frame number being processed (used for naming).
-        """
-        # Define the path for the new text file
-        new_txt_file_name = os.path.join(txt_location, f"label_{frame_count}.txt")
-
-        # Read data from the new text file
-        with open(new_txt_file_name, 'r') as text_file:
-            data = text_file.read()
-
-        # Save the data into the new text file
-        with open(new_txt_file_name, 'w') as new_file:
-            new_file.write(data)
-
-        # Read the newly created text file into a DataFrame
-        df = pd.read_csv(new_txt_file_name, delimiter=" ", header=None,
-                         names=["YOLO_id", "X-center", "Y-center", "Width", "Height", "Unique Id"])
-        df['Frame Count'] = frame_count
-
-        # Append the DataFrame to the CSV file
-        if not os.path.exists(output_csv):
-            df.to_csv(output_csv, index=False, mode='w')  # If the CSV does not exist, create it
-        else:
-            df.to_csv(output_csv, index=False, mode='a', header=False)  # If it exists, append without header
+            model (YOLO): The loaded model.
+            video (dict): State of the video, as returned by `YOLO_detection.open_video`.
+            progress_bar (tqdm): Progress bar, advanced by the stride on every frame.
+            txt_output_path (str, optional): Directory of the YOLO label files. None does not write them.
+            frames_output_path (str, optional): Directory of the labelled frames. None does not save them.
+        """
+        self.model = model
+        self.video = video
+        self.progress_bar = progress_bar
+        self.txt_output_path = txt_output_path
+        self.frames_output_path = frames_output_path
+
+    def on_frame(self, frame_index, frame, state):
+        # Run YOLO on the frame and track the detections, persisting tracks between frames
+        results = self.model.predict(frame,
+                                     conf=confidence,
+                                     imgsz=model_imgsz,
+                                     show=RENDER,
+                                     verbose=False)
+        results[0] = self.video["session"].update(results[0])
+
+        # Update progress bar
+        self.progress_bar.update(self.video["stride"])
+
+        # Get the boxes and track IDs
+        yolo_ids, xywhn, ids = YOLO_detection.boxes_to_arrays(results[0])
+
+        # Store the bounding box information and update the tracks of this frame
+        YOLO_detection.commit_frame(self.video, yolo_ids, xywhn, ids)
+        if self.txt_output_path is not None:
+            Detection_buffer.write_label_file(os.path.join(self.txt_output_path, f"label_{frame_index}.txt"),
+                                              yolo_ids, xywhn, ids)
+
+        # save the labelled image
+        if self.frames_output_path is not None:
+            new_img_file_name = os.path.join(self.frames_output_path, f"frame_{frame_index}.jpg")
+            cv2.imwrite(new_img_file_name, results[0].plot(line_width=LINE_TICKNESS,
+                                                           labels=SHOW_LABELS,
+                                                           conf=SHOW_CONF))
+
+        state.update(result=results[0], yolo_ids=yolo_ids, xywhn=xywhn, ids=ids)
+
+    def close(self):
+        # Release the video capture object and write the remaining detections and the tracks table
+        YOLO_detection.close_video(self.video)
+        self.progress_bar.close()
+
+
+class Annotated_writer(Frame_consumer):
+    """
+    Renders the tracking result of every frame, with the trails of the tracks, and saves or displays it. Needs a
+    `Detector_consumer` registered before it.
+    """
+
+    def __init__(self, video, annotated_frame_output_path=None, tracked_frame_output_path=None,
+                 display_video_writer=None):
+        """
+        Parameters:
+            video (dict): State of the video, as returned by `YOLO_detection.open_video`.
+            annotated_frame_output_path (str, optional): Directory of the annotated frames. None does not save them.
+            tracked_frame_output_path (str, optional): Directory of the annotated frames with the track trails.
+                None does not save them.
+            display_video_writer (cv2.VideoWriter, optional): Writer of the displayed video. None does not display
+                the frames.
+        """
+        self.video = video
+        self.annotated_frame_output_path = annotated_frame_output_path
+        self.tracked_frame_output_path = tracked_frame_output_path
+        self.display_video_writer = display_video_writer
+
+    def on_frame(self, frame_index, frame, state):
+        ids, yolo_ids = state["ids"], state["yolo_ids"]
+
+        # Visualise the results on the frame
+        annotated_frame = state["result"].plot()
+
+        # Save annotated frame to file
+        if self.annotated_frame_output_path is not None and ids is not None:
+            frame_filename = os.path.join(self.annotated_frame_output_path, f"frame_{frame_index}.jpg")
+            cv2.imwrite(frame_filename, annotated_frame)
+
+        # Plot the tracks
+        if (self.display_video_writer is not None or self.tracked_frame_output_path is not None) and ids is not None:
+            frame_size = np.array(frame.shape[1::-1], dtype=np.float32)  # width, height
+            for track_id, yolo_id in zip(ids.tolist(), yolo_ids.tolist()):
+                # Draw the tracking lines through the last centre points kept by the track store
+                trail = self.video["tracks"].trail(track_id, yolo_id) * frame_size
+                points = trail.astype(np.int32).reshape((-1, 1, 2))
+                cv2.polylines(annotated_frame, [points], isClosed=False, color=(230, 230, 230),
+                              thickness=LINE_TICKNESS*5)
+
+        # Save the annotated frame here
+        if self.tracked_frame_output_path is not None:
+            frame_filename = os.path.join(self.tracked_frame_output_path, f"frame_tracked_{frame_index}.jpg")
+            cv2.imwrite(frame_filename, annotated_frame)
+
+        # Display the annotated frame
+        if self.display_video_writer is not None:
+            cv2.imshow("YOLOv11 Tracking", annotated_frame)
+            self.display_video_writer.write(annotated_frame)
+
+            # Stop the tap if 'q' is pressed
+            if cv2.waitKey(1) & 0xFF == ord("q"):
+                return False
+
+    def close(self):
+        # Close the display window
+        if self.display_video_writer is not None:
+            self.display_video_writer.release()
+            cv2.destroyAllWindows()